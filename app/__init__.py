@@ -1,5 +1,6 @@
 from flask import Flask
 import os
+import multiprocessing
 
 # Import the configuration class from the root config.py file
 from config import Config
@@ -34,4 +35,44 @@ def create_app(config_class=Config):
     # from .api import api as api_blueprint
     # app.register_blueprint(api_blueprint, url_prefix='/api')
 
+    # Sandbox workers are started from a fork server, which re-imports the
+    # entry point (e.g. run.py) and with it calls this factory. They need
+    # none of the services below.
+    if multiprocessing.current_process().name != 'MainProcess':
+        return app
+
+    # --- Shared Services ---
+    # Stage latency and cache metrics, served at /metrics.
+    import telemetry
+    telemetry.init_app(app)
+
+    # Load the embedding model once per process so that requests only pay
+    # for encoding their own chunks.
+    from rag_components import context_packer, embedding_cache, embeddings, extractor, index_cache, manual_library
+    extractor.init_app(app)
+    embeddings.init_app(app)
+    index_cache.init_app(app)
+    manual_library.init_app(app)
+    embedding_cache.init_app(app)
+    context_packer.init_app(app)
+
+    # Select the coder model backend, loading the local model if configured,
+    # and how the report is written.
+    from models import coder_model, report_generator
+    coder_model.init_app(app)
+    report_generator.init_app(app)
+
+    # Background worker pool for the asynchronous /jobs API.
+    from . import jobs
+    jobs.init_app(app)
+
+    # Warm, isolated processes that execute the generated calculation code.
+    from . import sandbox
+    sandbox.init_app(app)
+
+    # Load the heavy dependencies in the background, after the sandbox
+    # workers have been forked.
+    from . import prewarm
+    prewarm.init_app(app)
+
     return app
\ No newline at end of file
@@ -0,0 +1,100 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class JobQueueFull(Exception):
+    pass
+
+class JobManager:
+    """
+    Runs report pipelines on a bounded pool of background worker threads.
+
+    At most `workers` jobs run at once and at most `queue_size` more wait for
+    a free worker; submissions beyond that are rejected with JobQueueFull.
+    Finished jobs are kept for `result_ttl` seconds so clients can poll them.
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 32, result_ttl: int = 3600):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-job')
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> str:
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull(f"Too many pending jobs (limit {self.workers + self.queue_size}).")
+
+        self._prune()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'stage': None,
+                'result': None,
+                'error': None,
+                'created_at': time.time(),
+                'finished_at': None,
+            }
+
+        try:
+            self._executor.submit(self._run, job_id, fn, args, kwargs)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+        return job_id
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id: str, fn, args, kwargs):
+        self._update(job_id, status='running')
+
+        def on_stage(stage, data):
+            self._update(job_id, stage=stage)
+
+        try:
+            result = fn(*args, on_stage=on_stage, **kwargs)
+            self._update(job_id, status='done', result=result, finished_at=time.time())
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._update(job_id, status='failed', error=str(e), finished_at=time.time())
+        finally:
+            self._slots.release()
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and job['finished_at'] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+def init_app(app):
+    app.extensions['jobs'] = JobManager(
+        workers=app.config.get('JOB_WORKERS', 4),
+        queue_size=app.config.get('JOB_QUEUE_SIZE', 32),
+        result_ttl=app.config.get('JOB_RESULT_TTL', 3600),
+    )
+
+def get_manager(app) -> JobManager:
+    return app.extensions['jobs']
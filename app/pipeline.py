@@ -0,0 +1,304 @@
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import telemetry
+from rag_components import context_packer, extractor, manual_library, vector_store
+from models import coder_model, program_library, report_generator
+
+from . import sandbox
+
+# One query per section of the experiment description, so that a section
+# phrased unlike the others (often the apparatus list) is still retrieved.
+CONTEXT_QUERIES = (
+    "Aim and objective of the experiment",
+    "Theory, principle and formulas used in the experiment",
+    "Apparatus, equipment and materials required",
+    "Procedure and steps to perform the experiment",
+)
+
+# Chunks retrieved per manual, split evenly between the section queries.
+# More are retrieved than either prompt usually fits, so the packer can
+# fill each model's budget after dropping near-duplicates.
+CONTEXT_CANDIDATES = 8
+
+# Threads that draft the context-only report sections (and prefetch the
+# streamed completions) in pipelined mode. Further tasks wait for a free
+# thread; none of them waits on another.
+DRAFT_WORKERS = 16
+
+_draft_pool = None
+_draft_pool_lock = threading.Lock()
+
+def _get_draft_pool() -> ThreadPoolExecutor:
+    global _draft_pool
+    if _draft_pool is None:
+        with _draft_pool_lock:
+            if _draft_pool is None:
+                _draft_pool = ThreadPoolExecutor(max_workers=DRAFT_WORKERS, thread_name_prefix='report-draft')
+    return _draft_pool
+
+def execute_generated_code(code: str) -> str:
+    # Generated code runs in an isolated, resource-limited worker process.
+    return sandbox.execute_generated_code(code)
+
+def _notify(on_stage, stage: str, **data):
+    if on_stage is not None:
+        on_stage(stage, data)
+
+def extract_manual(source, filename: str = None, on_stage=None) -> str:
+    print("Step 1: Extracting text from manual...")
+    document_text = extractor.extract_text_from_file(source, filename=filename)
+    _notify(on_stage, 'extracted', characters=len(document_text))
+    return document_text
+
+def retrieve_context(document_text: str, store=None) -> list:
+    # Candidate chunks for the prompts, most relevant first. Pass the index
+    # of a stored manual as store to skip building one.
+    print("Step 2: Building vector store and retrieving context...")
+    return vector_store.get_relevant_chunks(document_text, CONTEXT_QUERIES, k=CONTEXT_CANDIDATES, store=store)
+
+def load_stored_manual(manual_id: str, on_stage=None) -> tuple:
+    """
+    Loads a manual from the manual library instead of extracting an upload.
+    Returns (document_text, rag_chunks), retrieved from the stored index, or
+    raises KeyError if there is no such manual.
+    """
+    print(f"Step 1: Loading stored manual {manual_id}...")
+    library = manual_library.get_library()
+    loaded = library.load(manual_id) if library is not None else None
+    if loaded is None:
+        raise KeyError(manual_id)
+    document_text, store = loaded
+    _notify(on_stage, 'extracted', characters=len(document_text), manual_id=manual_id)
+    return document_text, retrieve_context(document_text, store=store)
+
+def pack_contexts(rag_chunks: list, observations: str) -> dict:
+    """
+    Packs the retrieved chunks separately for the coder and the report
+    model, each within its own token budget. Returns the context_packer.pack
+    result for each, keyed by 'coder' and 'report'.
+    """
+    # The coder's context window must also hold the rest of the prompt and
+    # the code it generates.
+    reserved = (context_packer.count_tokens(coder_model.build_prompt("", observations), 'coder')
+                + coder_model.MAX_NEW_TOKENS)
+    packed = {
+        'coder': context_packer.pack(rag_chunks, 'coder', context_packer.budget_for('coder', reserved)),
+        'report': context_packer.pack(rag_chunks, 'report'),
+    }
+    for model, result in packed.items():
+        telemetry.observe('lab_report_llm_tokens', result['tokens'], model=model, kind='context')
+        print(f"Packed {result['used']}/{len(rag_chunks)} chunks ({result['tokens']} tokens) for the {model} model; "
+              f"skipped {result['duplicates']} near-duplicates and {result['over_budget']} over budget.")
+    return packed
+
+def _write_report(report_context: str, observations: str, results: str, stream_report: bool):
+    # Writes the report in one call. Yields report_token events when
+    # streaming, and returns the report.
+    if not stream_report:
+        return report_generator.write_report(rag_context=report_context, observations=observations, results=results)
+    parts = []
+    for text in report_generator.stream_report(rag_context=report_context, observations=observations, results=results):
+        parts.append(text)
+        yield 'report_token', {'text': text}
+    return "".join(parts)
+
+def _prefetch(pieces) -> queue.Queue:
+    # Consumes a generator on the draft pool, so it starts right away;
+    # its pieces are read from the returned queue, ending with None.
+    buffer = queue.Queue()
+
+    def consume():
+        try:
+            for piece in pieces:
+                buffer.put(piece)
+        finally:
+            buffer.put(None)
+
+    _get_draft_pool().submit(consume)
+    return buffer
+
+def _write_pipelined_report(draft, report_context: str, observations: str, results: str, stream_report: bool):
+    # Completes a report whose first sections are being drafted by `draft`
+    # (a future). Yields report_token events when streaming, and returns the
+    # stitched report. The second call does not need the draft, so it is
+    # sent right away, while the draft finishes.
+    if not stream_report:
+        completion = report_generator.complete_sections(report_context, observations, results)
+        draft_text = draft.result()
+        if report_generator.is_error_output(completion):
+            return completion
+    else:
+        # The draft is sent first, so the completion is buffered until then.
+        pieces = _prefetch(report_generator.stream_completion(report_context, observations, results))
+        draft_text = draft.result()
+
+    if report_generator.is_error_output(draft_text):
+        print("WARNING: Drafting the report sections failed; writing the report in one call.")
+        return (yield from _write_report(report_context, observations, results, stream_report))
+    if not stream_report:
+        return report_generator.stitch(draft_text, completion)
+
+    # A failed completion call streams its error text as the first piece;
+    # it must not be sent on as the rest of the report.
+    first = pieces.get()
+    if first is None or report_generator.is_error_output(first):
+        print("WARNING: Completing the report sections failed; writing the report in one call.")
+        return (yield from _write_report(report_context, observations, results, stream_report))
+
+    yield 'report_token', {'text': draft_text.rstrip() + "\n\n"}
+    parts = [first]
+    yield 'report_token', {'text': first}
+    for text in iter(pieces.get, None):
+        parts.append(text)
+        yield 'report_token', {'text': text}
+    return report_generator.stitch(draft_text, "".join(parts))
+
+def iter_pipeline(document_text: str, observations: str, stream_report: bool = False, rag_chunks: list = None,
+                  pipelined: bool = None):
+    """
+    Runs the report pipeline on already extracted manual text, yielding a
+    (stage, data) event after each stage completes.
+
+    With stream_report=True the report is not returned in one piece; instead
+    a ('report_token', {'text': ...}) event is yielded for every piece of
+    text the Groq API streams back. Pass rag_chunks to reuse chunks that
+    were already retrieved for this manual.
+
+    In pipelined mode (REPORT_PIPELINED, or pipelined=True) the report
+    sections that only depend on the manual are drafted while the code is
+    generated and executed; the rest of the report is written in a second,
+    shorter call once the results are in, and the two parts are stitched.
+    """
+    if pipelined is None:
+        pipelined = report_generator.is_pipelined()
+    if rag_chunks is None:
+        rag_chunks = retrieve_context(document_text)
+    packed = pack_contexts(rag_chunks, observations)
+    coder_context, report_context = packed['coder']['text'], packed['report']['text']
+    yield 'retrieved', {
+        'characters': len(report_context),
+        'chunks': len(rag_chunks),
+        'coder_context_tokens': packed['coder']['tokens'],
+        'report_context_tokens': packed['report']['tokens'],
+    }
+
+    draft = None
+    if pipelined and report_generator.get_client() is not None:
+        print("Drafting the context-only report sections in the background...")
+        draft = _get_draft_pool().submit(report_generator.draft_sections, report_context)
+    try:
+        yield from _run_stages(document_text, observations, stream_report, coder_context, report_context, draft)
+    finally:
+        if draft is not None:
+            # Drop the draft if the caller stopped early (e.g. the client
+            # disconnected) before it was sent.
+            draft.cancel()
+
+def _run_stages(document_text: str, observations: str, stream_report: bool, coder_context: str, report_context: str,
+                draft):
+    # Steps 3 to 5 of iter_pipeline; draft is the future of the report draft
+    # in pipelined mode, else None.
+
+    print("Step 3: Generating Python code for calculations...")
+    # A program that already worked for this manual and observation layout
+    # is reused with the new readings, skipping the coder model entirely.
+    library = program_library.get_library()
+    fingerprint = program_library.manual_fingerprint(document_text)
+    generated_code = library.lookup(fingerprint, observations) if library is not None else None
+
+    calculation_results = None
+    if generated_code is not None:
+        print("♻️ Reusing a stored calculation program for this experiment.")
+        yield 'code_generated', {'code': generated_code, 'source': 'library'}
+
+        print("Step 4: Executing generated code to get results...")
+        calculation_results = execute_generated_code(generated_code)
+        if sandbox.is_execution_error(calculation_results):
+            # The stored program does not fit these readings; drop it and
+            # fall back to the coder model.
+            print("WARNING: Stored program failed on the new readings; regenerating.")
+            library.invalidate(fingerprint, observations)
+            calculation_results = None
+
+    if calculation_results is None:
+        generated_code = coder_model.generate_code(
+            context=coder_context,
+            observations=observations
+        )
+        prompt_tokens = context_packer.count_tokens(coder_model.build_prompt(coder_context, observations), 'coder')
+        yield 'code_generated', {'code': generated_code, 'source': 'model', 'prompt_tokens': prompt_tokens}
+
+        print("Step 4: Executing generated code to get results...")
+        calculation_results = execute_generated_code(generated_code)
+        if (library is not None and not coder_model.is_error_output(generated_code)
+                and not sandbox.is_execution_error(calculation_results)):
+            library.record(fingerprint, observations, generated_code)
+    yield 'code_executed', {'results': calculation_results}
+
+    print("Step 5: Generating final report with Groq Llama...")
+    if draft is not None:
+        final_report = yield from _write_pipelined_report(draft, report_context, observations, calculation_results,
+                                                          stream_report)
+    else:
+        final_report = yield from _write_report(report_context, observations, calculation_results, stream_report)
+    yield 'report_written', {'report': final_report}
+
+def run_pipeline(document_text: str, observations: str, on_stage=None, rag_chunks: list = None,
+                 pipelined: bool = None) -> dict:
+    """
+    Runs the report pipeline on already extracted manual text.
+
+    on_stage, if given, is called as on_stage(stage, data) after each stage
+    completes, which lets callers report progress.
+    """
+    result = {}
+    for stage, data in iter_pipeline(document_text, observations, rag_chunks=rag_chunks, pipelined=pipelined):
+        if stage == 'code_generated':
+            result['generated_code'] = data['code']
+        elif stage == 'code_executed':
+            result['calculation_results'] = data['results']
+        elif stage == 'report_written':
+            result['report'] = data['report']
+        _notify(on_stage, stage, **data)
+    return result
+
+def iter_batch(document_text: str, observation_sets: list, max_workers: int = 4, rag_chunks: list = None):
+    """
+    Runs the pipeline for many observation sets against one manual.
+
+    Context is retrieved once and shared; the coder, sandbox and report
+    stages of up to max_workers items run concurrently. Yields
+    (index, result) as each item finishes, where result is the dict from
+    run_pipeline or {'error': ...} if that item failed.
+    """
+    if rag_chunks is None:
+        rag_chunks = retrieve_context(document_text)
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='batch')
+    try:
+        futures = {}
+        for index, observations in enumerate(observation_sets):
+            if not isinstance(observations, str):
+                observations = json.dumps(observations)
+            futures[pool.submit(run_pipeline, document_text, observations, rag_chunks=rag_chunks)] = index
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Batch item {futures[future]} failed: {e}")
+                result = {'error': str(e)}
+            yield futures[future], result
+    finally:
+        # Stop queued items if the caller goes away (e.g. the client
+        # disconnected from a streamed batch response).
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def run_batch(document_text: str, observation_sets: list, max_workers: int = 4, rag_chunks: list = None) -> list:
+    # Same as iter_batch, but returns the results in input order.
+    results = [None] * len(observation_sets)
+    for index, result in iter_batch(document_text, observation_sets, max_workers=max_workers, rag_chunks=rag_chunks):
+        results[index] = result
+    return results
@@ -0,0 +1,67 @@
+"""
+Background pre-warming of the heavy dependencies.
+
+LangChain, sentence-transformers (and with it torch), faiss, PyPDF2,
+python-docx and the Groq SDK are only imported when first used, so the app
+starts quickly. When PREWARM_ENABLED is set, a daemon thread loads them
+right after startup instead, together with the context tokenizers, so
+the first request does not pay for them either. Requests that arrive
+earlier simply wait for whatever they need, as they would without
+pre-warming.
+"""
+import time
+import importlib
+import threading
+
+# Imported in this order; the first ones are needed earliest by a request.
+HEAVY_MODULES = (
+    'PyPDF2',
+    'docx',
+    'langchain_community.vectorstores.faiss',
+    'faiss',
+    'groq',
+)
+
+_thread = None
+_done = threading.Event()
+
+def _import_modules():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+def _run(steps: list):
+    start = time.perf_counter()
+    for name, fn in steps:
+        step_start = time.perf_counter()
+        try:
+            fn()
+            print(f"Pre-warmed {name} in {time.perf_counter() - step_start:.2f}s.")
+        except Exception as e:
+            # The same work is retried on first use, so a failure here is
+            # never fatal.
+            print(f"WARNING: Could not pre-warm {name}: {e}")
+    print(f"✅ Pre-warming finished in {time.perf_counter() - start:.2f}s.")
+    _done.set()
+
+def wait(timeout: float = None) -> bool:
+    # True once pre-warming has finished (or was never started).
+    if _thread is None:
+        return True
+    return _done.wait(timeout)
+
+def init_app(app):
+    global _thread
+    if not app.config.get('PREWARM_ENABLED') or _thread is not None:
+        return
+
+    from models import report_generator
+    from rag_components import context_packer, embeddings
+
+    steps = [('imports', _import_modules)]
+    if app.config.get('EMBEDDING_WARMUP'):
+        steps.append(('embedding model', embeddings.warm_up))
+    steps.append(('context tokenizers', context_packer.load_tokenizers))
+    steps.append(('Groq client', report_generator.get_client))
+
+    _thread = threading.Thread(target=_run, args=(steps,), name='prewarm', daemon=True)
+    _thread.start()
@@ -1,22 +1,70 @@
-import os
-import io
-import contextlib
-from flask import Blueprint, render_template, request, jsonify, current_app
-from werkzeug.utils import secure_filename
+import json
+import shutil
+import tempfile
+from flask import Blueprint, Response, render_template, request, jsonify, current_app, stream_with_context
 
-from rag_components import extractor, vector_store
-from models import coder_model, report_generator
+import telemetry
+
+from rag_components import manual_library
+
+from . import jobs
+from .pipeline import extract_manual, iter_batch, iter_pipeline, load_stored_manual, run_pipeline
 
 main = Blueprint('main', __name__)
 
-def execute_generated_code(code: str) -> str:
-    string_io = io.StringIO()
+def _validate_upload():
+    # Returns (manual_file, manual_id, observations_json, error_response).
+    # A request either uploads the manual as manual_file or names one stored
+    # in the manual library by manual_id; the other is None.
+    manual_id = request.form.get('manual_id')
+    observations_json = request.form.get('observations')
+
+    if manual_id:
+        library = manual_library.get_library()
+        if library is None:
+            return None, None, None, (jsonify({'error': 'The manual library is disabled.'}), 404)
+        if library.get(manual_id) is None:
+            return None, None, None, (jsonify({'error': 'Manual not found.'}), 404)
+        manual_file = None
+    else:
+        if 'manual_file' not in request.files:
+            return None, None, None, (jsonify({'error': 'No lab manual file provided.'}), 400)
+        manual_file = request.files['manual_file']
+        if manual_file.filename == '':
+            return None, None, None, (jsonify({'error': 'No file selected.'}), 400)
+
+    if not observations_json:
+        return None, None, None, (jsonify({'error': 'No observations provided.'}), 400)
+
+    return manual_file, manual_id or None, observations_json, None
+
+def _spool_upload(manual_file):
+    # Queued jobs and streamed responses outlive the upload stream, so keep
+    # a copy in memory, spilling to a temporary file only for large uploads.
+    spool = tempfile.SpooledTemporaryFile(max_size=current_app.config.get('UPLOAD_SPOOL_MAX_MEMORY', 8 * 1024 * 1024))
+    shutil.copyfileobj(manual_file.stream, spool)
+    spool.seek(0)
+    return spool
+
+def _read_manual(manual_stream, filename: str, manual_id: str, on_stage=None) -> tuple:
+    # Returns (document_text, rag_chunks). Stored manuals come with their
+    # chunks already retrieved; for uploads rag_chunks is None.
+    if manual_id is not None:
+        return load_stored_manual(manual_id, on_stage=on_stage)
+    return extract_manual(manual_stream, filename=filename, on_stage=on_stage), None
+
+def _run_job(manual_stream, filename: str, manual_id: str, observations_json: str, on_stage=None) -> dict:
     try:
-        with contextlib.redirect_stdout(string_io):
-            exec(code, {})
-        return string_io.getvalue()
-    except Exception as e:
-        return f"Error executing generated code: {e}"
+        document_text, rag_chunks = _read_manual(manual_stream, filename, manual_id, on_stage=on_stage)
+        return run_pipeline(document_text, observations_json, on_stage=on_stage, rag_chunks=rag_chunks)
+    finally:
+        if manual_stream is not None:
+            manual_stream.close()
+
+@main.app_errorhandler(413)
+def upload_too_large(error):
+    limit_mb = (current_app.config.get('MAX_CONTENT_LENGTH') or 0) / (1024 * 1024)
+    return jsonify({'error': f'The uploaded file is too large (limit {limit_mb:.0f} MB).'}), 413
 
 # --- Main Page Route ---
 @main.route('/')
@@ -27,76 +75,249 @@ def index():
 @main.route('/generate', methods=['POST'])
 def generate_report_route():
     # 1. --- Input Validation ---
-    if 'manual_file' not in request.files:
-        return jsonify({'error': 'No lab manual file provided.'}), 400
-    
-    manual_file = request.files['manual_file']
-    observations_json = request.form.get('observations')
+    manual_file, manual_id, observations_json, error = _validate_upload()
+    if error:
+        return error
 
-    if manual_file.filename == '':
-        return jsonify({'error': 'No file selected.'}), 400
+    try:
+        # 2. --- RAG: Extract and Retrieve Context ---
+        # The upload is read straight from the request stream; nothing is
+        # written to disk. Stored manuals skip extraction and indexing.
+        rag_chunks = None
+        if manual_id is not None:
+            document_text, rag_chunks = load_stored_manual(manual_id)
+        else:
+            print(f"Uploaded file: {manual_file.filename} ({manual_file.mimetype})")
+            try:
+                document_text = extract_manual(manual_file.stream, filename=manual_file.filename)
+                print("Text extraction successful")
+            except Exception as e:
+                print(f"Error during text extraction: {str(e)}")
+                return jsonify({'error': f'Failed to extract text from file: {str(e)}'}), 500
 
-    if not observations_json:
-        return jsonify({'error': 'No observations provided.'}), 400
+        # 3. to 5. --- Retrieve, Generate Code, Execute, Write Report ---
+        result = run_pipeline(document_text, observations_json, rag_chunks=rag_chunks)
+
+        # 6. --- Return Final Report ---
+        print("Workflow complete. Returning report.")
+        return jsonify({'report': result['report']})
 
-    # Securely save the uploaded file
-    filename = secure_filename(manual_file.filename)
-    upload_path = os.path.join(current_app.root_path, '..', 'uploads', filename)
-    manual_file.save(upload_path)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return jsonify({'error': f'An internal error occurred: {str(e)}'}), 500
 
+# --- Streaming Report Generation Route ---
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_events(manual_stream, filename: str, manual_id: str, observations_json: str):
     try:
-        # Ensure upload directory exists
-        upload_dir = os.path.join(current_app.root_path, '..', 'uploads')
-        if not os.path.exists(upload_dir):
-            os.makedirs(upload_dir)
-            
-        # 2. --- RAG: Extract and Retrieve Context ---
-        print("Step 1: Extracting text from manual...")
-        print(f"File path: {upload_path}")
-        print(f"File exists: {os.path.exists(upload_path)}")
-        print(f"File size: {os.path.getsize(upload_path) if os.path.exists(upload_path) else 'N/A'}")
-        print(f"File extension: {os.path.splitext(upload_path)[1]}")
-        
         try:
-            document_text = extractor.extract_text_from_file(upload_path)
-            print("Text extraction successful")
+            document_text, rag_chunks = _read_manual(manual_stream, filename, manual_id)
         except Exception as e:
             print(f"Error during text extraction: {str(e)}")
-            return jsonify({'error': f'Failed to extract text from file: {str(e)}'}), 500
-        
-        print("Step 2: Building vector store and retrieving context...")
-        query = "Aim, Theory, Apparatus, and Procedure of the experiment"
-        rag_context = vector_store.get_relevant_context(document_text, query)
-
-        # 3. --- Coder Model: Generate Calculation Code ---
-        print("Step 3: Generating Python code for calculations...")
-        generated_code = coder_model.generate_code(
-            context=rag_context, 
-            observations=observations_json
-        )
-
-        # 4. --- Execute Code ---
-        print("Step 4: Executing generated code to get results...")
-        calculation_results = execute_generated_code(generated_code)
-
-        # 5. --- Report Generator: Write Final Report ---
-        print("Step 5: Generating final report with Groq Llama...")
-        final_report = report_generator.write_report(
-            rag_context=rag_context,
-            observations=observations_json,
-            results=calculation_results
-        )
-        
-        # 6. --- Return Final Report ---
-        print("Workflow complete. Returning report.")
-        return jsonify({'report': final_report})
+            yield _sse('error', {'error': f'Failed to extract text from file: {str(e)}'})
+            return
+        yield _sse('stage', {'stage': 'extracted', 'characters': len(document_text)})
+
+        for stage, data in iter_pipeline(document_text, observations_json, stream_report=True, rag_chunks=rag_chunks):
+            if stage == 'report_token':
+                yield _sse('token', data)
+            elif stage == 'report_written':
+                # The client has already assembled the report from the tokens.
+                yield _sse('done', {'stage': stage})
+            else:
+                yield _sse('stage', dict(data, stage=stage))
 
     except Exception as e:
         print(f"An error occurred: {e}")
-        return jsonify({'error': f'An internal error occurred: {str(e)}'}), 500
+        yield _sse('error', {'error': f'An internal error occurred: {str(e)}'})
 
     finally:
-        # 7. --- Cleanup ---
-        if os.path.exists(upload_path):
-            os.remove(upload_path)
-            print(f"Cleaned up uploaded file: {upload_path}")
\ No newline at end of file
+        if manual_stream is not None:
+            manual_stream.close()
+
+@main.route('/generate/stream', methods=['POST'])
+def stream_report_route():
+    manual_file, manual_id, observations_json, error = _validate_upload()
+    if error:
+        return error
+
+    # The upload stream may be closed by the server before the response has
+    # finished streaming, so the events are generated from a spooled copy.
+    manual_stream = _spool_upload(manual_file) if manual_file is not None else None
+    filename = manual_file.filename if manual_file is not None else None
+
+    return Response(
+        stream_with_context(_stream_events(manual_stream, filename, manual_id, observations_json)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Stop reverse proxies such as nginx from buffering the stream.
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+# --- Batch Report Generation Route ---
+def _parse_observation_sets(observations_json: str):
+    # Returns (observation_sets, error_response).
+    try:
+        observation_sets = json.loads(observations_json)
+    except ValueError:
+        return None, (jsonify({'error': 'Observations must be a JSON array of observation sets.'}), 400)
+
+    if not isinstance(observation_sets, list) or not observation_sets:
+        return None, (jsonify({'error': 'Observations must be a non-empty JSON array of observation sets.'}), 400)
+
+    max_items = current_app.config.get('BATCH_MAX_ITEMS', 50)
+    if len(observation_sets) > max_items:
+        return None, (jsonify({'error': f'Too many observation sets (limit {max_items}).'}), 400)
+
+    return observation_sets, None
+
+def _batch_lines(manual_stream, filename: str, manual_id: str, observation_sets: list, workers: int):
+    # One JSON object per line: a line per item as it finishes, then a summary.
+    try:
+        try:
+            document_text, rag_chunks = _read_manual(manual_stream, filename, manual_id)
+        except Exception as e:
+            print(f"Error during text extraction: {str(e)}")
+            yield json.dumps({'error': f'Failed to extract text from file: {str(e)}'}) + "\n"
+            return
+
+        failed = 0
+        for index, result in iter_batch(document_text, observation_sets, max_workers=workers, rag_chunks=rag_chunks):
+            if 'error' in result:
+                failed += 1
+            yield json.dumps(dict(result, index=index)) + "\n"
+        yield json.dumps({'done': True, 'items': len(observation_sets), 'failed': failed}) + "\n"
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        yield json.dumps({'error': f'An internal error occurred: {str(e)}'}) + "\n"
+
+    finally:
+        if manual_stream is not None:
+            manual_stream.close()
+
+@main.route('/generate/batch', methods=['POST'])
+def batch_report_route():
+    manual_file, manual_id, observations_json, error = _validate_upload()
+    if error:
+        return error
+    observation_sets, error = _parse_observation_sets(observations_json)
+    if error:
+        return error
+
+    manual_stream = _spool_upload(manual_file) if manual_file is not None else None
+    filename = manual_file.filename if manual_file is not None else None
+    workers = current_app.config.get('BATCH_WORKERS', 4)
+
+    return Response(
+        stream_with_context(_batch_lines(manual_stream, filename, manual_id, observation_sets, workers)),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+# --- Manual Library Routes ---
+def _get_manual_library():
+    # Returns (library, error_response).
+    library = manual_library.get_library()
+    if library is None:
+        return None, (jsonify({'error': 'The manual library is disabled.'}), 404)
+    return library, None
+
+@main.route('/manuals', methods=['POST'])
+def add_manual_route():
+    library, error = _get_manual_library()
+    if error:
+        return error
+    if 'manual_file' not in request.files:
+        return jsonify({'error': 'No lab manual file provided.'}), 400
+    manual_file = request.files['manual_file']
+    if manual_file.filename == '':
+        return jsonify({'error': 'No file selected.'}), 400
+
+    try:
+        manual, created = library.add(manual_file.read(), manual_file.filename)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error while storing manual: {str(e)}")
+        return jsonify({'error': f'Failed to store manual: {str(e)}'}), 500
+
+    # Uploading a manual that is already stored returns the existing entry.
+    return jsonify(manual), 201 if created else 200
+
+@main.route('/manuals', methods=['GET'])
+def list_manuals_route():
+    library, error = _get_manual_library()
+    if error:
+        return error
+    return jsonify({'manuals': library.list()})
+
+@main.route('/manuals/<manual_id>', methods=['GET'])
+def get_manual_route(manual_id):
+    library, error = _get_manual_library()
+    if error:
+        return error
+    manual = library.get(manual_id)
+    if manual is None:
+        return jsonify({'error': 'Manual not found.'}), 404
+    return jsonify(manual)
+
+@main.route('/manuals/<manual_id>', methods=['DELETE'])
+def delete_manual_route(manual_id):
+    library, error = _get_manual_library()
+    if error:
+        return error
+    if not library.delete(manual_id):
+        return jsonify({'error': 'Manual not found.'}), 404
+    return '', 204
+
+# --- Metrics Route ---
+@main.route('/metrics', methods=['GET'])
+def metrics_route():
+    if not telemetry.is_enabled():
+        return jsonify({'error': 'Metrics are disabled.'}), 404
+    return Response(telemetry.render(), mimetype='text/plain; version=0.0.4')
+
+# --- Asynchronous Job API Routes ---
+@main.route('/jobs', methods=['POST'])
+def create_job_route():
+    manual_file, manual_id, observations_json, error = _validate_upload()
+    if error:
+        return error
+
+    manager = jobs.get_manager(current_app)
+    manual_stream = _spool_upload(manual_file) if manual_file is not None else None
+    filename = manual_file.filename if manual_file is not None else None
+    try:
+        job_id = manager.submit(_run_job, manual_stream, filename, manual_id, observations_json)
+    except jobs.JobQueueFull as e:
+        if manual_stream is not None:
+            manual_stream.close()
+        return jsonify({'error': str(e)}), 503
+
+    print(f"Queued report job {job_id}")
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+@main.route('/jobs/<job_id>', methods=['GET'])
+def get_job_route(job_id):
+    job = jobs.get_manager(current_app).get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found.'}), 404
+
+    response = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'stage': job['stage'],
+    }
+    if job['status'] == 'done':
+        response.update(job['result'])
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
\ No newline at end of file
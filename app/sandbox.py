@@ -0,0 +1,292 @@
+import io
+import os
+import time
+import queue
+import signal
+import importlib
+import threading
+import contextlib
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; only the wall-clock limit applies there.
+    resource = None
+
+import telemetry
+import worker_processes
+
+# Prefix of every result that reports a failed execution.
+EXECUTION_ERROR_PREFIX = "Error executing generated code"
+
+# Modules imported once by the fork server the workers are started from, so
+# neither worker start-up nor snippets pay for them. The first keeps
+# numerical libraries single-threaded before numpy is loaded.
+PRELOAD_MODULES = ('app.sandbox_preload', 'math', 'statistics', 'numpy')
+
+class _CpuTimeExceeded(BaseException):
+    # A BaseException, so a bare `except Exception` in a snippet cannot swallow it.
+    pass
+
+def _on_cpu_limit(signum, frame):
+    raise _CpuTimeExceeded()
+
+def _rss_bytes(pid: int) -> int:
+    # Resident set size from /proc; returns 0 where /proc is not available.
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _vm_data_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmData:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def _worker_main(conn, cpu_seconds: int, memory_bytes: int):
+    # Already imported where the start method preloads them.
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+        baseline = _vm_data_bytes()
+        if baseline and memory_bytes:
+            # Heap allocations beyond the limit fail with MemoryError.
+            _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+            limit = baseline + memory_bytes
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(resource.RLIMIT_DATA, (limit, hard))
+
+    while True:
+        try:
+            code = conn.recv()
+        except EOFError:
+            return
+        if code is None:
+            return
+
+        if resource is not None and cpu_seconds:
+            # RLIMIT_CPU counts the whole life of the process, so each job's
+            # limit is set relative to the CPU time used so far.
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+        string_io = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(string_io):
+                exec(code, {'__name__': '__main__'})
+            result = ('ok', string_io.getvalue())
+        except _CpuTimeExceeded:
+            result = ('error', f"CPU time limit of {cpu_seconds}s exceeded")
+        except MemoryError:
+            result = ('error', "Memory limit exceeded")
+        except SystemExit:
+            result = ('ok', string_io.getvalue())
+        except Exception as e:
+            result = ('error', str(e))
+        finally:
+            if resource is not None and cpu_seconds:
+                _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+                resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+        conn.send(result)
+
+class _Worker:
+    def __init__(self, context, cpu_seconds: int, memory_bytes: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_conn, cpu_seconds, memory_bytes),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.baseline_rss = None
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+class SandboxPool:
+    """
+    A pool of warm worker processes that execute generated code.
+
+    Each snippet runs in its own process with numpy and math already
+    imported, under a CPU-time limit, a wall-clock limit and a memory
+    limit. A worker that exceeds a limit or crashes is killed and replaced,
+    so a runaway snippet never affects the web process or other requests.
+    """
+
+    def __init__(self, workers: int = 2, cpu_seconds: int = 5, wall_seconds: float = 10, memory_mb: int = 256,
+                 queue_seconds: float = 30):
+        self.workers = workers
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self.queue_seconds = queue_seconds
+        # Workers are forked from a fork server rather than from the web
+        # process, with PRELOAD_MODULES already imported there.
+        self._context = worker_processes.get_context(PRELOAD_MODULES)
+        self._idle = queue.Queue()
+        self._live = 0 # Workers started and not yet killed
+        self._live_lock = threading.Lock()
+        self._closed = False
+        self._refill()
+
+    def _start_worker(self) -> _Worker:
+        return _Worker(self._context, self.cpu_seconds, self.memory_bytes)
+
+    def _refill(self):
+        # Starts workers until the pool is back to its size. Starting one can
+        # fail under the very memory pressure the sandbox guards against;
+        # the pool then stays short until the next attempt.
+        while True:
+            with self._live_lock:
+                if self._closed or self._live >= self.workers:
+                    return
+                self._live += 1
+            try:
+                worker = self._start_worker()
+            except Exception as e:
+                with self._live_lock:
+                    self._live -= 1
+                print(f"WARNING: Could not start a sandbox worker: {e}")
+                return
+            self._idle.put(worker)
+
+    def _replace(self, worker: _Worker):
+        worker.kill()
+        with self._live_lock:
+            self._live -= 1
+        # Start the replacement in the background so the caller is not
+        # delayed by process start-up. If no thread can be started, waiting
+        # callers refill the pool themselves.
+        try:
+            threading.Thread(target=self._refill, daemon=True).start()
+        except RuntimeError as e:
+            print(f"WARNING: Could not start a sandbox worker: {e}")
+
+    def _acquire(self) -> _Worker:
+        # An idle worker, or None if none became free within queue_seconds.
+        deadline = time.monotonic() + self.queue_seconds
+        while True:
+            if self._live < self.workers:
+                # Replaces workers whose replacement failed to start.
+                self._refill()
+            try:
+                return self._idle.get(timeout=max(0, min(1.0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            if time.monotonic() > deadline:
+                return None
+
+    def run(self, code: str) -> str:
+        worker = self._acquire()
+        if worker is None:
+            return f"{EXECUTION_ERROR_PREFIX}: no sandbox worker became free within {self.queue_seconds}s"
+        if worker.baseline_rss is None:
+            worker.baseline_rss = _rss_bytes(worker.process.pid)
+
+        try:
+            worker.conn.send(code)
+            deadline = time.monotonic() + self.wall_seconds
+            while not worker.conn.poll(0.05):
+                if time.monotonic() > deadline:
+                    self._replace(worker)
+                    return f"{EXECUTION_ERROR_PREFIX}: wall-clock limit of {self.wall_seconds}s exceeded"
+                rss = _rss_bytes(worker.process.pid)
+                if worker.baseline_rss and self.memory_bytes and rss > worker.baseline_rss + self.memory_bytes:
+                    self._replace(worker)
+                    return f"{EXECUTION_ERROR_PREFIX}: Memory limit exceeded"
+            status, payload = worker.conn.recv()
+        except (EOFError, OSError):
+            # The worker died, e.g. killed by the OS for exceeding a limit.
+            self._replace(worker)
+            return f"{EXECUTION_ERROR_PREFIX}: the sandbox process terminated unexpectedly"
+
+        self._idle.put(worker)
+        if status == 'ok':
+            return payload
+        return f"{EXECUTION_ERROR_PREFIX}: {payload}"
+
+    def shutdown(self):
+        with self._live_lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.kill()
+
+# --- Process-wide pool ---
+
+_pool = None
+_settings = {
+    'workers': 2,
+    'cpu_seconds': 5,
+    'wall_seconds': 10,
+    'memory_mb': 256,
+    'queue_seconds': 30,
+}
+_lock = threading.Lock()
+
+def get_pool() -> SandboxPool:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = SandboxPool(**_settings)
+    return _pool
+
+def execute_generated_code(code: str) -> str:
+    with telemetry.span('execute'):
+        output = get_pool().run(code)
+        if is_execution_error(output):
+            telemetry.mark_error()
+        return output
+
+def is_execution_error(output: str) -> bool:
+    return output.startswith(EXECUTION_ERROR_PREFIX)
+
+def init_app(app):
+    global _pool
+    for key, config_key in (('workers', 'SANDBOX_WORKERS'),
+                            ('cpu_seconds', 'SANDBOX_CPU_SECONDS'),
+                            ('wall_seconds', 'SANDBOX_WALL_SECONDS'),
+                            ('memory_mb', 'SANDBOX_MEMORY_MB'),
+                            ('queue_seconds', 'SANDBOX_QUEUE_SECONDS')):
+        if app.config.get(config_key) is not None:
+            _settings[key] = app.config[config_key]
+
+    # Never start a pool from inside a child process (e.g. when a worker
+    # re-imports the module that created the app). parent_process() is not
+    # set yet while that import runs, but the process name is.
+    if multiprocessing.current_process().name != 'MainProcess':
+        return
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = SandboxPool(**_settings)
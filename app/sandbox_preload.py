@@ -0,0 +1,10 @@
+"""
+Preloaded by the workers' fork server ahead of numpy (see PRELOAD_MODULES
+in app/sandbox.py), so that the numerical libraries preloaded there, and
+the workers forked from it, stay single-threaded. The web process never
+imports it; its own libraries should use every core.
+"""
+import os
+
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('OMP_NUM_THREADS', '1')
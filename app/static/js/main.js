@@ -2,6 +2,7 @@ document.addEventListener('DOMContentLoaded', function () {
     const uploadForm = document.getElementById('upload-form');
     const submitBtn = document.getElementById('submit-btn');
     const loader = document.getElementById('loader');
+    const loaderStatus = document.getElementById('loader-status');
     const reportResult = document.getElementById('reportResult');
     const reportContent = document.getElementById('report-content');
     const manualFileInput = document.getElementById('manualFile');
@@ -18,6 +19,28 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
+    // Human-readable labels for the pipeline stages reported by the server
+    const stageLabels = {
+        extracted: 'Text extracted from the manual. Retrieving relevant context...',
+        retrieved: 'Context retrieved. Generating calculation code...',
+        code_generated: 'Code generated. Running calculations...',
+        code_executed: 'Calculations done. Writing the report...',
+    };
+
+    // Parse one Server-Sent Events frame into its event name and JSON data
+    function parseEvent(frame) {
+        let event = 'message';
+        const dataLines = [];
+        frame.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+    }
+
     // Handle form submission
     uploadForm.addEventListener('submit', async function (event) {
         event.preventDefault();
@@ -26,12 +49,14 @@ document.addEventListener('DOMContentLoaded', function () {
 
         // Show loader and hide form/results
         loader.classList.remove('hidden');
+        loaderStatus.textContent = 'Extracting text from the manual...';
         reportResult.classList.add('hidden');
+        reportContent.textContent = '';
         submitBtn.disabled = true;
         submitBtn.textContent = 'Generating...';
 
         try {
-            const response = await fetch('/generate', {
+            const response = await fetch('/generate/stream', {
                 method: 'POST',
                 body: formData,
             });
@@ -41,8 +66,34 @@ document.addEventListener('DOMContentLoaded', function () {
                 throw new Error(errorData.error || `HTTP error! Status: ${response.status}`);
             }
 
-            const data = await response.json();
-            reportContent.textContent = data.report;
+            // Read the event stream and render the report as it arrives
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const { event: name, data } = parseEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+
+                    if (name === 'stage') {
+                        loaderStatus.textContent = stageLabels[data.stage] || 'Working...';
+                    } else if (name === 'token') {
+                        // Swap the loader for the report on the first token
+                        loader.classList.add('hidden');
+                        reportResult.classList.remove('hidden');
+                        reportContent.textContent += data.text;
+                    } else if (name === 'error') {
+                        throw new Error(data.error);
+                    }
+                }
+            }
+
             reportResult.classList.remove('hidden');
 
         } catch (error) {
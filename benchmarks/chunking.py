@@ -0,0 +1,113 @@
+"""
+Microbenchmark of manual chunking.
+
+Splits a synthetic manual (500 pages by default, pages joined with page
+breaks as the extractor joins PDF pages) with LangChain's
+RecursiveCharacterTextSplitter and with rag_components.chunker. Reports
+for each:
+- the best wall time over --repeat runs
+- the peak memory allocated while splitting, measured with tracemalloc
+  in a separate run
+
+The chunker is timed twice: splitting only (split_text), and with page
+and heading metadata (split_documents, as build_vector_store uses it).
+The chunks of both splitters are compared, and any mismatch is reported.
+
+Usage:
+    python benchmarks/chunking.py
+    python benchmarks/chunking.py --pages 1000 --repeat 10
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import datetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from benchmarks.load_test import manual_pages
+from rag_components import chunker
+from rag_components.extractor import PAGE_BREAK
+from rag_components.vector_store import CHUNK_OVERLAP, CHUNK_SIZE
+
+def make_manual(pages: int, seed: int) -> str:
+    # Blank lines between some paragraphs, so that every separator level
+    # of the splitter is exercised.
+    rng = random.Random(seed)
+    texts = []
+    for page in manual_pages(rng, pages):
+        lines = page.split("\n")
+        for i in range(len(lines) - 1, 0, -1):
+            if rng.random() < 0.1:
+                lines.insert(i, "")
+        texts.append("\n".join(lines))
+    return ("\n" + PAGE_BREAK).join(texts)
+
+def measure(split, text: str, repeat: int) -> dict:
+    split(text) # Warm-up
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        split(text)
+        seconds.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    result = split(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': min(seconds), 'peak_bytes': peak, 'result': result}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LangChain's text splitter against the offset chunker.")
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(project_root, 'benchmarks', 'results'))
+    args = parser.parse_args()
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len)
+
+    text = make_manual(args.pages, args.seed)
+    print(f"Splitting a {args.pages}-page manual ({len(text)} characters) into {CHUNK_SIZE}/{CHUNK_OVERLAP} chunks.")
+
+    runs = {
+        'langchain': measure(splitter.split_text, text, args.repeat),
+        'chunker': measure(lambda text: chunker.split_text(text, CHUNK_SIZE, CHUNK_OVERLAP), text, args.repeat),
+        'chunker+metadata': measure(lambda text: chunker.split_documents(text, CHUNK_SIZE, CHUNK_OVERLAP), text, args.repeat),
+    }
+
+    reference = runs['langchain']['result']
+    chunks = runs['chunker']['result']
+    mismatches = sum(a != b for a, b in zip(reference, chunks)) + abs(len(reference) - len(chunks))
+    pages = {metadata['page'] for metadata in runs['chunker+metadata']['result'][1]}
+
+    baseline = runs['langchain']
+    results = {'pages': args.pages, 'characters': len(text), 'chunks': len(reference), 'chunker_chunks': len(chunks),
+               'mismatched_chunks': mismatches, 'pages_cited': len(pages), 'splitters': {}}
+    print(f"\n{'Splitter':<18}{'Time':>10}{'Speed-up':>10}{'Peak alloc':>13}")
+    for name, run in runs.items():
+        results['splitters'][name] = {
+            'seconds': run['seconds'],
+            'speedup': baseline['seconds'] / run['seconds'],
+            'peak_bytes': run['peak_bytes'],
+        }
+        print(f"{name:<18}{run['seconds'] * 1000:>8.1f}ms{baseline['seconds'] / run['seconds']:>9.2f}x"
+              f"{run['peak_bytes'] / (1024 * 1024):>10.1f} MB")
+    print(f"\n{len(reference)} chunks; {mismatches} differ from LangChain's. Chunks cite {len(pages)} distinct pages.")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"chunking_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to: {path}")
+
+if __name__ == '__main__':
+    main()
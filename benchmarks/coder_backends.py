@@ -0,0 +1,126 @@
+"""
+Benchmarks the coder model backends against each other.
+
+Runs the prompts from train/eval.jsonl through the Hugging Face Inference
+API backend and the local CPU backend, and reports per-call latency and
+generation speed (new tokens per second). Model loading is timed separately
+and excluded from the per-call numbers.
+
+Usage:
+    python benchmarks/coder_backends.py --backends api local --runs 2
+    python benchmarks/coder_backends.py --backends local --int8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from datetime import datetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from config import Config
+from models import coder_model, local_coder
+
+def load_prompts(limit: int) -> list:
+    with open(os.path.join(project_root, 'train', 'eval.jsonl'), 'r') as f:
+        examples = json.load(f)
+    return [
+        coder_model.build_prompt(example['context'], json.dumps(example['observations'], indent=2))
+        for example in examples[:limit]
+    ]
+
+def make_token_counter():
+    # Count tokens with the coder's own tokenizer, so both backends are
+    # measured in the same unit; fall back to whitespace words.
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(local_coder._settings['model'], trust_remote_code=True)
+        return lambda text: len(tokenizer(text)["input_ids"]), 'tokens'
+    except Exception as e:
+        print(f"WARNING: Could not load the coder tokenizer ({e}); counting words instead.")
+        return lambda text: len(text.split()), 'words'
+
+def benchmark_backend(backend: str, prompts: list, runs: int, count_tokens) -> dict:
+    result = {'backend': backend}
+    if backend == 'local':
+        start = time.perf_counter()
+        local_coder.load()
+        result['load_seconds'] = time.perf_counter() - start
+
+    latencies, speeds, errors = [], [], []
+    for _ in range(runs):
+        for prompt in prompts:
+            start = time.perf_counter()
+            code = _generate(backend, prompt)
+            elapsed = time.perf_counter() - start
+            if coder_model.is_error_output(code):
+                # Failed calls would skew the numbers; report them instead.
+                errors.append(code.splitlines()[0])
+                continue
+            latencies.append(elapsed)
+            speeds.append(count_tokens(code) / elapsed if elapsed > 0 else 0.0)
+
+    result['errors'] = errors
+    if not latencies:
+        print(f"WARNING: Every call to the '{backend}' backend failed: {errors[0]}")
+        return result
+
+    result.update({
+        'calls': len(latencies),
+        'latency_mean_s': statistics.mean(latencies),
+        'latency_p50_s': statistics.median(latencies),
+        'latency_max_s': max(latencies),
+        'throughput_mean': statistics.mean(speeds),
+    })
+    return result
+
+def _generate(backend: str, prompt: str) -> str:
+    # Call the backend directly so a local failure is not hidden by the
+    # automatic fallback to the API.
+    if backend == 'local':
+        return coder_model._generate_with_local_model(prompt)
+    return coder_model._generate_with_api(prompt)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', choices=['api', 'local'], default=['api', 'local'])
+    parser.add_argument('--examples', type=int, default=3, help="Number of prompts from train/eval.jsonl")
+    parser.add_argument('--runs', type=int, default=1, help="Passes over the prompts per backend")
+    parser.add_argument('--model', default=Config.CODER_LOCAL_MODEL, help="Model for the local backend")
+    parser.add_argument('--int8', action='store_true', help="Quantize the local model to int8")
+    parser.add_argument('--threads', type=int, default=Config.CODER_LOCAL_THREADS)
+    parser.add_argument('--output', help="Where to save the JSON results")
+    args = parser.parse_args()
+
+    local_coder.configure(
+        model=args.model,
+        base_model=Config.CODER_LOCAL_BASE_MODEL,
+        quantize_int8=args.int8,
+        threads=args.threads,
+    )
+    prompts = load_prompts(args.examples)
+    count_tokens, unit = make_token_counter()
+
+    results = [benchmark_backend(backend, prompts, args.runs, count_tokens) for backend in args.backends]
+
+    print(f"\n{'backend':<8} {'calls':>5} {'mean s':>8} {'p50 s':>8} {'max s':>8} {unit + '/s':>10} {'load s':>8}")
+    for r in results:
+        if 'calls' not in r:
+            print(f"{r['backend']:<8} {'failed':>5}")
+            continue
+        load = f"{r['load_seconds']:.1f}" if 'load_seconds' in r else '-'
+        print(f"{r['backend']:<8} {r['calls']:>5} {r['latency_mean_s']:>8.2f} {r['latency_p50_s']:>8.2f} "
+              f"{r['latency_max_s']:>8.2f} {r['throughput_mean']:>10.1f} {load:>8}")
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), 'results', f"coder_backends_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'int8': args.int8, 'model': args.model, 'unit': unit, 'results': results}, f, indent=2)
+    print(f"\nResults saved to: {output}")
+
+if __name__ == '__main__':
+    main()
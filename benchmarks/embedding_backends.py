@@ -0,0 +1,148 @@
+"""
+Benchmarks the embedding backends on CPU.
+
+Embeds the same chunks with the PyTorch backend (sentence-transformers via
+HuggingFaceEmbeddings), the ONNX Runtime backend and the int8-quantized
+ONNX backend. Reports throughput in chunks/s and retrieval parity with
+the PyTorch path:
+- recall@k of the top-k chunks for a set of queries
+- the mean cosine similarity of the chunk vectors
+
+The corpus is the golden reports from evaluation/eval_dataset.jsonl, split
+like manuals are, topped up with synthetic manual pages. The queries are
+the pipeline's section queries plus the aim of every golden report.
+
+Usage:
+    python benchmarks/embedding_backends.py
+    python benchmarks/embedding_backends.py --chunks 2000 --threads 4 --k 5
+    python benchmarks/embedding_backends.py --model /path/to/all-MiniLM-L6-v2
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from app.pipeline import CONTEXT_QUERIES
+from benchmarks.load_test import manual_pages
+from rag_components import chunker, onnx_embeddings
+from rag_components.embeddings import EMBEDDING_MODEL_NAME, get_settings
+from rag_components.vector_store import CHUNK_OVERLAP, CHUNK_SIZE
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+def load_corpus(count: int, seed: int) -> tuple:
+    with open(os.path.join(project_root, 'evaluation', 'eval_dataset.jsonl'), 'r') as f:
+        reports = [json.loads(line)['golden_report'] for line in f]
+
+    chunks = [chunk for report in reports for chunk in chunker.split_text(report, CHUNK_SIZE, CHUNK_OVERLAP)]
+    rng = random.Random(seed)
+    while len(chunks) < count:
+        chunks += chunker.split_text("\n".join(manual_pages(rng, 4)), CHUNK_SIZE, CHUNK_OVERLAP)
+
+    queries = list(CONTEXT_QUERIES)
+    for report in reports:
+        first_line = report.strip().splitlines()[0]
+        if first_line.lower().startswith('aim'):
+            queries.append(first_line)
+    return chunks[:count], queries
+
+def make_backend(name: str, model_name: str, batch_size: int, threads: int, batch_tokens: int):
+    if name == 'torch':
+        import torch
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        if threads:
+            torch.set_num_threads(threads)
+        return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': 'cpu'},
+                                     encode_kwargs={'batch_size': batch_size})
+    model_path = onnx_embeddings.ensure_exported(model_name, get_settings()['onnx_dir'], quantize=name == 'onnx-int8')
+    return onnx_embeddings.OnnxEmbeddings(model_path, threads=threads, batch_size=batch_size, batch_tokens=batch_tokens)
+
+def measure(embeddings, chunks: list, queries: list, repeat: int) -> dict:
+    embeddings.embed_documents(chunks[:8]) # Warm-up: first-run allocations and kernel selection
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+        seconds.append(time.perf_counter() - start)
+    query_vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+    best = min(seconds)
+    return {
+        'seconds': best,
+        'chunks_per_second': len(chunks) / best,
+        'vectors': vectors,
+        'query_vectors': query_vectors,
+    }
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def top_k(vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    scores = normalize(query_vectors) @ normalize(vectors).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the embedding backends.")
+    parser.add_argument('--model', default=os.environ.get('EMBEDDING_MODEL_NAME') or EMBEDDING_MODEL_NAME)
+    parser.add_argument('--backend', choices=BACKENDS, action='append', help="Backend to run (repeatable; default: all).")
+    parser.add_argument('--chunks', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--batch-tokens', type=int, default=8192, help="Padded tokens per ONNX batch.")
+    parser.add_argument('--threads', type=int, default=0, help="Intra-op threads (0 = library default).")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(project_root, 'benchmarks', 'results'))
+    args = parser.parse_args()
+
+    backends = args.backend or list(BACKENDS)
+    if 'torch' not in backends:
+        backends.insert(0, 'torch') # The reference for recall parity
+
+    chunks, queries = load_corpus(args.chunks, args.seed)
+    print(f"Embedding {len(chunks)} chunks and {len(queries)} queries with '{args.model}'.")
+
+    measured = {}
+    for name in backends:
+        print(f"\n--- {name} ---")
+        embeddings = make_backend(name, args.model, args.batch_size, args.threads, args.batch_tokens)
+        measured[name] = measure(embeddings, chunks, queries, args.repeat)
+        print(f"{measured[name]['chunks_per_second']:.1f} chunks/s")
+
+    reference = measured['torch']
+    reference_top = top_k(reference['vectors'], reference['query_vectors'], args.k)
+    results = {'model': args.model, 'chunks': len(chunks), 'queries': len(queries), 'k': args.k,
+               'threads': args.threads, 'batch_size': args.batch_size, 'backends': {}}
+    for name, run in measured.items():
+        top = top_k(run['vectors'], run['query_vectors'], args.k)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(top, reference_top)])
+        cosine = np.sum(normalize(run['vectors']) * normalize(reference['vectors']), axis=1)
+        results['backends'][name] = {
+            'seconds': run['seconds'],
+            'chunks_per_second': run['chunks_per_second'],
+            'speedup': run['chunks_per_second'] / reference['chunks_per_second'],
+            f'recall_at_{args.k}': float(recall),
+            'mean_cosine_to_torch': float(cosine.mean()),
+            'min_cosine_to_torch': float(cosine.min()),
+        }
+
+    print(f"\n{'Backend':<12}{'Chunks/s':>10}{'Speed-up':>10}{f'Recall@{args.k}':>11}{'Mean cos':>10}{'Min cos':>10}")
+    for name, row in results['backends'].items():
+        print(f"{name:<12}{row['chunks_per_second']:>10.1f}{row['speedup']:>9.2f}x{row[f'recall_at_{args.k}']:>11.3f}"
+              f"{row['mean_cosine_to_torch']:>10.4f}{row['min_cosine_to_torch']:>10.4f}")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"embedding_backends_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to: {path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Local stand-ins for the Hugging Face Inference API and the Groq API, used
+by the load-test benchmark so it never spends API quota.
+
+FakeCoderAPI answers like the HF text-generation endpoint: the first
+`warmup_503` requests get a 503 "model is loading" response, after which
+each request takes `latency` seconds and returns a small calculation
+program for the observations in the prompt.
+
+FakeGroqAPI implements POST /openai/v1/chat/completions, with and without
+streaming: the first token arrives after `first_token_latency` seconds and
+each further token `token_interval` seconds later. Each completion has
+`tokens` tokens, or as many as `tokens_for(request body)` returns.
+"""
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OBSERVATIONS_PATTERN = re.compile(r"### OBSERVATIONS:\n(.*?)\n\n### CODE:", re.S)
+
+class _FakeServer:
+    def __init__(self):
+        self.requests = 0
+        self._lock = threading.Lock()
+        handler = type('Handler', (_Handler,), {'service': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next_request(self) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    def handle(self, handler, body: dict):
+        raise NotImplementedError
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real APIs
+    service = None
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = {}
+        self.service.handle(self, body)
+
+    def send_json(self, status: int, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output readable
+
+class FakeCoderAPI(_FakeServer):
+    def __init__(self, latency: float = 1.0, warmup_503: int = 0, estimated_time: float = 0.5):
+        super().__init__()
+        self.latency = latency
+        self.warmup_503 = warmup_503
+        self.estimated_time = estimated_time
+        self.loading_responses = 0
+
+    def handle(self, handler, body: dict):
+        number = self._next_request()
+        if number <= self.warmup_503:
+            with self._lock:
+                self.loading_responses += 1
+            handler.send_json(503, {'error': "Model is currently loading", 'estimated_time': self.estimated_time})
+            return
+
+        time.sleep(self.latency)
+        prompt = body.get('inputs', '')
+        handler.send_json(200, [{'generated_text': prompt + self.program_for(prompt)}])
+
+    @staticmethod
+    def program_for(prompt: str) -> str:
+        match = OBSERVATIONS_PATTERN.search(prompt)
+        try:
+            observations = json.loads(match.group(1)) if match else {}
+        except ValueError:
+            observations = {}
+        readings = observations.get('readings', []) if isinstance(observations, dict) else []
+        return (
+            "import statistics\n"
+            f"readings = {readings!r}\n"
+            "values = [reading['value'] for reading in readings]\n"
+            "print(f'Number of readings: {len(values)}')\n"
+            "print(f'Mean value: {statistics.mean(values) if values else 0:.4f}')\n"
+        )
+
+class FakeGroqAPI(_FakeServer):
+    def __init__(self, first_token_latency: float = 0.5, token_interval: float = 0.005, tokens: int = 300,
+                 tokens_for=None):
+        super().__init__()
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.tokens = tokens
+        self.tokens_for = tokens_for
+
+    @staticmethod
+    def _report_tokens(count: int) -> list:
+        words = ["Aim:", "To", "determine", "the", "mean", "value", "of", "the", "readings.", "Theory:"]
+        return [words[i % len(words)] + " " for i in range(count)]
+
+    def handle(self, handler, body: dict):
+        self._next_request()
+        if not handler.path.endswith('/chat/completions'):
+            handler.send_json(404, {'error': {'message': f"Unknown path {handler.path}"}})
+            return
+
+        count = self.tokens_for(body) if self.tokens_for is not None else self.tokens
+        prompt_tokens = sum(len(message.get('content', '').split()) for message in body.get('messages', []))
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': count, 'total_tokens': prompt_tokens + count}
+        model = body.get('model', 'fake-model')
+        tokens = self._report_tokens(count)
+
+        if not body.get('stream'):
+            time.sleep(self.first_token_latency + self.token_interval * max(0, count - 1))
+            handler.send_json(200, {
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': "".join(tokens)}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        # Server-sent events without a Content-Length; the connection is
+        # closed at the end of the stream.
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.close_connection = True
+
+        def send(payload):
+            handler.wfile.write(f"data: {payload}\n\n".encode('utf-8'))
+            handler.wfile.flush()
+
+        chunk = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model}
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_interval)
+            send(json.dumps(dict(chunk, choices=[{'index': 0, 'delta': {'content': token}, 'finish_reason': None}])))
+        send(json.dumps(dict(chunk, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                             x_groq={'id': 'req-fake', 'usage': usage})))
+        send("[DONE]")
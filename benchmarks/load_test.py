@@ -0,0 +1,301 @@
+"""
+End-to-end load test of the report pipeline against local stand-ins for
+the Hugging Face Inference API and Groq (see benchmarks/fake_apis.py).
+
+Generates synthetic PDF, DOCX and TXT manuals of varying size, serves
+create_app() on a local port, and sends concurrent uploads to
+/generate/stream. Stage durations are measured from the streamed stage
+events, and p50/p95/p99 latency per stage plus overall reports per second
+are saved as JSON for comparison between runs.
+
+All caches live in a temporary directory and are empty at the start; the
+generated-code cache and program library are off unless --caches is given,
+so every request reaches the (fake) coder model.
+
+Usage:
+    python benchmarks/load_test.py --requests 40 --concurrency 8
+    python benchmarks/load_test.py --coder-latency 2 --warmup-503 5 --formats pdf
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from benchmarks.fake_apis import FakeCoderAPI, FakeGroqAPI
+
+# Elapsed time of each stage, from the stream events that end it.
+STAGES = (
+    ('extract', None, 'extracted'),
+    ('retrieve', 'extracted', 'retrieved'),
+    ('coder', 'retrieved', 'code_generated'),
+    ('execute', 'code_generated', 'code_executed'),
+    ('report_first_token', 'code_executed', 'first_token'),
+    ('report', 'code_executed', 'done'),
+    ('total', None, 'done'),
+)
+STAGE_END_EVENTS = {stage: end for stage, _, end in STAGES}
+
+# Pages (PDF) or equivalent amounts of text (DOCX, TXT) per manual size.
+SIZES = {'small': 2, 'medium': 12, 'large': 40}
+
+WORDS = ("specimen measured apparatus gauge vernier reading error voltage current resistance "
+         "pendulum oscillation frequency wavelength calibrated mean deviation sample observed "
+         "temperature pressure volume density surface finish spindle feed depth cutter").split()
+
+# --- Synthetic manuals ---
+
+def manual_pages(rng: random.Random, pages: int) -> list:
+    texts = []
+    for page in range(pages):
+        lines = []
+        if page == 0:
+            lines += ["Aim: To determine the mean value of a set of readings.",
+                      "Theory: The mean of n readings is their sum divided by n.",
+                      "Apparatus: Measuring instrument, specimen, data sheet.",
+                      "Procedure: Take the readings, tabulate them and compute the mean."]
+        for _ in range(45):
+            lines.append(" ".join(rng.choice(WORDS) for _ in range(12)))
+        texts.append("\n".join(lines))
+    return texts
+
+def make_pdf(pages: list) -> bytes:
+    # A minimal PDF with one Helvetica text stream per page.
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} "
+                   "/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> >>")
+    for i, text in enumerate(pages):
+        lines = " ".join(f"({line.replace('(', '').replace(')', '')}) '" for line in text.split("\n"))
+        stream = f"BT /F1 9 Tf 40 760 Td 11 TL {lines} ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{obj}\nendobj\n".encode('latin-1')
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    out += b"".join(f"{offset:010d} 00000 n \n".encode('latin-1') for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    return out
+
+def make_docx(pages: list) -> bytes:
+    import docx
+    document = docx.Document()
+    for text in pages:
+        for line in text.split("\n"):
+            document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+def make_manuals(count: int, formats: list, sizes: list, seed: int) -> list:
+    # Every manual has its own text, so no request is served from another's cache.
+    rng = random.Random(seed)
+    manuals = []
+    for i in range(count):
+        file_format, size = formats[i % len(formats)], sizes[(i // len(formats)) % len(sizes)]
+        pages = manual_pages(rng, SIZES[size])
+        if file_format == 'pdf':
+            data = make_pdf(pages)
+        elif file_format == 'docx':
+            data = make_docx(pages)
+        else:
+            data = "\n\n".join(pages).encode('utf-8')
+        observations = {'readings': [{'trial': t + 1, 'value': round(rng.uniform(1, 10), 3)} for t in range(rng.randint(3, 8))]}
+        manuals.append({'filename': f"manual_{i}.{file_format}", 'format': file_format, 'size': size,
+                        'data': data, 'observations': json.dumps(observations)})
+    return manuals
+
+# --- Load generation ---
+
+def run_request(base_url: str, manual: dict, timeout: float) -> dict:
+    events = {}
+    start = time.perf_counter()
+    try:
+        response = requests.post(
+            f"{base_url}/generate/stream",
+            files={'manual_file': (manual['filename'], manual['data'])},
+            data={'observations': manual['observations']},
+            stream=True, timeout=timeout,
+        )
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith('event: '):
+                event = line[len('event: '):]
+            elif line.startswith('data: '):
+                now = time.perf_counter() - start
+                data = json.loads(line[len('data: '):])
+                if event == 'stage':
+                    events[data['stage']] = now
+                elif event == 'token':
+                    events.setdefault('first_token', now)
+                elif event == 'done':
+                    events['done'] = now
+                elif event == 'error':
+                    return {'error': data.get('error'), 'events': events}
+        if 'done' not in events:
+            return {'error': "stream ended before the report was done", 'events': events}
+    except requests.RequestException as e:
+        return {'error': str(e), 'events': events}
+    return {'events': events, 'start': start}
+
+def stage_durations(events: dict) -> dict:
+    durations = {}
+    for stage, begin, end in STAGES:
+        if end in events and (begin is None or begin in events):
+            durations[stage] = events[end] - (events[begin] if begin else 0.0)
+    return durations
+
+def summarize(values: list) -> dict:
+    array = np.asarray(values)
+    return {
+        'count': int(array.size),
+        'mean': float(array.mean()),
+        'p50': float(np.percentile(array, 50)),
+        'p95': float(np.percentile(array, 95)),
+        'p99': float(np.percentile(array, 99)),
+        'max': float(array.max()),
+    }
+
+def completion_rate(end_times: list) -> float:
+    # Items per second leaving a stage, between its first and last completion.
+    if len(end_times) < 2:
+        return 0.0
+    window = max(end_times) - min(end_times)
+    return (len(end_times) - 1) / window if window > 0 else 0.0
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end load test with fake HF and Groq servers.")
+    parser.add_argument('--requests', type=int, default=24)
+    parser.add_argument('--concurrency', type=int, default=6)
+    parser.add_argument('--formats', nargs='+', default=['pdf', 'docx', 'txt'], choices=['pdf', 'docx', 'txt'])
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium', 'large'], choices=list(SIZES))
+    parser.add_argument('--coder-latency', type=float, default=1.0, help="Seconds the fake coder API takes per request")
+    parser.add_argument('--warmup-503', type=int, default=3, help="Requests answered with 503 'model loading' first")
+    parser.add_argument('--report-first-token', type=float, default=0.5, help="Seconds until the fake Groq API sends the first token")
+    parser.add_argument('--report-tokens', type=int, default=300)
+    parser.add_argument('--token-interval', type=float, default=0.005)
+    parser.add_argument('--caches', action='store_true', help="Enable the generated-code cache and program library")
+    parser.add_argument('--embedding-model', default=None, help="Embedding model name or local path")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(project_root, 'benchmarks', 'results'))
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    coder_api = FakeCoderAPI(latency=args.coder_latency, warmup_503=args.warmup_503).start()
+    groq_api = FakeGroqAPI(first_token_latency=args.report_first_token, token_interval=args.token_interval,
+                           tokens=args.report_tokens).start()
+
+    # The coder reads HF_API_TOKEN when it is imported, and the Groq client
+    # reads the environment when it is created, so the environment has to
+    # point at the fake servers before the app is loaded.
+    os.environ['GROQ_API_KEY'] = 'fake-key'
+    os.environ['GROQ_BASE_URL'] = groq_api.url
+    os.environ['HF_API_TOKEN'] = 'fake-token'
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from config import Config
+    from app import create_app
+
+    work_dir = tempfile.mkdtemp(prefix='lab_report_load_test_')
+    overrides = {
+        'CODER_BACKEND': 'api',
+        'CODER_API_URL': f"{coder_api.url}/models/fake-coder",
+        'CODE_CACHE_ENABLED': args.caches,
+        'CODE_CACHE_PATH': os.path.join(work_dir, 'code_cache.sqlite'),
+        'PROGRAM_LIBRARY_ENABLED': args.caches,
+        'PROGRAM_LIBRARY_PATH': os.path.join(work_dir, 'programs.sqlite'),
+        'INDEX_CACHE_DIR': os.path.join(work_dir, 'indexes'),
+        'EMBEDDING_CACHE_DIR': os.path.join(work_dir, 'embeddings'),
+    }
+    if args.embedding_model:
+        overrides['EMBEDDING_MODEL_NAME'] = args.embedding_model
+    app = create_app(type('LoadTestConfig', (Config,), overrides))
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    manuals = make_manuals(args.requests, args.formats, args.sizes, args.seed)
+    print(f"Sending {len(manuals)} requests ({', '.join(args.formats)}; {', '.join(args.sizes)}) "
+          f"with concurrency {args.concurrency}...")
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda manual: run_request(base_url, manual, args.timeout), manuals))
+        wall_seconds = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        coder_api.stop()
+        groq_api.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    per_stage = {stage: [] for stage, _, _ in STAGES}
+    stage_ends = {stage: [] for stage, _, _ in STAGES}
+    per_format = {}
+    errors = []
+    for manual, result in zip(manuals, results):
+        if 'error' in result:
+            errors.append({'manual': manual['filename'], 'error': result['error']})
+            continue
+        for stage, seconds in stage_durations(result['events']).items():
+            per_stage[stage].append(seconds)
+            stage_ends[stage].append(result['start'] + result['events'][STAGE_END_EVENTS[stage]])
+        per_format.setdefault(f"{manual['format']}/{manual['size']}", []).append(result['events']['done'])
+
+    completed = len(results) - len(errors)
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'wall_seconds': wall_seconds,
+        'completed': completed,
+        'errors': errors,
+        'reports_per_second': completed / wall_seconds if wall_seconds else 0.0,
+        'stages': {stage: dict(summarize(values), per_second=completion_rate(stage_ends[stage]))
+                   for stage, values in per_stage.items() if values},
+        'total_by_manual': {key: summarize(values) for key, values in sorted(per_format.items())},
+        'fake_apis': {'coder_requests': coder_api.requests, 'coder_loading_responses': coder_api.loading_responses,
+                      'groq_requests': groq_api.requests},
+    }
+
+    print(f"\nCompleted {completed}/{len(results)} reports in {wall_seconds:.1f}s "
+          f"({report['reports_per_second']:.2f} reports/s)")
+    print(f"{'Stage':<20}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'per s':>9}")
+    for stage, stats in report['stages'].items():
+        print(f"{stage:<20}{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['p99']:>9.3f}{stats['max']:>9.3f}"
+              f"{stats['per_second']:>9.2f}")
+    for error in errors[:5]:
+        print(f"ERROR {error['manual']}: {error['error']}")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to: {path}")
+
+if __name__ == '__main__':
+    main()
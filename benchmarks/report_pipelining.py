@@ -0,0 +1,164 @@
+"""
+Benchmarks end-to-end report latency of the serial and the pipelined
+report modes (REPORT_PIPELINED), against the local stand-ins for the
+Hugging Face Inference API and Groq in benchmarks/fake_apis.py.
+
+Every run goes through app.pipeline with the same manual chunks and
+observations. The retrieval stage is skipped (the chunks are passed in)
+and the code cache and program library are off, so each run calls the
+coder model, executes the code in the sandbox and writes the report:
+- serial: one Groq call for the whole report after the code has run
+- pipelined: the context-only sections are drafted while the code is
+  generated and run; the rest follows in a second call
+
+The fake Groq API answers the full report with --report-tokens tokens,
+and the draft and completion calls with --draft-tokens and
+--completion-tokens. It charges the same first-token latency for every
+call, whatever the prompt length.
+
+Usage:
+    python benchmarks/report_pipelining.py
+    python benchmarks/report_pipelining.py --runs 20 --coder-latency 2 --stream
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from benchmarks.fake_apis import FakeCoderAPI, FakeGroqAPI
+from benchmarks.load_test import manual_pages
+
+MODES = {'serial': False, 'pipelined': True}
+
+OBSERVATIONS = json.dumps({'readings': [{'trial': i + 1, 'value': round(2.0 + 0.1 * i, 2)} for i in range(8)]})
+
+def run_once(pipeline, document_text: str, rag_chunks: list, pipelined: bool, stream: bool) -> dict:
+    start = time.perf_counter()
+    first_token = None
+    report = None
+    for stage, data in pipeline.iter_pipeline(document_text, OBSERVATIONS, stream_report=stream,
+                                              rag_chunks=rag_chunks, pipelined=pipelined):
+        if stage == 'report_token' and first_token is None:
+            first_token = time.perf_counter() - start
+        elif stage == 'report_written':
+            report = data['report']
+    return {'seconds': time.perf_counter() - start, 'first_token_seconds': first_token, 'report': report}
+
+def summarize(values: list) -> dict:
+    values = sorted(values)
+    return {
+        'mean': statistics.mean(values),
+        'p50': statistics.median(values),
+        'p95': values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))],
+        'min': values[0],
+        'max': values[-1],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serial against pipelined report writing.")
+    parser.add_argument('--runs', type=int, default=10, help="Reports per mode")
+    parser.add_argument('--stream', action='store_true', help="Stream the report and record the first-token time")
+    parser.add_argument('--coder-latency', type=float, default=1.0, help="Seconds the fake coder API takes per request")
+    parser.add_argument('--report-first-token', type=float, default=0.5, help="Seconds until the fake Groq API sends the first token")
+    parser.add_argument('--report-tokens', type=int, default=400, help="Tokens of a report written in one call")
+    parser.add_argument('--draft-tokens', type=int, default=240, help="Tokens of the drafted first sections")
+    parser.add_argument('--completion-tokens', type=int, default=180, help="Tokens of the completed last sections")
+    parser.add_argument('--token-interval', type=float, default=0.005)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(project_root, 'benchmarks', 'results'))
+    args = parser.parse_args()
+
+    def tokens_for(body: dict) -> int:
+        prompt = " ".join(message.get('content', '') for message in body.get('messages', []))
+        if "write the first part of" in prompt:
+            return args.draft_tokens
+        if "write the final part of" in prompt:
+            return args.completion_tokens
+        return args.report_tokens
+
+    coder_api = FakeCoderAPI(latency=args.coder_latency).start()
+    groq_api = FakeGroqAPI(first_token_latency=args.report_first_token, token_interval=args.token_interval,
+                           tokens_for=tokens_for).start()
+
+    # As in the load test, the environment must point at the fake servers
+    # before the app is loaded.
+    os.environ['GROQ_API_KEY'] = 'fake-key'
+    os.environ['GROQ_BASE_URL'] = groq_api.url
+    os.environ['HF_API_TOKEN'] = 'fake-token'
+
+    from config import Config
+    from app import create_app, pipeline
+    from rag_components import chunker
+    from rag_components.vector_store import CHUNK_OVERLAP, CHUNK_SIZE
+
+    work_dir = tempfile.mkdtemp(prefix='lab_report_pipelining_')
+    overrides = {
+        'CODER_BACKEND': 'api',
+        'CODER_API_URL': f"{coder_api.url}/models/fake-coder",
+        'CODE_CACHE_ENABLED': False,
+        'PROGRAM_LIBRARY_ENABLED': False,
+        'INDEX_CACHE_DIR': os.path.join(work_dir, 'indexes'),
+        'EMBEDDING_CACHE_DIR': os.path.join(work_dir, 'embeddings'),
+        'MANUAL_LIBRARY_DIR': os.path.join(work_dir, 'manuals'),
+        # Retrieval is skipped, so the embedding model is never needed.
+        'EMBEDDING_WARMUP': False,
+        'PREWARM_ENABLED': False,
+    }
+    create_app(type('PipeliningBenchmarkConfig', (Config,), overrides))
+
+    document_text = "\n".join(manual_pages(random.Random(args.seed), 12))
+    rag_chunks = chunker.split_text(document_text, CHUNK_SIZE, CHUNK_OVERLAP)[:pipeline.CONTEXT_CANDIDATES]
+
+    runs = {mode: [] for mode in MODES}
+    groq_requests = {mode: 0 for mode in MODES}
+    try:
+        # One warm-up report per mode: connection setup and sandbox start.
+        for pipelined in MODES.values():
+            run_once(pipeline, document_text, rag_chunks, pipelined, args.stream)
+        # Modes alternate, so that drift on the machine affects both alike.
+        for _ in range(args.runs):
+            for mode, pipelined in MODES.items():
+                before = groq_api.requests
+                runs[mode].append(run_once(pipeline, document_text, rag_chunks, pipelined, args.stream))
+                groq_requests[mode] += groq_api.requests - before
+    finally:
+        coder_api.stop()
+        groq_api.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {'config': {key: value for key, value in vars(args).items() if key != 'output'}, 'modes': {}}
+    for mode, mode_runs in runs.items():
+        results['modes'][mode] = {
+            'seconds': summarize([run['seconds'] for run in mode_runs]),
+            'groq_requests_per_report': groq_requests[mode] / len(mode_runs),
+            'report_characters': statistics.mean(len(run['report']) for run in mode_runs),
+        }
+        if args.stream:
+            results['modes'][mode]['first_token_seconds'] = summarize([run['first_token_seconds'] for run in mode_runs])
+    serial, pipelined = results['modes']['serial'], results['modes']['pipelined']
+    results['speedup_p50'] = serial['seconds']['p50'] / pipelined['seconds']['p50']
+
+    print(f"\n{'Mode':<12}{'p50':>9}{'p95':>9}{'mean':>9}" + (f"{'1st tok':>9}" if args.stream else "") + f"{'Groq/req':>10}")
+    for mode, row in results['modes'].items():
+        first_token = f"{row['first_token_seconds']['p50']:>9.3f}" if args.stream else ""
+        print(f"{mode:<12}{row['seconds']['p50']:>9.3f}{row['seconds']['p95']:>9.3f}{row['seconds']['mean']:>9.3f}"
+              f"{first_token}{row['groq_requests_per_report']:>10.1f}")
+    print(f"Pipelined reports finish {results['speedup_p50']:.2f}x faster (p50).")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"report_pipelining_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to: {path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmarks batch ROUGE scoring against the per-pair path.
+
+Scores a set of candidate reports (perturbed copies of the golden reports
+in evaluation/eval_dataset.jsonl) with calculate_rouge_scores one pair at a
+time, then with score_batch in-process and across a process pool, and
+checks that all three agree.
+
+Usage:
+    python benchmarks/rouge_scoring.py --candidates 2000
+    python benchmarks/rouge_scoring.py --candidates 5000 --processes 8
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from evaluation.metrics import F1, calculate_rouge_scores, score_batch
+
+def make_candidates(references: list, count: int, seed: int) -> tuple:
+    # Each candidate drops, repeats and reorders parts of a golden report,
+    # so scores spread over the whole range like real prompt-sweep outputs.
+    rng = random.Random(seed)
+    targets, candidates = [], []
+    for i in range(count):
+        reference = references[i % len(references)]
+        words = reference.split()
+        kept = [word for word in words if rng.random() > 0.3]
+        for _ in range(len(kept) // 20):
+            a, b = rng.randrange(len(kept)), rng.randrange(len(kept))
+            kept[a], kept[b] = kept[b], kept[a]
+        targets.append(reference)
+        candidates.append(" ".join(kept + rng.sample(words, min(len(words), 30))))
+    return targets, candidates
+
+def time_call(fn) -> tuple:
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch ROUGE scoring.")
+    parser.add_argument('--candidates', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join(project_root, 'benchmarks', 'results'))
+    args = parser.parse_args()
+
+    with open(os.path.join(project_root, 'evaluation', 'eval_dataset.jsonl'), 'r') as f:
+        references = [json.loads(line)['golden_report'] for line in f]
+    targets, candidates = make_candidates(references, args.candidates, args.seed)
+    words = sum(len(candidate.split()) for candidate in candidates) / len(candidates)
+    print(f"Scoring {len(candidates)} candidates (~{words:.0f} words each) against {len(references)} references.")
+
+    per_pair, per_pair_seconds = time_call(
+        lambda: [calculate_rouge_scores(target, candidate) for target, candidate in zip(targets, candidates)]
+    )
+    serial, serial_seconds = time_call(lambda: score_batch(targets, candidates, processes=1))
+    pooled, pooled_seconds = time_call(lambda: score_batch(targets, candidates, processes=args.processes))
+
+    max_difference = 0.0
+    for rouge_type, key in (('rouge1', 'rouge1_f1'), ('rouge2', 'rouge2_f1'), ('rougeL', 'rougeL_f1')):
+        expected = np.array([scores[key] for scores in per_pair])
+        for batch in (serial, pooled):
+            max_difference = max(max_difference, float(np.abs(batch[rouge_type][:, F1] - expected).max()))
+
+    results = {
+        'candidates': len(candidates),
+        'processes': args.processes,
+        'per_pair_seconds': per_pair_seconds,
+        'batch_serial_seconds': serial_seconds,
+        'batch_pool_seconds': pooled_seconds,
+        'per_pair_pairs_per_second': len(candidates) / per_pair_seconds,
+        'batch_serial_pairs_per_second': len(candidates) / serial_seconds,
+        'batch_pool_pairs_per_second': len(candidates) / pooled_seconds,
+        'max_f1_difference': max_difference,
+    }
+
+    print(f"\n{'Path':<26}{'Seconds':>10}{'Pairs/s':>12}{'Speed-up':>10}")
+    for label, seconds in (('per pair (RougeScorer)', per_pair_seconds),
+                           ('batch, in-process', serial_seconds),
+                           (f'batch, {args.processes} processes', pooled_seconds)):
+        print(f"{label:<26}{seconds:>10.2f}{len(candidates) / seconds:>12.0f}{per_pair_seconds / seconds:>9.1f}x")
+    print(f"\nLargest F1 difference from RougeScorer: {max_difference:.2e}")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"rouge_scoring_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to: {path}")
+
+if __name__ == '__main__':
+    main()
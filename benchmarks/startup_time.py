@@ -0,0 +1,161 @@
+"""
+Benchmarks application startup.
+
+Runs each scenario in a fresh interpreter with `python -X importtime` and
+records the wall time until it is ready, plus the import time of every
+module: which project modules are slow to import, and whether the heavy
+ML and document libraries (torch, sentence-transformers, LangChain, faiss,
+PyPDF2, python-docx, groq) were loaded at all.
+
+Scenarios:
+    create_app   - build the Flask app, as run.py and WSGI servers do
+    evaluation   - import the evaluation CLI
+    packages     - import the rag_components and models packages
+
+By default pre-warming and the embedding warm-up are turned off, so the
+numbers are what a worker pays before it can serve. With --prewarm the
+app's own settings apply and the time until pre-warming finishes is
+recorded as well. (Imports made by the pre-warm thread are not always
+reported by -X importtime, so the per-module numbers cover the main
+thread.)
+
+Usage:
+    python benchmarks/startup_time.py
+    python benchmarks/startup_time.py --repeat 5 --top 25
+    python benchmarks/startup_time.py --scenario create_app --prewarm
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SCENARIOS = {
+    'create_app': "from app import create_app; create_app()",
+    'evaluation': "import evaluation.evaluate",
+    'packages': "import rag_components, models",
+}
+
+HEAVY_PACKAGES = (
+    'torch', 'transformers', 'sentence_transformers', 'langchain', 'langchain_core',
+    'langchain_community', 'langchain_text_splitters', 'faiss', 'PyPDF2', 'docx', 'groq',
+)
+
+PROJECT_PACKAGES = ('app', 'models', 'rag_components', 'evaluation', 'telemetry', 'config')
+
+# Runs the scenario in the child interpreter and reports its timings on stdout.
+CHILD = """
+import sys, time, json
+start = time.perf_counter()
+exec(compile(sys.argv[1], '<scenario>', 'exec'))
+ready = time.perf_counter() - start
+if 'app.prewarm' in sys.modules:
+    sys.modules['app.prewarm'].wait()
+print('STARTUP_RESULT ' + json.dumps({'ready_seconds': ready, 'warm_seconds': time.perf_counter() - start}))
+"""
+
+def parse_importtime(stderr: str) -> dict:
+    # module name -> (self seconds, cumulative seconds)
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            modules[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+        except ValueError:
+            continue
+    return modules
+
+def run_once(code: str, prewarm: bool) -> tuple:
+    env = dict(os.environ, PYTHONPATH=project_root)
+    if not prewarm:
+        env.update(PREWARM_ENABLED='false', EMBEDDING_WARMUP='false')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD, code],
+        cwd=project_root, env=env, capture_output=True, text=True,
+    )
+    result = None
+    for line in completed.stdout.splitlines():
+        if line.startswith('STARTUP_RESULT '):
+            result = json.loads(line[len('STARTUP_RESULT '):])
+    if completed.returncode != 0 or result is None:
+        raise RuntimeError(f"Scenario failed (exit code {completed.returncode}):\n{completed.stderr[-2000:]}")
+    return result, parse_importtime(completed.stderr)
+
+def run_scenario(code: str, repeat: int, prewarm: bool) -> dict:
+    runs = [run_once(code, prewarm) for _ in range(repeat)]
+    timings = [timing for timing, _ in runs]
+
+    # Median import time of each module over the runs that loaded it.
+    per_module = {}
+    for _, modules in runs:
+        for name, times in modules.items():
+            per_module.setdefault(name, []).append(times)
+    modules = {
+        name: {
+            'self_seconds': statistics.median(self_seconds for self_seconds, _ in times),
+            'cumulative_seconds': statistics.median(cumulative for _, cumulative in times),
+        }
+        for name, times in per_module.items()
+    }
+
+    return {
+        'ready_seconds': statistics.median(timing['ready_seconds'] for timing in timings),
+        'warm_seconds': statistics.median(timing['warm_seconds'] for timing in timings),
+        'modules_imported': len(modules),
+        'heavy_packages': {name: modules[name]['cumulative_seconds'] for name in HEAVY_PACKAGES if name in modules},
+        'project_modules': {
+            name: stats['cumulative_seconds'] for name, stats in sorted(modules.items())
+            if name.split('.')[0] in PROJECT_PACKAGES
+        },
+        'modules': modules,
+    }
+
+def print_scenario(name: str, result: dict, top: int, prewarm: bool):
+    print(f"\n=== {name} ===")
+    print(f"Ready after {result['ready_seconds']:.2f}s ({result['modules_imported']} modules imported)")
+    if prewarm:
+        print(f"Pre-warming finished after {result['warm_seconds']:.2f}s")
+
+    heavy = result['heavy_packages']
+    print("Heavy packages loaded: " + (", ".join(f"{package} ({seconds:.2f}s)" for package, seconds in heavy.items()) or "none"))
+
+    print(f"\n{'Project module':<36}{'Cumulative':>12}")
+    for module, seconds in sorted(result['project_modules'].items(), key=lambda item: -item[1]):
+        print(f"{module:<36}{seconds:>11.3f}s")
+
+    print(f"\n{'Slowest modules (self time)':<48}{'Self':>10}{'Cumulative':>12}")
+    slowest = sorted(result['modules'].items(), key=lambda item: -item[1]['self_seconds'])[:top]
+    for module, stats in slowest:
+        print(f"{module:<48}{stats['self_seconds']:>9.3f}s{stats['cumulative_seconds']:>11.3f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark application startup and import times.")
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), action='append',
+                        help="Scenario to run (repeatable; default: all).")
+    parser.add_argument('--repeat', type=int, default=3, help="Fresh interpreters per scenario; the median is reported.")
+    parser.add_argument('--top', type=int, default=15, help="Slowest modules to list per scenario.")
+    parser.add_argument('--prewarm', action='store_true', help="Keep the app's pre-warming settings and wait for it.")
+    parser.add_argument('--output', default=os.path.join(project_root, 'benchmarks', 'results'))
+    args = parser.parse_args()
+
+    scenarios = args.scenario or list(SCENARIOS)
+    results = {'repeat': args.repeat, 'prewarm': args.prewarm, 'scenarios': {}}
+    for name in scenarios:
+        result = run_scenario(SCENARIOS[name], args.repeat, args.prewarm)
+        results['scenarios'][name] = result
+        print_scenario(name, result, args.top, args.prewarm)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"startup_time_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to: {path}")
+
+if __name__ == '__main__':
+    main()
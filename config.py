@@ -7,6 +7,13 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 # Load environment variables from the .env file
 load_dotenv(os.path.join(basedir, '.env'))
 
+def _env_bool(name, default):
+    # Interprets common truthy strings ("1", "true", "yes", "on") from the environment.
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
 class Config:
     """
     Sets the configuration variables for the Flask application.
@@ -33,6 +40,261 @@ class Config:
     # The path to the folder containing the fine-tuned coder model adapter.
     # This path is relative to the project's root directory.
     CODER_MODEL_PATH = os.path.join(basedir, 'finetuned_model')
-    
-    # The path to the folder where user-uploaded files will be temporarily stored.
-    UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
\ No newline at end of file
+
+    # --- Coder Model Backend ---
+
+    # 'api' calls the Hugging Face Inference API; 'local' loads the coder
+    # model once into this process and runs it on the CPU.
+    CODER_BACKEND = os.environ.get('CODER_BACKEND') or 'api'
+
+    # Use the API when the local model cannot be loaded or fails to generate.
+    CODER_FALLBACK_TO_API = _env_bool('CODER_FALLBACK_TO_API', True)
+
+    # The model loaded by the local backend: a merged model folder, the LoRA
+    # adapter in CODER_MODEL_PATH, or a Hugging Face Hub model id.
+    CODER_LOCAL_MODEL = os.environ.get('CODER_LOCAL_MODEL') or (
+        CODER_MODEL_PATH if os.path.isdir(CODER_MODEL_PATH) else 'Barghav777/phi3-lab-report-coder'
+    )
+
+    # The base model a LoRA adapter is applied to.
+    CODER_LOCAL_BASE_MODEL = os.environ.get('CODER_LOCAL_BASE_MODEL') or 'microsoft/Phi-3-mini-4k-instruct'
+
+    # Quantize the local model's Linear layers to int8 (faster, slightly less accurate).
+    CODER_LOCAL_QUANTIZE_INT8 = _env_bool('CODER_LOCAL_QUANTIZE_INT8', False)
+
+    # PyTorch intra-op threads for local inference (empty = PyTorch default).
+    CODER_LOCAL_THREADS = int(os.environ['CODER_LOCAL_THREADS']) if os.environ.get('CODER_LOCAL_THREADS') else None
+
+    # Run custom modeling code from the local model's repository. Only enable
+    # this for repositories you trust; Phi-3 does not need it.
+    CODER_LOCAL_TRUST_REMOTE_CODE = _env_bool('CODER_LOCAL_TRUST_REMOTE_CODE', False)
+
+    # --- Coder API Client ---
+
+    # Inference endpoint of the coder model. Point this at another
+    # deployment (or a local stand-in for load tests) to override the
+    # Hugging Face Inference API. The Groq client reads GROQ_BASE_URL the
+    # same way.
+    CODER_API_URL = os.environ.get('CODER_API_URL')
+
+    # Seconds to establish a connection to the Hugging Face Inference API.
+    CODER_API_CONNECT_TIMEOUT = float(os.environ.get('CODER_API_CONNECT_TIMEOUT') or 5)
+
+    # Seconds to wait for a single API response.
+    CODER_API_READ_TIMEOUT = float(os.environ.get('CODER_API_READ_TIMEOUT') or 60)
+
+    # Total seconds the code generation stage may take, retries included.
+    CODER_API_DEADLINE = float(os.environ.get('CODER_API_DEADLINE') or 90)
+
+    # Attempts before giving up on a loading or overloaded model.
+    CODER_API_MAX_ATTEMPTS = int(os.environ.get('CODER_API_MAX_ATTEMPTS') or 6)
+
+    # Keep-alive connections kept open to the API.
+    CODER_API_POOL_SIZE = int(os.environ.get('CODER_API_POOL_SIZE') or 10)
+
+    # --- Report Writing ---
+
+    # Draft the report sections that only need the manual (aim, theory,
+    # apparatus, procedure) while the calculation code is generated and run,
+    # then write the observations, results and conclusion in a second call.
+    # Lowers latency at the cost of two Groq calls per report.
+    REPORT_PIPELINED = _env_bool('REPORT_PIPELINED', False)
+
+    # --- Generated Code Cache ---
+
+    # Reuse generated code for identical context and observations (compared
+    # with sorted keys and normalized numbers).
+    CODE_CACHE_ENABLED = _env_bool('CODE_CACHE_ENABLED', True)
+
+    # The SQLite file holding the cached code.
+    CODE_CACHE_PATH = os.environ.get('CODE_CACHE_PATH') or os.path.join(basedir, 'cache', 'code_cache.sqlite')
+
+    # Seconds after which a cached entry expires.
+    CODE_CACHE_TTL = float(os.environ.get('CODE_CACHE_TTL') or 7 * 24 * 3600)
+
+    # Entries kept before the least recently used are evicted.
+    CODE_CACHE_MAX_ENTRIES = int(os.environ.get('CODE_CACHE_MAX_ENTRIES') or 5000)
+
+    # --- Program Library ---
+
+    # Reuse a program that already ran for the same manual and observation
+    # layout, substituting the new readings, instead of calling the coder.
+    PROGRAM_LIBRARY_ENABLED = _env_bool('PROGRAM_LIBRARY_ENABLED', True)
+
+    # The SQLite file holding the stored programs.
+    PROGRAM_LIBRARY_PATH = os.environ.get('PROGRAM_LIBRARY_PATH') or os.path.join(basedir, 'cache', 'programs.sqlite')
+
+    # --- Request Coalescing ---
+
+    # Identical coder and report requests that are in flight at the same
+    # time share a single upstream call.
+    SINGLE_FLIGHT_ENABLED = _env_bool('SINGLE_FLIGHT_ENABLED', True)
+
+    # --- Uploads ---
+
+    # The largest accepted request body, in bytes. Flask rejects bigger
+    # uploads with HTTP 413 before they are read.
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH') or 25 * 1024 * 1024)
+
+    # Uploads are processed in memory. Copies kept for queued jobs spill to
+    # a temporary file only above this size.
+    UPLOAD_SPOOL_MAX_MEMORY = int(os.environ.get('UPLOAD_SPOOL_MAX_MEMORY') or 8 * 1024 * 1024)
+
+    # --- Embedding Model ---
+
+    # The sentence-transformers model used to embed lab manual chunks. It is
+    # loaded once per process and shared by every request.
+    EMBEDDING_MODEL_NAME = os.environ.get('EMBEDDING_MODEL_NAME') or 'all-MiniLM-L6-v2'
+
+    # The device the embedding model runs on ('cpu', 'cuda', 'mps', ...).
+    EMBEDDING_DEVICE = os.environ.get('EMBEDDING_DEVICE') or 'cpu'
+
+    # How many chunks are encoded per forward pass.
+    EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE') or 32)
+
+    # 'torch' runs the model with sentence-transformers. 'onnx' exports it
+    # to ONNX once (needs onnxruntime) and runs it with ONNX Runtime.
+    EMBEDDING_BACKEND = (os.environ.get('EMBEDDING_BACKEND') or 'torch').lower()
+
+    # Run the int8-quantized ONNX model. It is where most of the CPU speed-up
+    # comes from, with near-identical retrieval results.
+    EMBEDDING_ONNX_QUANTIZE = _env_bool('EMBEDDING_ONNX_QUANTIZE', True)
+
+    # ONNX Runtime intra-op threads per forward pass (0 = one per core).
+    EMBEDDING_ONNX_THREADS = int(os.environ.get('EMBEDDING_ONNX_THREADS') or 0)
+
+    # Chunks are grouped by length into batches of at most this many padded
+    # tokens (and EMBEDDING_BATCH_SIZE chunks).
+    EMBEDDING_ONNX_BATCH_TOKENS = int(os.environ.get('EMBEDDING_ONNX_BATCH_TOKENS') or 8192)
+
+    # Where exported ONNX models are kept.
+    EMBEDDING_ONNX_DIR = os.environ.get('EMBEDDING_ONNX_DIR') or os.path.join(basedir, 'cache', 'onnx')
+
+    # Load the embedding model when the app is created instead of on the
+    # first request (in the background when PREWARM_ENABLED is set).
+    EMBEDDING_WARMUP = _env_bool('EMBEDDING_WARMUP', True)
+
+    # --- FAISS Index Cache ---
+
+    # Indexes are keyed by a hash of the manual text and the chunking and
+    # embedding settings, so a repeat manual skips embedding entirely.
+    INDEX_CACHE_ENABLED = _env_bool('INDEX_CACHE_ENABLED', True)
+
+    # The folder where cached indexes are saved.
+    INDEX_CACHE_DIR = os.environ.get('INDEX_CACHE_DIR') or os.path.join(basedir, 'cache', 'indexes')
+
+    # The disk budget for cached indexes. The least recently used indexes
+    # are evicted once it is exceeded.
+    INDEX_CACHE_MAX_BYTES = int(os.environ.get('INDEX_CACHE_MAX_BYTES') or 512 * 1024 * 1024)
+
+    # How many recently used indexes are kept loaded in memory.
+    INDEX_CACHE_MEMORY_ENTRIES = int(os.environ.get('INDEX_CACHE_MEMORY_ENTRIES') or 16)
+
+    # --- Manual Library ---
+
+    # Manuals uploaded to /manuals are extracted and indexed once and kept
+    # until deleted; report requests then name them by manual_id.
+    MANUAL_LIBRARY_ENABLED = _env_bool('MANUAL_LIBRARY_ENABLED', True)
+
+    # The folder holding the stored manuals and their registry (SQLite).
+    MANUAL_LIBRARY_DIR = os.environ.get('MANUAL_LIBRARY_DIR') or os.path.join(basedir, 'cache', 'manuals')
+
+    # How many recently used manuals are kept loaded in memory.
+    MANUAL_LIBRARY_MEMORY_ENTRIES = int(os.environ.get('MANUAL_LIBRARY_MEMORY_ENTRIES') or 16)
+
+    # --- Chunk Embedding Cache ---
+
+    # Embeddings are also cached per chunk, so an edited revision of a manual
+    # only re-embeds the chunks that actually changed.
+    EMBEDDING_CACHE_ENABLED = _env_bool('EMBEDDING_CACHE_ENABLED', True)
+
+    # The folder holding the chunk index (SQLite) and the vector matrix.
+    EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR') or os.path.join(basedir, 'cache', 'embeddings')
+
+    # --- Background Report Jobs ---
+
+    # How many report pipelines run concurrently in the background.
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 4)
+
+    # How many more jobs may wait for a free worker before POST /jobs starts
+    # rejecting submissions with 503.
+    JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE') or 32)
+
+    # How long (in seconds) finished job results are kept for polling.
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL') or 3600)
+
+    # --- Batch Generation ---
+
+    # Observation sets processed concurrently by one /generate/batch call.
+    BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS') or 4)
+
+    # Largest number of observation sets accepted in one batch.
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS') or 50)
+
+    # --- Context Packing ---
+
+    # Tokenizers used to count prompt tokens for each model (Hugging Face
+    # model id or local path). Leave the report tokenizer unset to estimate
+    # ~4 characters per token; Llama tokenizers are gated on the Hub.
+    CONTEXT_TOKENIZER_CODER = os.environ.get('CONTEXT_TOKENIZER_CODER') or CODER_LOCAL_BASE_MODEL
+    CONTEXT_TOKENIZER_REPORT = os.environ.get('CONTEXT_TOKENIZER_REPORT') or None
+
+    # Most tokens of retrieved manual text put into each prompt.
+    CONTEXT_BUDGET_CODER = int(os.environ.get('CONTEXT_BUDGET_CODER') or 2048)
+    CONTEXT_BUDGET_REPORT = int(os.environ.get('CONTEXT_BUDGET_REPORT') or 3000)
+
+    # Context window of the coder model; the coder budget shrinks so that
+    # the whole prompt plus the generated code fits in it.
+    CONTEXT_WINDOW_CODER = int(os.environ.get('CONTEXT_WINDOW_CODER') or 4096)
+
+    # Fraction of a chunk's 5-word shingles already packed above which the
+    # chunk is skipped as a near-duplicate.
+    CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get('CONTEXT_DUPLICATE_THRESHOLD') or 0.8)
+
+    # --- PDF Extraction ---
+
+    # Worker processes used to extract the pages of PDFs. A page that hangs
+    # past PDF_EXTRACT_TIMEOUT is abandoned and its worker stopped. Set to 0
+    # to extract in the request thread, where a single slow page can run on.
+    PDF_EXTRACT_WORKERS = int(os.environ.get('PDF_EXTRACT_WORKERS') or min(4, os.cpu_count() or 1))
+
+    # PDFs with fewer pages than this are extracted by one worker in a single
+    # batch rather than split across workers.
+    PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES') or 16)
+
+    # Pages beyond this limit are ignored.
+    PDF_MAX_PAGES = int(os.environ.get('PDF_MAX_PAGES') or 300)
+
+    # Seconds after which extraction stops and keeps the pages read so far.
+    PDF_EXTRACT_TIMEOUT = float(os.environ.get('PDF_EXTRACT_TIMEOUT') or 60)
+
+    # --- Code Execution Sandbox ---
+
+    # Warm worker processes that execute the generated calculation code.
+    SANDBOX_WORKERS = int(os.environ.get('SANDBOX_WORKERS') or 2)
+
+    # CPU seconds a single snippet may use.
+    SANDBOX_CPU_SECONDS = int(os.environ.get('SANDBOX_CPU_SECONDS') or 5)
+
+    # Wall-clock seconds a single snippet may take, including time spent sleeping.
+    SANDBOX_WALL_SECONDS = float(os.environ.get('SANDBOX_WALL_SECONDS') or 10)
+
+    # Memory (in MB) a snippet may allocate on top of the worker's baseline.
+    SANDBOX_MEMORY_MB = int(os.environ.get('SANDBOX_MEMORY_MB') or 256)
+
+    # Seconds a snippet waits for a free worker before it fails.
+    SANDBOX_QUEUE_SECONDS = float(os.environ.get('SANDBOX_QUEUE_SECONDS') or 30)
+
+    # --- Startup ---
+
+    # Load the heavy ML and document libraries, the embedding model and the
+    # Groq client in a background thread once the app is created. Without
+    # it they are loaded by the first request that needs them (and the
+    # embedding model at startup, if EMBEDDING_WARMUP is set).
+    PREWARM_ENABLED = _env_bool('PREWARM_ENABLED', True)
+
+    # --- Metrics ---
+
+    # Record per-stage latency, error, token and cache metrics and serve
+    # them in the Prometheus text format at /metrics.
+    METRICS_ENABLED = _env_bool('METRICS_ENABLED', True)
@@ -1,62 +1,205 @@
 import os
 import sys
 import json
-import io
-import contextlib
+import time
+import hashlib
+import argparse
+import threading
 from datetime import datetime
-from rouge_score import rouge_scorer
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 from app import create_app
+from app import sandbox
+from app.pipeline import CONTEXT_CANDIDATES, CONTEXT_QUERIES, pack_contexts
 from rag_components import extractor, vector_store
 from models import coder_model, report_generator
+from evaluation.metrics import F1, score_batch
 
-def execute_generated_code(code: str) -> str:
-    string_io = io.StringIO()
-    try:
-        with contextlib.redirect_stdout(string_io):
-            exec(code, {})
-        return string_io.getvalue()
-    except Exception as e:
-        return f"Error executing generated code: {e}"
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ARTIFACT_DIR = os.path.join(EVAL_DIR, 'artifacts')
+DEFAULT_CHECKPOINT = os.path.join(EVAL_DIR, 'evaluation_results', 'checkpoint.jsonl')
+
+STAGES = ('extract', 'retrieve', 'code', 'execute', 'report')
+
+def _digest(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8') if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class ArtifactCache:
+    """
+    On-disk cache of intermediate pipeline outputs, one file per stage and
+    input hash. Each stage is keyed on everything it depends on, so a change
+    upstream (a new manual, different observations, another model) misses
+    the cache for every stage after it.
+    """
+
+    def __init__(self, root: str, enabled: bool = True):
+        self.root = root
+        self.enabled = enabled
 
-def run_full_pipeline(manual_path: str, observations: str) -> str:
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.root, stage, f"{key}.txt")
+
+    def get(self, stage: str, key: str) -> str:
+        if not self.enabled:
+            return None
+        try:
+            with open(self._path(stage, key), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, stage: str, key: str, value: str):
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so a crash never leaves a
+        # truncated artifact behind.
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+def _run_stage(artifacts: ArtifactCache, timings: dict, stage: str, key: str, fn, is_error=None) -> str:
+    start = time.perf_counter()
+    value = artifacts.get(stage, key)
+    cached = value is not None
+    if not cached:
+        value = fn()
+        # Failures are not stored, so the next run tries the stage again.
+        if is_error is None or not is_error(value):
+            artifacts.put(stage, key, value)
+    timings[stage] = {'seconds': round(time.perf_counter() - start, 4), 'cached': cached}
+    return value
+
+def run_full_pipeline(manual_path: str, observations: str, artifacts: ArtifactCache = None, timings: dict = None) -> str:
     print(f"\nProcessing file: {os.path.basename(manual_path)}...")
-    
+    artifacts = artifacts or ArtifactCache(DEFAULT_ARTIFACT_DIR, enabled=False)
+    timings = {} if timings is None else timings
+
+    with open(manual_path, 'rb') as f:
+        manual_key = _digest(f.read())
+
     # Step 1: RAG - Extract and Retrieve
-    document_text = extractor.extract_text_from_file(manual_path)
-    query = "Aim, Theory, Apparatus, and Procedure of the experiment"
-    rag_context = vector_store.get_relevant_context(document_text, query)
-    
+    document_text = _run_stage(
+        artifacts, timings, 'extract', manual_key,
+        lambda: extractor.extract_text_from_file(manual_path),
+    )
+    rag_chunks = json.loads(_run_stage(
+        artifacts, timings, 'retrieve', _digest(vector_store.index_id(), document_text, *CONTEXT_QUERIES, str(CONTEXT_CANDIDATES)),
+        lambda: json.dumps(vector_store.get_relevant_chunks(document_text, CONTEXT_QUERIES, k=CONTEXT_CANDIDATES)),
+    ))
+    packed = pack_contexts(rag_chunks, observations)
+    coder_context, report_context = packed['coder']['text'], packed['report']['text']
+
     # Step 2: Coder Model
-    generated_code = coder_model.generate_code(
-        context=rag_context, 
-        observations=observations
+    generated_code = _run_stage(
+        artifacts, timings, 'code', _digest(coder_model.model_id(), coder_context, observations),
+        lambda: coder_model.generate_code(context=coder_context, observations=observations),
+        is_error=coder_model.is_error_output,
     )
-    
+
     # Step 3: Execute Code
-    calculation_results = execute_generated_code(generated_code)
-    
+    calculation_results = _run_stage(
+        artifacts, timings, 'execute', _digest(generated_code),
+        lambda: sandbox.execute_generated_code(generated_code),
+        is_error=sandbox.is_execution_error,
+    )
+
     # Step 4: Report Generator
-    final_report = report_generator.write_report(
-        rag_context=rag_context,
-        observations=observations,
-        results=calculation_results
+    final_report = _run_stage(
+        artifacts, timings, 'report', _digest(report_generator.REPORT_MODEL, report_context, observations, calculation_results),
+        lambda: report_generator.write_report(
+            rag_context=report_context,
+            observations=observations,
+            results=calculation_results
+        ),
+        is_error=report_generator.is_error_output,
     )
-    
+
     return final_report
 
+# --- Checkpointing ---
+
+def _example_key(item: dict) -> str:
+    return _digest(item['manual_path'], json.dumps(item['observations'], sort_keys=True))
+
+def load_checkpoint(path: str) -> dict:
+    # Returns {example key: entry} for every example that finished cleanly.
+    completed = {}
+    if not os.path.exists(path):
+        return completed
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue # A line cut short by a crash
+            if not entry.get('error'):
+                completed[entry['key']] = entry
+    return completed
+
+class CheckpointWriter:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, entry: dict):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+def _evaluate_example(item: dict, artifacts: ArtifactCache) -> dict:
+    observations = json.dumps(item['observations'], indent=2)
+    timings = {}
+    start = time.perf_counter()
+    entry = {'key': _example_key(item), 'manual_path': item['manual_path']}
+    try:
+        entry['generated_report'] = run_full_pipeline(item['manual_path'], observations, artifacts, timings)
+        if report_generator.is_error_output(entry['generated_report']):
+            entry['error'] = entry['generated_report']
+    except Exception as e:
+        entry['error'] = f"{type(e).__name__}: {e}"
+    entry['timings'] = timings
+    entry['total_seconds'] = round(time.perf_counter() - start, 4)
+    return entry
+
+def _format_timings(timings: dict) -> str:
+    return ", ".join(
+        f"{stage} {timings[stage]['seconds']:.2f}s{' (cached)' if timings[stage]['cached'] else ''}"
+        for stage in STAGES if stage in timings
+    )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate generated lab reports against golden reports with ROUGE.")
+    parser.add_argument('--workers', type=int, default=4, help="Examples evaluated concurrently")
+    parser.add_argument('--dataset', default=os.path.join(EVAL_DIR, 'eval_dataset.jsonl'))
+    parser.add_argument('--artifacts', default=DEFAULT_ARTIFACT_DIR, help="Directory for cached per-stage outputs")
+    parser.add_argument('--no-artifacts', action='store_true', help="Recompute every stage instead of reusing cached outputs")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--fresh', action='store_true', help="Ignore the checkpoint and evaluate every example again")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     app = create_app()
     with app.app_context():
-        dataset_path = os.path.join(os.path.dirname(__file__), 'eval_dataset.jsonl')
+        dataset_path = args.dataset
 
         if not os.path.exists(dataset_path):
             print(f"ERROR: Evaluation dataset not found at {dataset_path}")
             return
-        
+
         # --- NEW: Create a directory for saving results ---
         results_dir = os.path.join(os.path.dirname(__file__), 'evaluation_results')
         os.makedirs(results_dir, exist_ok=True)
@@ -67,56 +210,95 @@ def main():
         with open(dataset_path, 'r') as f:
             eval_data = [json.loads(line) for line in f]
 
-        scorer = rouge_scorer.RougeScorer(['rouge1', 'rougeL'], use_stemmer=True)
-        total_scores = {'rouge1': [], 'rougeL': []}
-
         print(f"Found {len(eval_data)} examples in the evaluation dataset.")
-        
+
+        # --- Resume from the checkpoint ---
+        if args.fresh and os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+        completed = load_checkpoint(args.checkpoint)
+        entries = [completed.get(_example_key(item)) for item in eval_data]
+        pending = [i for i, entry in enumerate(entries) if entry is None]
+        if len(pending) < len(eval_data):
+            print(f"Resuming: {len(eval_data) - len(pending)} examples already done, {len(pending)} to run.")
+
+        artifacts = ArtifactCache(args.artifacts, enabled=not args.no_artifacts)
+        checkpoint = CheckpointWriter(args.checkpoint)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+                futures = {pool.submit(_evaluate_example, eval_data[i], artifacts): i for i in pending}
+                for done, future in enumerate(as_completed(futures), 1):
+                    i = futures[future]
+                    entry = entries[i] = future.result()
+                    checkpoint.write(entry)
+                    status = f"FAILED: {entry['error']}" if entry.get('error') else _format_timings(entry['timings'])
+                    print(f"--- Finished Example {i+1} ({done}/{len(pending)}): {status}")
+        finally:
+            checkpoint.close()
+
+        # --- Scoring ---
+        # Reports come from the checkpoint, so re-scoring never calls the LLMs.
+        scored_indices = [i for i, entry in enumerate(entries) if not entry.get('error')]
+        scores = score_batch(
+            [eval_data[i]['golden_report'] for i in scored_indices],
+            [entries[i]['generated_report'] for i in scored_indices],
+            rouge_types=('rouge1', 'rougeL'),
+        )
+        rouge1_f1 = dict(zip(scored_indices, scores['rouge1'][:, F1]))
+        rougeL_f1 = dict(zip(scored_indices, scores['rougeL'][:, F1]))
+        stage_totals = {stage: [] for stage in STAGES}
+        failed = 0
+
         with open(results_filename, 'w', encoding='utf-8') as results_file:
-            for i, item in enumerate(eval_data):
+            for i, (item, entry) in enumerate(zip(eval_data, entries)):
                 manual_path = item['manual_path']
-                observations = json.dumps(item['observations'], indent=2)
                 golden_report = item['golden_report']
-                
-                generated_report = run_full_pipeline(manual_path, observations)
-                
-                scores = scorer.score(golden_report, generated_report)
-                
-                total_scores['rouge1'].append(scores['rouge1'])
-                total_scores['rougeL'].append(scores['rougeL'])
-                
-                # --- NEW: Write detailed results to the file ---
+
                 results_file.write(f"========== EXAMPLE {i+1}: {os.path.basename(manual_path)} ==========\n\n")
-                results_file.write(f"ROUGE-1 F1-Score: {scores['rouge1'].fmeasure:.4f}\n")
-                results_file.write(f"ROUGE-L F1-Score: {scores['rougeL'].fmeasure:.4f}\n\n")
+                if entry.get('error'):
+                    failed += 1
+                    results_file.write(f"FAILED: {entry['error']}\n\n")
+                    results_file.write("=" * 60 + "\n\n")
+                    continue
+
+                generated_report = entry['generated_report']
+                for stage, timing in entry['timings'].items():
+                    stage_totals[stage].append(timing['seconds'])
+
+                # --- NEW: Write detailed results to the file ---
+                results_file.write(f"ROUGE-1 F1-Score: {rouge1_f1[i]:.4f}\n")
+                results_file.write(f"ROUGE-L F1-Score: {rougeL_f1[i]:.4f}\n")
+                results_file.write(f"Stage timings: {_format_timings(entry['timings'])}\n\n")
                 results_file.write("--- GENERATED REPORT ---\n")
                 results_file.write(generated_report + "\n\n")
                 results_file.write("--- GOLDEN REPORT ---\n")
                 results_file.write(golden_report + "\n\n")
                 results_file.write("=" * 60 + "\n\n")
                 # --- END NEW ---
-                
-                print(f"--- Finished Example {i+1}/{len(eval_data)} ---")
-                print(f"ROUGE-1 F1: {scores['rouge1'].fmeasure:.4f}")
-                print(f"ROUGE-L F1: {scores['rougeL'].fmeasure:.4f}")
-                print("------------------------------------")
 
-            avg_rouge1_f1 = sum(s.fmeasure for s in total_scores['rouge1']) / len(total_scores['rouge1'])
-            avg_rougeL_f1 = sum(s.fmeasure for s in total_scores['rougeL']) / len(total_scores['rougeL'])
+                print(f"Example {i+1}: ROUGE-1 F1 {rouge1_f1[i]:.4f}, ROUGE-L F1 {rougeL_f1[i]:.4f}")
+
+            scored = len(scored_indices)
+            avg_rouge1_f1 = float(scores['rouge1'][:, F1].mean()) if scored else 0.0
+            avg_rougeL_f1 = float(scores['rougeL'][:, F1].mean()) if scored else 0.0
+            avg_timings = "\n".join(
+                f"  {stage}: {sum(times) / len(times):.2f}s"
+                for stage, times in stage_totals.items() if times
+            )
 
             summary = (
                 f"\n\n========== EVALUATION SUMMARY ==========\n"
-                f"Total examples evaluated: {len(eval_data)}\n"
+                f"Total examples evaluated: {scored} (failed: {failed})\n"
                 f"Average ROUGE-1 F1-Score: {avg_rouge1_f1:.4f}\n"
                 f"Average ROUGE-L F1-Score: {avg_rougeL_f1:.4f}\n"
+                f"Average stage timings:\n{avg_timings}\n"
                 f"========================================\n"
                 f"Detailed results saved to: {results_filename}\n"
             )
-            
+
             # --- NEW: Write summary to both file and terminal ---
             print(summary)
             results_file.write(summary)
             # --- END NEW ---
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
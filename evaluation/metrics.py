@@ -1,16 +1,170 @@
-from rouge_score import rouge_scorer
-from typing import Dict
+import os
+import functools
+from collections import Counter
+from typing import Dict, List, Union
+
+import numpy as np
+from nltk.stem import porter
+from rouge_score import rouge_scorer, tokenize
+
+import worker_processes
+
+ROUGE_TYPES = ('rouge1', 'rouge2', 'rougeL')
+
+# Imported once by the scoring workers' fork server.
+PRELOAD_MODULES = ('evaluation.metrics',)
+
+# Columns of the arrays returned by score_batch.
+PRECISION, RECALL, F1 = 0, 1, 2
+
+@functools.lru_cache(maxsize=None)
+def get_scorer(rouge_types: tuple = ROUGE_TYPES, use_stemmer: bool = True) -> rouge_scorer.RougeScorer:
+    # Building a scorer (and its Porter stemmer) is not free; reuse one per setting.
+    return rouge_scorer.RougeScorer(list(rouge_types), use_stemmer=use_stemmer)
 
 def calculate_rouge_scores(golden_report: str, generated_report: str) -> Dict[str, float]:
-    # Initialize the scorer with the desired ROUGE types
-    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
     # Compute the scores
-    scores = scorer.score(target=golden_report, prediction=generated_report)
-    
+    scores = get_scorer().score(target=golden_report, prediction=generated_report)
+
     processed_scores = {
         'rouge1_f1': scores['rouge1'].fmeasure,
         'rouge2_f1': scores['rouge2'].fmeasure,
         'rougeL_f1': scores['rougeL'].fmeasure
     }
-    
+
     return processed_scores
+
+# --- Batch Scoring ---
+
+class _CachedStemmer:
+    # Reports reuse a small vocabulary, so each word is stemmed only once.
+    def __init__(self):
+        self.stem = functools.lru_cache(maxsize=1 << 16)(porter.PorterStemmer().stem)
+
+_stemmer = _CachedStemmer()
+
+def _tokenize(text: str, use_stemmer: bool) -> list:
+    # The same tokenization RougeScorer uses, with the stemmer memoized.
+    return tokenize.tokenize(text, _stemmer if use_stemmer else None)
+
+def _ngrams(tokens: list, n: int) -> Counter:
+    return Counter(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+def _fmeasure(precision: float, recall: float) -> float:
+    return 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+
+class _Reference:
+    """
+    A golden report tokenized once, with everything scoring needs against
+    it: n-gram counts and, for ROUGE-L, a bit mask per token marking where
+    it occurs in the reference.
+    """
+
+    def __init__(self, text: str, rouge_types: tuple, use_stemmer: bool):
+        self.tokens = _tokenize(text, use_stemmer)
+        self.ngrams = {}
+        for rouge_type in rouge_types:
+            if rouge_type != 'rougeL':
+                n = int(rouge_type[5:])
+                counts = _ngrams(self.tokens, n)
+                self.ngrams[n] = (counts, sum(counts.values()))
+        self.masks = {}
+        for position, token in enumerate(self.tokens):
+            self.masks[token] = self.masks.get(token, 0) | (1 << position)
+
+    def lcs_length(self, prediction: list) -> int:
+        # Bit-parallel LCS (Hyyrö): one big-integer update per prediction
+        # token instead of a full row of the dynamic-programming table.
+        length = len(self.tokens)
+        full = (1 << length) - 1
+        v = full
+        for token in prediction:
+            u = v & self.masks.get(token, 0)
+            v = ((v + u) | (v - u)) & full
+        return length - bin(v).count('1')
+
+@functools.lru_cache(maxsize=256)
+def _reference(text: str, rouge_types: tuple, use_stemmer: bool) -> _Reference:
+    return _Reference(text, rouge_types, use_stemmer)
+
+def _score_pair(reference: _Reference, prediction_text: str, rouge_types: tuple, use_stemmer: bool) -> list:
+    # Returns [precision, recall, f1] per rouge type, matching RougeScorer.score.
+    prediction = _tokenize(prediction_text, use_stemmer)
+    row = []
+    for rouge_type in rouge_types:
+        if rouge_type == 'rougeL':
+            if not reference.tokens or not prediction:
+                row.extend((0.0, 0.0, 0.0))
+                continue
+            lcs = reference.lcs_length(prediction)
+            precision, recall = lcs / len(prediction), lcs / len(reference.tokens)
+        else:
+            n = int(rouge_type[5:])
+            target_counts, target_total = reference.ngrams[n]
+            prediction_counts = _ngrams(prediction, n)
+            overlap = sum(min(count, prediction_counts[ngram]) for ngram, count in target_counts.items())
+            precision = overlap / max(sum(prediction_counts.values()), 1)
+            recall = overlap / max(target_total, 1)
+        row.extend((precision, recall, _fmeasure(precision, recall)))
+    return row
+
+# Set in each pool worker by _init_worker, so references are sent once per
+# worker instead of once per pair.
+_worker_state = {}
+
+def _init_worker(references: list, rouge_types: tuple, use_stemmer: bool):
+    _worker_state.update(references=references, rouge_types=rouge_types, use_stemmer=use_stemmer)
+
+def _score_chunk(pairs: list) -> list:
+    references = _worker_state['references']
+    rouge_types = _worker_state['rouge_types']
+    use_stemmer = _worker_state['use_stemmer']
+    return [
+        _score_pair(_reference(references[index], rouge_types, use_stemmer), candidate, rouge_types, use_stemmer)
+        for index, candidate in pairs
+    ]
+
+def score_batch(references: Union[str, List[str]], candidates: List[str], rouge_types: tuple = ROUGE_TYPES,
+                use_stemmer: bool = True, processes: int = None, chunk_size: int = 64) -> Dict[str, np.ndarray]:
+    """
+    Scores many candidates at once. references is either one golden report
+    shared by all candidates or a list with one reference per candidate.
+
+    Returns {rouge_type: array of shape (len(candidates), 3)} with float32
+    columns precision, recall and F1 (see PRECISION, RECALL, F1). Scores
+    match RougeScorer.score for the same settings.
+
+    Batches larger than one chunk are spread over `processes` worker
+    processes (default: the CPU count); processes=1 scores in-process.
+    """
+    rouge_types = tuple(rouge_types)
+    for rouge_type in rouge_types:
+        if rouge_type != 'rougeL' and not (rouge_type[:5] == 'rouge' and rouge_type[5:].isdigit() and int(rouge_type[5:]) > 0):
+            raise ValueError(f"Unsupported rouge type: {rouge_type}")
+
+    if isinstance(references, str):
+        unique_references, indices = [references], [0] * len(candidates)
+    else:
+        if len(references) != len(candidates):
+            raise ValueError("references and candidates must have the same length")
+        positions = {}
+        indices = [positions.setdefault(reference, len(positions)) for reference in references]
+        unique_references = list(positions)
+
+    pairs = list(zip(indices, candidates))
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    processes = processes or os.cpu_count() or 1
+
+    if processes <= 1 or len(chunks) <= 1:
+        _init_worker(unique_references, rouge_types, use_stemmer)
+        rows = [row for chunk in chunks for row in _score_chunk(chunk)]
+    else:
+        # Not forked from the caller, which may be running threads and have
+        # the model libraries loaded; the pool is started once per batch.
+        context = worker_processes.get_context(PRELOAD_MODULES)
+        with context.Pool(min(processes, len(chunks)), initializer=_init_worker,
+                          initargs=(unique_references, rouge_types, use_stemmer)) as pool:
+            rows = [row for chunk_rows in pool.map(_score_chunk, chunks) for row in chunk_rows]
+
+    table = np.asarray(rows, dtype=np.float32).reshape(len(candidates), len(rouge_types), 3)
+    return {rouge_type: np.ascontiguousarray(table[:, i, :]) for i, rouge_type in enumerate(rouge_types)}
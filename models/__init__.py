@@ -3,18 +3,39 @@ Models Package for the Lab Report Agent.
 
 This package contains modules for interacting with the AI models:
 - coder_model: Handles the generation of Python code for calculations using a fine-tuned model.
+- code_cache: Persists generated code keyed by context and canonical observations.
+- program_library: Stores working calculation programs per manual and reuses them for new readings.
+- single_flight: Coalesces identical in-flight coder and report requests into one upstream call.
+- local_coder: Runs the fine-tuned coder model in-process on the CPU (the 'local' backend).
 - report_generator: Handles the final report writing using the Groq API.
 """
 
-# Import the main functions from the modules to make them easily accessible.
-# This allows you to use 'from models import generate_code' instead of
+import importlib
+
+# The main functions of the modules are accessible from the package. This
+# allows you to use 'from models import generate_code' instead of
 # 'from models.coder_model import generate_code' in other files like routes.py.
-from .coder_model import generate_code
-from .report_generator import write_report
+# They are imported on first access, so importing the package stays cheap.
+_EXPORTS = {
+    'generate_code': 'coder_model',
+    'write_report': 'report_generator',
+    'stream_report': 'report_generator',
+}
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+        globals()[name] = value # Later lookups skip __getattr__
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
 
 # The __all__ variable defines the public API of this package.
 # When a user writes 'from models import *', only these names will be imported.
 __all__ = [
     'generate_code',
-    'write_report'
+    'write_report',
+    'stream_report'
 ]
\ No newline at end of file
@@ -0,0 +1,154 @@
+# models/code_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+def normalize_value(value):
+    # Numbers compare by value, so 2, 2.0 and 2.00 produce the same key.
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(key): normalize_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalize_value(item) for item in value]
+    return value
+
+def canonicalize_observations(observations: str) -> str:
+    """
+    Returns a canonical form of the observation JSON: sorted keys, no
+    insignificant whitespace and normalized numbers. Input that is not valid
+    JSON is only whitespace-normalized.
+    """
+    try:
+        parsed = json.loads(observations)
+    except (TypeError, ValueError):
+        return " ".join(str(observations).split())
+    return json.dumps(normalize_value(parsed), sort_keys=True, separators=(',', ':'))
+
+def make_key(model_id: str, context: str, observations: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model_id, context, canonicalize_observations(observations)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class CodeCache:
+    """
+    Persistent cache of generated calculation code, stored in SQLite.
+
+    Entries expire ttl seconds after they were created, and once more than
+    max_entries are stored the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS code_cache ("
+            "key TEXT PRIMARY KEY, code TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so each
+        # thread keeps its own.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> str:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT code, created_at FROM code_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(hit=False)
+            return None
+
+        code, created_at = row
+        if self.ttl and created_at < now - self.ttl:
+            conn.execute("DELETE FROM code_cache WHERE key = ?", (key,))
+            self._count(hit=False)
+            return None
+
+        conn.execute("UPDATE code_cache SET last_used = ? WHERE key = ?", (now, key))
+        self._count(hit=True)
+        return code
+
+    def put(self, key: str, code: str):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO code_cache (key, code, created_at, last_used) VALUES (?, ?, ?, ?)",
+            (key, code, now, now),
+        )
+        # Drop expired entries, then the least recently used beyond the limit.
+        if self.ttl:
+            conn.execute("DELETE FROM code_cache WHERE created_at < ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM code_cache WHERE key IN ("
+            "SELECT key FROM code_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+# --- Process-wide cache instance ---
+
+_cache = None
+_enabled = True
+_settings = {
+    'path': os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'code_cache.sqlite'),
+    'ttl': 7 * 24 * 3600,
+    'max_entries': 5000,
+}
+_lock = threading.Lock()
+
+def get_cache() -> CodeCache:
+    global _cache
+    if not _enabled:
+        return None
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = CodeCache(**_settings)
+    return _cache
+
+def init_app(app):
+    global _cache, _enabled
+    with _lock:
+        _enabled = app.config.get('CODE_CACHE_ENABLED', True)
+        for key, config_key in (('path', 'CODE_CACHE_PATH'),
+                                ('ttl', 'CODE_CACHE_TTL'),
+                                ('max_entries', 'CODE_CACHE_MAX_ENTRIES')):
+            if app.config.get(config_key) is not None:
+                _settings[key] = app.config[config_key]
+        _cache = None
@@ -4,38 +4,141 @@ import os
 import requests
 import json
 import time
+import random
+import threading
+from requests.adapters import HTTPAdapter
+
+import telemetry
+
+from . import code_cache, local_coder, program_library, single_flight
 
 # Hugging Face Inference API config
 API_URL = "https://api-inference.huggingface.co/models/Barghav777/phi3-lab-report-coder"
 HF_TOKEN = os.environ.get("HF_API_TOKEN")
 
-def query_api(payload):
-    headers = {"Authorization": f"Bearer {HF_TOKEN}"}
-    response = requests.post(API_URL, headers=headers, json=payload)
-    return response
+# HTTP client settings for the Inference API. Overridden by init_app().
+_api_settings = {
+    'connect_timeout': 5.0,   # Seconds to establish a connection
+    'read_timeout': 60.0,     # Seconds to wait for a response
+    'deadline': 90.0,         # Total seconds the whole stage may take, retries included
+    'max_attempts': 6,
+    'backoff_base': 1.0,      # First retry delay; doubles on every attempt
+    'backoff_max': 20.0,      # Upper bound for a single retry delay
+    'pool_size': 10,          # Keep-alive connections kept open to the API
+}
 
-def generate_code(context: str, observations: str) -> str:
-    if not HF_TOKEN:
-        return "Error: Hugging Face API token is missing. Please set HF_API_TOKEN in your environment."
+# Status codes worth retrying: rate limiting, model loading, gateway errors.
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+# Which backend generates the code: "api" (Hugging Face Inference API) or
+# "local" (the model loaded in this process). Overridden by init_app().
+_backend_settings = {
+    'backend': 'api',
+    # Fall back to the API when the local backend fails to load or generate.
+    'fallback_to_api': True,
+}
+
+CODE_START_MARKER = "### CODE:\n"
+
+# Tokens the coder may generate; the prompt must leave room for them.
+MAX_NEW_TOKENS = 256
+
+# generate_code reports failures as text; these are the prefixes it uses.
+ERROR_PREFIXES = (
+    "Error",
+    "API request failed",
+    "Request to Hugging Face API failed",
+    "Unexpected error",
+    "Local coder model failed",
+)
+
+def is_error_output(text: str) -> bool:
+    return text.startswith(ERROR_PREFIXES)
 
-    prompt = (
+def build_prompt(context: str, observations: str) -> str:
+    return (
         f"### CONTEXT:\n{context}\n\n"
         f"### OBSERVATIONS:\n{observations}\n\n"
-        f"### CODE:\n"
+        f"{CODE_START_MARKER}"
     )
 
+def _extract_code(generated_text: str) -> str:
+    code_start_index = generated_text.rfind(CODE_START_MARKER)
+
+    if code_start_index != -1:
+        return generated_text[code_start_index + len(CODE_START_MARKER):].strip()
+    else:
+        return generated_text.strip()
+
+def _get_session() -> requests.Session:
+    # One keep-alive session per process, so retries and concurrent requests
+    # reuse pooled connections instead of opening a new one each time.
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_api_settings['pool_size'])
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Authorization": f"Bearer {HF_TOKEN}"})
+                _session = session
+    return _session
+
+def query_api(payload, timeout=None):
+    timeout = timeout or (_api_settings['connect_timeout'], _api_settings['read_timeout'])
+    response = _get_session().post(API_URL, json=payload, timeout=timeout)
+    return response
+
+def _retry_delay(attempt: int, response=None) -> float:
+    # Exponential backoff with full jitter, so a burst of requests waiting on
+    # the same cold model does not retry in lockstep.
+    delay = random.uniform(0, min(_api_settings['backoff_max'], _api_settings['backoff_base'] * 2 ** attempt))
+
+    # While the model is loading, the API reports how long it expects to take.
+    if response is not None and response.status_code == 503:
+        try:
+            estimated = float(response.json().get("estimated_time", 0))
+        except (ValueError, AttributeError):
+            estimated = 0
+        if estimated > 0:
+            delay = max(delay, min(estimated, _api_settings['backoff_max']) * random.uniform(0.8, 1.0))
+    return delay
+
+def _generate_with_api(prompt: str) -> str:
+    if not HF_TOKEN:
+        return "Error: Hugging Face API token is missing. Please set HF_API_TOKEN in your environment."
+
     payload = {
         "inputs": prompt,
-        "parameters": {"max_new_tokens": 256, "temperature": 0.2},
+        "parameters": {"max_new_tokens": MAX_NEW_TOKENS, "temperature": 0.2},
     }
 
     print("🚀 Sending request to Hugging Face Inference API...")
 
+    deadline = time.monotonic() + _api_settings['deadline']
+    last_error = None
+
     try:
-        for attempt in range(5): 
-            response = query_api(payload)
+        for attempt in range(_api_settings['max_attempts']):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            response = None
+            try:
+                # Never wait for a response past the overall deadline.
+                timeout = (min(_api_settings['connect_timeout'], remaining),
+                           min(_api_settings['read_timeout'], remaining))
+                response = query_api(payload, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = f"Request to Hugging Face API failed: {e}"
+                print(f"⚠️ {last_error}")
 
-            if response.status_code == 200:
+            if response is not None and response.status_code == 200:
                 result = response.json()
                 generated_text = None
 
@@ -47,24 +150,121 @@ def generate_code(context: str, observations: str) -> str:
                 if not generated_text:
                     return f"Error: Unexpected response format from API:\n{json.dumps(result, indent=2)}"
 
-                code_start_marker = "### CODE:\n"
-                code_start_index = generated_text.rfind(code_start_marker)
+                return _extract_code(generated_text)
+
+            if response is not None and response.status_code not in RETRY_STATUS_CODES:
+                return f"API request failed [{response.status_code}]: {response.text}"
 
-                if code_start_index != -1:
-                    return generated_text[code_start_index + len(code_start_marker):].strip()
-                else:
-                    return generated_text.strip()
+            if response is not None:
+                last_error = f"API request failed [{response.status_code}]: {response.text}"
 
-            elif response.status_code == 503:
-                print("⏳ Model is loading on Hugging Face... retrying in 10s")
-                time.sleep(10)
-                continue
+            delay = _retry_delay(attempt, response)
+            if time.monotonic() + delay >= deadline:
+                break
+            if response is not None and response.status_code == 503:
+                print(f"⏳ Model is loading on Hugging Face... retrying in {delay:.1f}s")
             else:
-                return f"API request failed [{response.status_code}]: {response.text}"
+                print(f"⏳ Retrying Hugging Face API in {delay:.1f}s")
+            time.sleep(delay)
 
-        return "Error: Model did not load after multiple attempts."
+        return f"Error: Model did not load after multiple attempts. Last error: {last_error}"
 
     except requests.exceptions.RequestException as e:
         return f"Request to Hugging Face API failed: {e}"
     except Exception as e:
         return f"Unexpected error: {e}"
+
+def _generate_with_local_model(prompt: str) -> str:
+    print("🖥️ Generating code with the local coder model...")
+    return _extract_code(local_coder.generate(prompt, max_new_tokens=MAX_NEW_TOKENS, temperature=0.2))
+
+def _generate_uncoalesced(prompt: str, backend: str) -> str:
+    if backend == 'local':
+        try:
+            return _generate_with_local_model(prompt)
+        except Exception as e:
+            if not _backend_settings['fallback_to_api']:
+                return f"Local coder model failed: {e}"
+            print(f"WARNING: Local coder model failed ({e}); falling back to the Hugging Face API.")
+
+    return _generate_with_api(prompt)
+
+def _generate(prompt: str, backend: str) -> str:
+    # Identical prompts submitted at the same time (e.g. a whole class during
+    # a lab session) share one upstream request.
+    if not single_flight.is_enabled():
+        return _generate_uncoalesced(prompt, backend)
+    key = single_flight.make_key(backend, local_coder.model_name() if backend == 'local' else API_URL, prompt)
+    return single_flight.get_group('coder').do(key, _generate_uncoalesced, prompt, backend)
+
+def generate_code(context: str, observations: str, backend: str = None, use_cache: bool = True) -> str:
+    with telemetry.span('coder'):
+        code = _generate_code(context, observations, backend, use_cache)
+        if is_error_output(code):
+            telemetry.mark_error()
+        return code
+
+def model_id(backend: str = None) -> str:
+    # Identifies the model that writes the code, for cache keys.
+    backend = backend or _backend_settings['backend']
+    return f"local:{local_coder.model_name()}" if backend == 'local' else f"api:{API_URL}"
+
+def _generate_code(context: str, observations: str, backend: str, use_cache: bool) -> str:
+    backend = backend or _backend_settings['backend']
+
+    # Identical context and (canonically equal) observations always get the
+    # same code, so repeat submissions skip the model entirely. Pass
+    # use_cache=False to force a fresh generation.
+    cache = code_cache.get_cache() if use_cache else None
+    if cache is not None:
+        key = code_cache.make_key(model_id(backend), context, observations)
+        cached_code = cache.get(key)
+        if cached_code is not None:
+            print("♻️ Reusing cached code for these observations.")
+            return cached_code
+
+    code = _generate(build_prompt(context, observations), backend)
+
+    # Failures are never cached, so the next request tries again.
+    if cache is not None and not is_error_output(code):
+        cache.put(key, code)
+    return code
+
+def init_app(app):
+    global _session, API_URL
+    backend = (app.config.get('CODER_BACKEND') or 'api').lower()
+    if backend not in ('api', 'local'):
+        raise ValueError(f"Unknown CODER_BACKEND: '{backend}' (expected 'api' or 'local')")
+    _backend_settings['backend'] = backend
+    _backend_settings['fallback_to_api'] = app.config.get('CODER_FALLBACK_TO_API', True)
+
+    if app.config.get('CODER_API_URL'):
+        API_URL = app.config['CODER_API_URL']
+
+    for key, config_key in (('connect_timeout', 'CODER_API_CONNECT_TIMEOUT'),
+                            ('read_timeout', 'CODER_API_READ_TIMEOUT'),
+                            ('deadline', 'CODER_API_DEADLINE'),
+                            ('max_attempts', 'CODER_API_MAX_ATTEMPTS'),
+                            ('pool_size', 'CODER_API_POOL_SIZE')):
+        if app.config.get(config_key) is not None:
+            _api_settings[key] = app.config[config_key]
+    # Rebuild the session with the new pool size on next use.
+    _session = None
+
+    code_cache.init_app(app)
+    program_library.init_app(app)
+    single_flight.init_app(app)
+
+    local_coder.configure(
+        model=app.config.get('CODER_LOCAL_MODEL'),
+        base_model=app.config.get('CODER_LOCAL_BASE_MODEL'),
+        quantize_int8=app.config.get('CODER_LOCAL_QUANTIZE_INT8'),
+        threads=app.config.get('CODER_LOCAL_THREADS'),
+        trust_remote_code=app.config.get('CODER_LOCAL_TRUST_REMOTE_CODE'),
+    )
+    if backend == 'local':
+        # Load the weights now so the first request does not pay for it.
+        try:
+            local_coder.load()
+        except Exception as e:
+            print(f"WARNING: Could not load the local coder model: {e}")
@@ -0,0 +1,117 @@
+# models/local_coder.py
+
+import os
+import threading
+
+import telemetry
+
+# Local CPU inference settings. These defaults are overridden from the Flask
+# config through coder_model.init_app().
+_settings = {
+    # A merged model directory, a LoRA adapter directory, or a Hub model id.
+    'model': "Barghav777/phi3-lab-report-coder",
+    # Base model the adapter is applied to when 'model' is an adapter folder.
+    'base_model': "microsoft/Phi-3-mini-4k-instruct",
+    # Apply dynamic int8 quantization to the Linear layers after loading.
+    'quantize_int8': False,
+    # Intra-op threads used by PyTorch (None = PyTorch default).
+    'threads': None,
+    # Run modeling code shipped with the model repository. Phi-3 is built
+    # into transformers, so this is only needed for other architectures.
+    'trust_remote_code': False,
+}
+
+_model = None
+_tokenizer = None
+_load_lock = threading.Lock()
+# Generation is CPU-bound and already multi-threaded inside PyTorch, so
+# concurrent requests take turns instead of oversubscribing the cores.
+_generate_lock = threading.Lock()
+
+def configure(**settings):
+    global _model, _tokenizer
+    with _load_lock:
+        for key, value in settings.items():
+            if value is not None and value != _settings.get(key):
+                _settings[key] = value
+                _model, _tokenizer = None, None
+
+def model_name() -> str:
+    return _settings['model']
+
+def is_loaded() -> bool:
+    return _model is not None
+
+def load():
+    global _model, _tokenizer
+    if _model is not None:
+        return _model, _tokenizer
+
+    with _load_lock:
+        if _model is None:
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
+            if _settings['threads']:
+                torch.set_num_threads(_settings['threads'])
+
+            model_path = _settings['model']
+            is_adapter = os.path.isfile(os.path.join(model_path, 'adapter_config.json'))
+            base_path = _settings['base_model'] if is_adapter else model_path
+
+            print(f"Loading local coder model '{model_path}' on CPU...")
+            model = AutoModelForCausalLM.from_pretrained(
+                base_path,
+                torch_dtype=torch.float32,
+                trust_remote_code=_settings['trust_remote_code'],
+            )
+            if is_adapter:
+                # A fine-tuned LoRA adapter (CODER_MODEL_PATH): merge it into
+                # the base weights once so generation has no adapter overhead.
+                from peft import PeftModel
+                model = PeftModel.from_pretrained(model, model_path).merge_and_unload()
+
+            if _settings['quantize_int8']:
+                print("Quantizing coder model Linear layers to int8...")
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+            model.eval()
+            model.config.use_cache = True
+
+            tokenizer = AutoTokenizer.from_pretrained(base_path, trust_remote_code=_settings['trust_remote_code'])
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+
+            _model, _tokenizer = model, tokenizer
+            print("✅ Local coder model loaded.")
+        return _model, _tokenizer
+
+def generate(prompt: str, max_new_tokens: int = 256, temperature: float = 0.2) -> str:
+    """
+    Generates a continuation of prompt with the locally loaded model and
+    returns only the newly generated text.
+    """
+    import torch
+
+    model, tokenizer = load()
+    inputs = tokenizer(prompt, return_tensors="pt")
+
+    with _generate_lock, torch.inference_mode():
+        output = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=temperature > 0,
+            temperature=temperature if temperature > 0 else None,
+            top_p=0.9 if temperature > 0 else None,
+            use_cache=True, # Reuse the KV cache between decoding steps
+            pad_token_id=tokenizer.eos_token_id,
+        )
+
+    input_length = inputs["input_ids"].shape[1]
+    telemetry.observe('lab_report_llm_tokens', input_length, model='coder', kind='prompt')
+    telemetry.observe('lab_report_llm_tokens', output.shape[1] - input_length, model='coder', kind='completion')
+    return tokenizer.decode(output[0][input_length:], skip_special_tokens=True)
+
+def count_tokens(text: str) -> int:
+    _, tokenizer = load()
+    return len(tokenizer(text)["input_ids"])
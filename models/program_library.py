@@ -0,0 +1,292 @@
+# models/program_library.py
+
+import os
+import ast
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from .code_cache import normalize_value
+
+def manual_fingerprint(document_text: str) -> str:
+    return hashlib.sha256(document_text.encode('utf-8')).hexdigest()
+
+def observation_schema(value):
+    """
+    Describes the shape of the observation JSON: the key set of every
+    object and the type of every value, without the values themselves.
+    List lengths are ignored, so more or fewer readings share a schema.
+    """
+    if isinstance(value, dict):
+        return {key: observation_schema(item) for key, item in sorted(value.items())}
+    if isinstance(value, list):
+        item_schemas = []
+        for item in value:
+            schema = observation_schema(item)
+            if schema not in item_schemas:
+                item_schemas.append(schema)
+        return ['list', item_schemas]
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if value is None:
+        return 'null'
+    return 'str'
+
+def _schema_key(observations) -> str:
+    schema = json.dumps(observation_schema(observations), sort_keys=True)
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()
+
+def _walk(value, path=()):
+    # Yields (path, value) for every node of the observation tree.
+    yield path, value
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _walk(item, path + (key,))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from _walk(item, path + (index,))
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _resolve(value, path):
+    for step in path:
+        value = value[step]
+    return value
+
+def _byte_offsets(code: str) -> list:
+    # AST column offsets are in UTF-8 bytes; map each line to its byte start.
+    offsets, total = [], 0
+    for line in code.encode('utf-8').splitlines(keepends=True):
+        offsets.append(total)
+        total += len(line)
+    return offsets
+
+def parametrize(code: str, observations) -> list:
+    """
+    Finds where the generated code embeds the observations.
+
+    Every top-level assignment of a literal that equals a subtree of the
+    observations (for example `observations = [{'V': 2.0, 'I': 0.21}, ...]`
+    or `module = 3`) becomes a binding of (start byte, end byte, path).
+    Returns None unless every number in the observations is covered by a
+    binding, and no other literal in the code repeats one of them (such as
+    `print('R =', 2.0 / 0.5)`), since only then can new readings be
+    substituted safely.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    nodes = [(path, normalize_value(value)) for path, value in _walk(observations) if path]
+    line_offsets = _byte_offsets(code)
+    bindings = []
+
+    for statement in tree.body:
+        if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                and isinstance(statement.targets[0], ast.Name)):
+            continue
+        try:
+            literal = normalize_value(ast.literal_eval(statement.value))
+        except (ValueError, SyntaxError, TypeError):
+            continue
+        if isinstance(literal, tuple):
+            literal = list(literal)
+
+        name = statement.targets[0].id.lower()
+        matches = []
+        for path, value in nodes:
+            if value != literal:
+                continue
+            if not isinstance(value, (dict, list)):
+                # A lone number is only trusted when the variable is named
+                # after its key; otherwise any constant could match by chance.
+                key = str(path[-1]).lower()
+                if not _is_number(value) or (key not in name and name not in key):
+                    continue
+            matches.append(path)
+        if len(matches) != 1:
+            continue
+
+        value_node = statement.value
+        start = line_offsets[value_node.lineno - 1] + value_node.col_offset
+        end = line_offsets[value_node.end_lineno - 1] + value_node.end_col_offset
+        bindings.append((start, end, list(matches[0])))
+
+    if not covers(bindings, observations):
+        return None
+
+    # A reading copied into an expression would keep its old value when the
+    # program is rendered for new readings, and still run without error.
+    numbers = {abs(normalize_value(value)) for _, value in _walk(observations) if _is_number(value)}
+    spans = [(start, end) for start, end, _ in bindings]
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Constant) and _is_number(node.value)):
+            continue
+        offset = line_offsets[node.lineno - 1] + node.col_offset
+        if abs(normalize_value(node.value)) in numbers and not any(start <= offset < end for start, end in spans):
+            return None
+    return bindings
+
+def covers(bindings: list, observations) -> bool:
+    # Whether every number in the observations lies under a bound path.
+    # Bindings often hold single readings (['readings', 0, 'V']), so a
+    # stored program can cover fewer readings than a new submission has.
+    covered = [tuple(path) for _, _, path in bindings]
+    for path, value in _walk(observations):
+        if _is_number(value) and not any(path[:len(bound)] == bound for bound in covered):
+            return False
+    return True
+
+def render(code: str, bindings: list, observations) -> str:
+    # Substitutes the new observation values into the stored program.
+    source = code.encode('utf-8')
+    for start, end, path in sorted(bindings, reverse=True):
+        literal = repr(_resolve(observations, path)).encode('utf-8')
+        source = source[:start] + literal + source[end:]
+    return source.decode('utf-8')
+
+class ProgramLibrary:
+    """
+    Calculation programs that executed successfully, stored per manual
+    fingerprint and observation schema in SQLite, so new readings for a
+    known experiment can be computed without calling the coder model.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS programs ("
+            "fingerprint TEXT NOT NULL, schema TEXT NOT NULL, code TEXT NOT NULL, bindings TEXT NOT NULL, "
+            "created_at REAL NOT NULL, uses INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (fingerprint, schema))"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so each
+        # thread keeps its own.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, field: str):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def lookup(self, fingerprint: str, observations: str) -> str:
+        """
+        Returns the stored program for this manual and observation schema,
+        rendered with the given observations, or None.
+        """
+        try:
+            parsed = json.loads(observations)
+        except (TypeError, ValueError):
+            return None
+
+        row = self._connect().execute(
+            "SELECT code, bindings FROM programs WHERE fingerprint = ? AND schema = ?",
+            (fingerprint, _schema_key(parsed)),
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+
+        bindings = json.loads(row[1])
+        if not covers(bindings, parsed):
+            # More readings than the program binds: rendering would silently
+            # drop the extra ones.
+            self._count('misses')
+            return None
+        try:
+            code = render(row[0], bindings, parsed)
+        except (KeyError, IndexError, TypeError):
+            # The readings do not fit the stored bindings (e.g. fewer rows).
+            self._count('misses')
+            return None
+
+        self._connect().execute(
+            "UPDATE programs SET uses = uses + 1 WHERE fingerprint = ? AND schema = ?",
+            (fingerprint, _schema_key(parsed)),
+        )
+        self._count('hits')
+        return code
+
+    def record(self, fingerprint: str, observations: str, code: str) -> bool:
+        """
+        Stores code that executed successfully, if its observation values
+        can be parametrized. Returns whether the program was stored.
+        """
+        try:
+            parsed = json.loads(observations)
+        except (TypeError, ValueError):
+            return False
+
+        bindings = parametrize(code, parsed)
+        if not bindings:
+            return False
+
+        self._connect().execute(
+            "INSERT OR REPLACE INTO programs (fingerprint, schema, code, bindings, created_at) VALUES (?, ?, ?, ?, ?)",
+            (fingerprint, _schema_key(parsed), code, json.dumps(bindings), time.time()),
+        )
+        return True
+
+    def invalidate(self, fingerprint: str, observations: str):
+        try:
+            parsed = json.loads(observations)
+        except (TypeError, ValueError):
+            return
+        self._connect().execute(
+            "DELETE FROM programs WHERE fingerprint = ? AND schema = ?",
+            (fingerprint, _schema_key(parsed)),
+        )
+        self._count('invalidations')
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+# --- Process-wide library instance ---
+
+_library = None
+_enabled = True
+_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'programs.sqlite')
+_lock = threading.Lock()
+
+def get_library() -> ProgramLibrary:
+    global _library
+    if not _enabled:
+        return None
+    if _library is None:
+        with _lock:
+            if _library is None:
+                _library = ProgramLibrary(_path)
+    return _library
+
+def init_app(app):
+    global _library, _enabled, _path
+    with _lock:
+        _enabled = app.config.get('PROGRAM_LIBRARY_ENABLED', True)
+        if app.config.get('PROGRAM_LIBRARY_PATH'):
+            _path = app.config['PROGRAM_LIBRARY_PATH']
+        _library = None
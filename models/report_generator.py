@@ -1,23 +1,66 @@
 import os
-from groq import Groq
+import threading
 
-try:
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
+import telemetry
+
+from . import single_flight
+
+# The Groq client is created on first use rather than at import time, so
+# importing this module stays cheap and the SDK is only loaded when needed.
+_client = None
+_client_created = False
+_client_lock = threading.Lock()
+
+def _create_client():
     if not os.environ.get("GROQ_API_KEY"):
         print("WARNING: GROQ_API_KEY environment variable not found.")
-        client = None
-    else:
+        return None
+    try:
+        from groq import Groq
+        client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
         print("✅ Groq client initialized successfully.")
-except Exception as e:
-    print(f"ERROR: Could not initialize Groq client: {e}")
-    client = None
+        return client
+    except Exception as e:
+        print(f"ERROR: Could not initialize Groq client: {e}")
+        return None
 
-def write_report(rag_context: str, observations: str, results: str) -> str:
-    if not client:
-        return ("Error: Groq API client is not initialized. "
-                "Please ensure your GROQ_API_KEY is set correctly in the .env file.")
+def get_client():
+    # Returns None if the client could not be created.
+    global _client, _client_created
+    if not _client_created:
+        with _client_lock:
+            if not _client_created:
+                _client = _create_client()
+                _client_created = True
+    return _client
+
+CLIENT_MISSING_ERROR = ("Error: Groq API client is not initialized. "
+                        "Please ensure your GROQ_API_KEY is set correctly in the .env file.")
+
+REPORT_MODEL = "llama-3.3-70b-versatile"
+
+REPORT_MAX_TOKENS = 2048
+
+# In pipelined mode the report is written in two parts. The first part only
+# needs the manual, so it is drafted while the calculation code is generated
+# and run; the second part needs the observations and results.
+DRAFT_SECTIONS = ("Aim", "Theory", "Apparatus / Requirements", "Procedure")
+COMPLETION_SECTIONS = ("Observations", "Calculations / Results", "Conclusion")
+DRAFT_MAX_TOKENS = 1280
+COMPLETION_MAX_TOKENS = 1024
+
+# Overridden from the Flask config by init_app().
+_settings = {
+    'pipelined': False,
+}
+
+REPORT_ERROR_PREFIX = "An error occurred while generating the report"
+
+def is_error_output(text: str) -> bool:
+    return text == CLIENT_MISSING_ERROR or text.startswith(REPORT_ERROR_PREFIX)
 
-    prompt = f"""
+def _build_prompt(rag_context: str, observations: str, results: str) -> str:
+    return f"""
         You are a meticulous scientific assistant. Your task is to write a formal and detailed lab report using the provided information.
 
         ---
@@ -72,23 +115,212 @@ def write_report(rag_context: str, observations: str, results: str) -> str:
 
         Now, please generate the complete lab report.
         """
-        
+
+def _build_draft_prompt(rag_context: str) -> str:
+    sections = "\n".join(f"        - {section}" for section in DRAFT_SECTIONS)
+    later = ", ".join(COMPLETION_SECTIONS)
+    return f"""
+        You are a meticulous scientific assistant. Your task is to write the first part of a formal and detailed lab report using the provided information.
+
+        ---
+        ### INSTRUCTIONS
+        ---
+        **1. Report Structure:**
+        Write ONLY the first part of the report, with the following sections, each with a clear heading:
+{sections}
+
+        Do not write the {later} sections; they are written separately and appended after yours.
+
+        **2. Tone and Style:**
+        - The language must be formal, objective, and appropriate for a scientific document.
+        - Write in clear and complete sentences. Avoid overly simplistic or fragmented language.
+        - Ensure smooth transitions between sections to create a cohesive document.
+
+        **3. Formatting:**
+        - The final response must be in plain text format only. Do not use markdown or emojis.
+        - Start directly with the Aim heading, without a title or preamble.
+
+        ---
+        **PROVIDED INFORMATION**
+        ---
+
+        **AIM, THEORY, and PROCEDURE (extracted from the lab manual):**
+        {rag_context}
+
+        ---
+        **END OF INFORMATION**
+        ---
+
+        Now, please write the first part of the lab report.
+        """
+
+def _build_completion_prompt(rag_context: str, observations: str, results: str) -> str:
+    sections = "\n".join(f"        - {section}" for section in COMPLETION_SECTIONS)
+    earlier = ", ".join(DRAFT_SECTIONS)
+    return f"""
+        You are a meticulous scientific assistant. Your task is to write the final part of a formal and detailed lab report using the provided information.
+
+        ---
+        ### INSTRUCTIONS
+        ---
+        **1. Report Structure:**
+        Write ONLY the final part of the report, with the following sections, each with a clear heading:
+{sections}
+
+        The {earlier} sections have already been written; do not repeat them.
+
+        **2. Tone and Style:**
+        - The language must be formal, objective, and appropriate for a scientific document.
+        - Write in clear and complete sentences. Avoid overly simplistic or fragmented language.
+        - The conclusion must state whether the results achieve the aim of the experiment.
+
+        **3. Data Handling:**
+        - Accurately present all data from the 'USER-PROVIDED OBSERVATIONS' and 'CALCULATED RESULTS' sections.
+        - If 'USER-PROVIDED OBSERVATIONS' are missing or incomplete, generate realistic sample readings consistent with the experiment's context.
+        - If 'CALCULATED RESULTS' are missing or contain an error message, generate appropriate sample calculations and results based on the observations.
+
+        **4. Formatting:**
+        - The final response must be in plain text format only. Do not use markdown or emojis.
+        - Start directly with the Observations heading, without a title or preamble.
+
+        ---
+        **PROVIDED INFORMATION**
+        ---
+
+        **1. AIM, THEORY, and PROCEDURE (extracted from the lab manual):**
+        {rag_context}
+
+        **2. OBSERVATIONS (provided by the user):**
+        {observations}
+
+        **3. CALCULATED RESULTS (from the executed Python code):**
+        {results}
+
+        ---
+        **END OF INFORMATION**
+        ---
+
+        Now, please write the final part of the lab report.
+        """
+
+def _create_completion(prompt: str, stream: bool = False, max_tokens: int = REPORT_MAX_TOKENS):
+    return get_client().chat.completions.create(
+        messages=[
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        model=REPORT_MODEL,
+        temperature=1.0,
+        max_tokens=max_tokens,
+        stream=stream,
+    )
+
+def _record_usage(usage):
+    if usage is None:
+        return
+    telemetry.observe('lab_report_llm_tokens', usage.prompt_tokens, model='report', kind='prompt')
+    telemetry.observe('lab_report_llm_tokens', usage.completion_tokens, model='report', kind='completion')
+
+def _write_report(prompt: str, max_tokens: int = REPORT_MAX_TOKENS) -> str:
     print("Sending request to Groq API...")
     try:
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            model="llama-3.3-70b-versatile", 
-            temperature=1.0,       
-            max_tokens=2048,
-        )
+        chat_completion = _create_completion(prompt, max_tokens=max_tokens)
+        _record_usage(getattr(chat_completion, 'usage', None))
 
         return chat_completion.choices[0].message.content
 
     except Exception as e:
         print(f"ERROR: An error occurred while calling the Groq API: {e}")
-        return f"An error occurred while generating the report: {e}"
\ No newline at end of file
+        return f"{REPORT_ERROR_PREFIX}: {e}"
+
+def _stream_report(prompt: str, max_tokens: int = REPORT_MAX_TOKENS):
+    print("Sending streaming request to Groq API...")
+    try:
+        for chunk in _create_completion(prompt, stream=True, max_tokens=max_tokens):
+            # Groq reports token usage on the last chunk of a stream.
+            x_groq = getattr(chunk, 'x_groq', None)
+            if x_groq is not None:
+                _record_usage(getattr(x_groq, 'usage', None))
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+
+    except Exception as e:
+        print(f"ERROR: An error occurred while calling the Groq API: {e}")
+        yield f"{REPORT_ERROR_PREFIX}: {e}"
+
+def _generate(prompt: str, stage: str, max_tokens: int = REPORT_MAX_TOKENS) -> str:
+    with telemetry.span(stage):
+        # Identical concurrent requests share one completion.
+        if not single_flight.is_enabled():
+            report = _write_report(prompt, max_tokens)
+        else:
+            key = single_flight.make_key(REPORT_MODEL, max_tokens, prompt)
+            report = single_flight.get_group(stage).do(key, _write_report, prompt, max_tokens)
+        if is_error_output(report):
+            telemetry.mark_error()
+        return report
+
+def _stream(prompt: str, stage: str, max_tokens: int = REPORT_MAX_TOKENS):
+    with telemetry.span(stage):
+        if not single_flight.is_enabled():
+            pieces = _stream_report(prompt, max_tokens)
+        else:
+            key = single_flight.make_key(REPORT_MODEL, max_tokens, prompt)
+            pieces = single_flight.get_group(f"{stage}_stream").stream(key, _stream_report, prompt, max_tokens)
+        for piece in pieces:
+            if is_error_output(piece):
+                telemetry.mark_error()
+            yield piece
+
+def write_report(rag_context: str, observations: str, results: str) -> str:
+    if not get_client():
+        return CLIENT_MISSING_ERROR
+    return _generate(_build_prompt(rag_context, observations, results), 'report')
+
+def stream_report(rag_context: str, observations: str, results: str):
+    """
+    Same as write_report, but yields the report text piece by piece as the
+    Groq API streams it back instead of waiting for the full completion.
+    """
+    if not get_client():
+        yield CLIENT_MISSING_ERROR
+        return
+    yield from _stream(_build_prompt(rag_context, observations, results), 'report')
+
+# --- Pipelined report writing ---
+
+def is_pipelined() -> bool:
+    return _settings['pipelined']
+
+def draft_sections(rag_context: str) -> str:
+    # The DRAFT_SECTIONS, which only depend on the manual.
+    if not get_client():
+        return CLIENT_MISSING_ERROR
+    return _generate(_build_draft_prompt(rag_context), 'report_draft', DRAFT_MAX_TOKENS)
+
+def complete_sections(rag_context: str, observations: str, results: str) -> str:
+    # The COMPLETION_SECTIONS, which need the observations and results.
+    if not get_client():
+        return CLIENT_MISSING_ERROR
+    return _generate(_build_completion_prompt(rag_context, observations, results), 'report_completion',
+                     COMPLETION_MAX_TOKENS)
+
+def stream_completion(rag_context: str, observations: str, results: str):
+    # Same as complete_sections, but yields the text as it is streamed.
+    if not get_client():
+        yield CLIENT_MISSING_ERROR
+        return
+    yield from _stream(_build_completion_prompt(rag_context, observations, results), 'report_completion',
+                       COMPLETION_MAX_TOKENS)
+
+def stitch(draft: str, completion: str) -> str:
+    return draft.rstrip() + "\n\n" + completion.strip()
+
+def init_app(app):
+    if app.config.get('REPORT_PIPELINED') is not None:
+        _settings['pipelined'] = app.config['REPORT_PIPELINED']
@@ -0,0 +1,153 @@
+# models/single_flight.py
+
+import hashlib
+import threading
+
+def make_key(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class _Broadcast:
+    # The pieces of one streamed upstream response, shared by every reader.
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.condition = threading.Condition()
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in
+    flight, later callers with the same key wait for it and receive its
+    result instead of sending their own upstream request.
+
+    Results are not kept once the call finishes, so this never serves stale
+    data; it only deduplicates requests that overlap in time.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.leaders = 0
+        self.shared = 0
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key: str, fn, *args, **kwargs):
+        """
+        Like do(), for a generator: one upstream generator is consumed in a
+        background thread and every caller with the same key iterates over
+        the same pieces, from the first one, as they arrive.
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = self._streams[key] = _Broadcast()
+                self.leaders += 1
+                # The producer runs on its own thread, so one client
+                # disconnecting does not cut the stream short for the others.
+                threading.Thread(target=self._produce, args=(key, broadcast, fn, args, kwargs), daemon=True).start()
+            else:
+                self.shared += 1
+
+        index = 0
+        while True:
+            with broadcast.condition:
+                while index >= len(broadcast.chunks) and not broadcast.finished:
+                    broadcast.condition.wait()
+                pending = broadcast.chunks[index:]
+                finished = broadcast.finished
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished and index >= len(broadcast.chunks):
+                break
+
+        if broadcast.error is not None:
+            raise broadcast.error
+
+    def _produce(self, key: str, broadcast: _Broadcast, fn, args, kwargs):
+        try:
+            for chunk in fn(*args, **kwargs):
+                with broadcast.condition:
+                    broadcast.chunks.append(chunk)
+                    broadcast.condition.notify_all()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            # Callers arriving from now on start a new upstream request.
+            with self._lock:
+                del self._streams[key]
+            with broadcast.condition:
+                broadcast.finished = True
+                broadcast.condition.notify_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.leaders + self.shared
+            return {
+                'upstream_calls': self.leaders,
+                'coalesced_calls': self.shared,
+                'in_flight': len(self._calls) + len(self._streams),
+                'coalesced_rate': self.shared / total if total else 0.0,
+            }
+
+# --- Process-wide groups ---
+
+_enabled = True
+_groups = {}
+_lock = threading.Lock()
+
+def get_group(name: str) -> SingleFlight:
+    with _lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+def is_enabled() -> bool:
+    return _enabled
+
+def stats() -> dict:
+    with _lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
+
+def init_app(app):
+    global _enabled
+    _enabled = app.config.get('SINGLE_FLIGHT_ENABLED', True)
@@ -3,17 +3,47 @@ RAG Components Package for the Lab Report Agent.
 
 This package contains modules for the Retrieval-Augmented Generation (RAG) pipeline:
 - extractor: Handles extracting raw text from uploaded documents (PDF, DOCX, etc.).
+- embeddings: Holds the process-wide embedding model shared by all requests.
+- embedding_cache: Stores per-chunk embeddings on disk so unchanged chunks are never re-embedded.
+- index_cache: Caches built FAISS indexes in memory and on disk, keyed by content hash.
+- manual_library: Stores uploaded manuals (text and FAISS index) durably, referenced by manual_id.
+- chunker: Splits text into overlapping chunks by offset, with page and section metadata.
 - vector_store: Handles text chunking, embedding, and retrieving relevant context.
+- context_packer: Fits retrieved chunks into each model's token budget, dropping near-duplicates.
 """
 
-# Import the main functions from the modules to make them directly accessible
-# from the package, which simplifies import statements in other files.
-from .extractor import extract_text_from_file
-from .vector_store import get_relevant_context
+import importlib
+
+# The main functions of the modules are accessible from the package, which
+# simplifies import statements in other files. They are imported on first
+# access rather than here, so that importing the package does not load
+# LangChain, PyPDF2 or python-docx before they are needed.
+_EXPORTS = {
+    'extract_text_from_file': 'extractor',
+    'iter_pdf_pages': 'extractor',
+    'get_embeddings': 'embeddings',
+    'build_vector_store': 'vector_store',
+    'get_relevant_chunks': 'vector_store',
+    'get_relevant_context': 'vector_store',
+}
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+        globals()[name] = value # Later lookups skip __getattr__
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
 
 # The __all__ variable defines the public API of this package.
 # When a user writes 'from rag_components import *', only these names will be imported.
 __all__ = [
     'extract_text_from_file',
+    'iter_pdf_pages',
+    'get_embeddings',
+    'build_vector_store',
+    'get_relevant_chunks',
     'get_relevant_context'
 ]
\ No newline at end of file
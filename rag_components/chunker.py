@@ -0,0 +1,181 @@
+"""
+Splits manual text into overlapping chunks for embedding.
+
+Chunk boundaries follow the rules of LangChain's
+RecursiveCharacterTextSplitter, with the settings the app used
+(separators "\\n\\n", "\\n", " ", "", separators kept at the start of the
+next piece, whitespace stripped). The same text gives the same chunks.
+
+The splitter here works on (start, end) offsets into the original text.
+Pieces, merges and overlaps are index arithmetic, and a chunk's text is
+sliced once, at the end. Pieces longer than a chunk are split again with
+the next separator, so each character is scanned at most once per
+separator. Because every chunk keeps its offsets, it can be traced back
+to the page and section of the manual it came from.
+"""
+import re
+import bisect
+import itertools
+
+from .extractor import PAGE_BREAK
+
+SEPARATORS = ("\n\n", "\n", " ", "")
+
+# Lines taken as section headings: a lab-manual section name (optionally
+# followed by a colon and text, as in "Aim: To determine ..."), a numbered
+# title such as "2.1 Theory", or a short line in capitals.
+_SECTION_NAMES = (
+    r"aims?|objectives?|theory|principle|formulae?|apparatus(?: required)?|materials?(?: required)?|"
+    r"equipment|procedure|method|observations?|calculations?|results?|precautions|conclusions?|"
+    r"discussion|introduction|sources? of error|viva(?: voce)?"
+)
+_HEADING_LINE = (
+    r"[ \t\f]*(?:"
+    rf"(?P<section>(?i:{_SECTION_NAMES}))[ \t]*(?::|$)"
+    r"|(?P<numbered>\d{1,2}(?:\.\d{1,2})*\.?[ \t]+[A-Z][^\n]{0,78}?)(?<![.;,])[ \t]*$"
+    r"|(?P<caps>(?=[A-Z0-9 ,'&()/:-]*[A-Z]{3})[A-Z][A-Z0-9 ,'&()/:-]{2,78}?)[ \t]*$"
+    r")"
+)
+# Anchored on the newline before each line rather than on ^, which lets the
+# regex engine jump from newline to newline instead of trying every offset.
+_FIRST_HEADING = re.compile(_HEADING_LINE, re.MULTILINE)
+_HEADING = re.compile(r"\n" + _HEADING_LINE, re.MULTILINE)
+
+def _pieces(text: str, start: int, end: int, separator: str) -> list:
+    # Spans of text[start:end] split before each occurrence of separator,
+    # which stays at the start of the following piece. Empty pieces are
+    # dropped.
+    if not separator:
+        return [(i, i + 1) for i in range(start, end)]
+    pieces = []
+    piece_start = start
+    found = text.find(separator, start, end)
+    while found != -1:
+        if found > piece_start:
+            pieces.append((piece_start, found))
+        piece_start = found
+        found = text.find(separator, found + len(separator), end)
+    if end > piece_start:
+        pieces.append((piece_start, end))
+    return pieces
+
+def _strip(text: str, start: int, end: int) -> tuple:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+def _merge(text: str, pieces: list, chunk_size: int, chunk_overlap: int, spans: list):
+    # Greedily packs consecutive pieces into chunks of up to chunk_size
+    # characters. Each new chunk starts with the last pieces of the previous
+    # one, up to chunk_overlap characters.
+    first = 0 # Index of the first piece of the current chunk
+    total = 0
+    for i, (start, end) in enumerate(pieces):
+        length = end - start
+        if total + length > chunk_size and i > first:
+            span = _strip(text, pieces[first][0], pieces[i - 1][1])
+            if span[0] < span[1]:
+                spans.append(span)
+            while total > chunk_overlap or (total + length > chunk_size and total > 0):
+                total -= pieces[first][1] - pieces[first][0]
+                first += 1
+        total += length
+    if first < len(pieces):
+        span = _strip(text, pieces[first][0], pieces[-1][1])
+        if span[0] < span[1]:
+            spans.append(span)
+
+def _split(text: str, start: int, end: int, separators: tuple, chunk_size: int, chunk_overlap: int, spans: list):
+    # The first separator found in the text is used; longer pieces are split
+    # again with the ones after it.
+    separator, remaining = separators[-1], ()
+    for i, candidate in enumerate(separators):
+        if not candidate:
+            separator = candidate
+            break
+        if text.find(candidate, start, end) != -1:
+            separator, remaining = candidate, separators[i + 1:]
+            break
+
+    short = []
+    for piece in _pieces(text, start, end, separator):
+        if piece[1] - piece[0] < chunk_size:
+            short.append(piece)
+            continue
+        if short:
+            _merge(text, short, chunk_size, chunk_overlap, spans)
+            short = []
+        if remaining:
+            _split(text, piece[0], piece[1], remaining, chunk_size, chunk_overlap, spans)
+        else:
+            spans.append(piece)
+    if short:
+        _merge(text, short, chunk_size, chunk_overlap, spans)
+
+def split_spans(text: str, chunk_size: int, chunk_overlap: int, separators: tuple = SEPARATORS) -> list:
+    """
+    Returns the (start, end) offsets of the chunks of text, in order.
+    text[start:end] is the same string RecursiveCharacterTextSplitter
+    returns for that chunk.
+    """
+    if chunk_overlap > chunk_size:
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size}).")
+    spans = []
+    _split(text, 0, len(text), tuple(separators), chunk_size, chunk_overlap, spans)
+    return spans
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int, separators: tuple = SEPARATORS) -> list:
+    return [text[start:end] for start, end in split_spans(text, chunk_size, chunk_overlap, separators)]
+
+def find_headings(text: str) -> list:
+    # (offset, title) of each heading line, in order.
+    headings = []
+    first = _FIRST_HEADING.match(text)
+    for match in itertools.chain([first] if first else [], _HEADING.finditer(text)):
+        group = match.lastgroup
+        title = match.group(group).strip().rstrip(':').strip()
+        headings.append((match.start(group), title))
+    return headings
+
+def page_starts(text: str) -> list:
+    # Offset at which each page starts. Pages are separated by PAGE_BREAK,
+    # as the extractor joins PDF pages.
+    starts = [0]
+    found = text.find(PAGE_BREAK)
+    while found != -1:
+        starts.append(found + 1)
+        found = text.find(PAGE_BREAK, found + 1)
+    return starts
+
+def split_documents(text: str, chunk_size: int, chunk_overlap: int) -> tuple:
+    """
+    Splits text into chunks and describes where each came from. Returns
+    (texts, metadatas), where each metadata dict holds:
+    - start, end: the chunk's offsets in text
+    - page, last_page: the first and last page (1-based) the chunk covers
+    - heading: the section heading in effect at the start of the chunk, or
+      else the first one within it (None if there is neither)
+    """
+    spans = split_spans(text, chunk_size, chunk_overlap)
+    pages = page_starts(text)
+    headings = find_headings(text)
+    heading_offsets = [offset for offset, _ in headings]
+
+    texts, metadatas = [], []
+    for start, end in spans:
+        texts.append(text[start:end])
+        # The last heading starting at or before the chunk, else the first
+        # one inside it.
+        h = bisect.bisect_right(heading_offsets, start) - 1
+        if h < 0 and headings and heading_offsets[0] < end:
+            h = 0
+        metadatas.append({
+            'start': start,
+            'end': end,
+            'page': bisect.bisect_right(pages, start),
+            'last_page': bisect.bisect_right(pages, end - 1),
+            'heading': headings[h][1] if h >= 0 else None,
+        })
+    return texts, metadatas
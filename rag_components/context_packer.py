@@ -0,0 +1,150 @@
+import re
+import threading
+from functools import lru_cache
+
+# Per-model packing settings. These defaults are overridden from the Flask
+# config by init_app().
+_settings = {
+    # Tokenizer used to count tokens for each target model (a Hugging Face
+    # model id or local path). None, or a tokenizer that cannot be loaded,
+    # falls back to an estimate of CHARS_PER_TOKEN characters per token.
+    'tokenizers': {
+        'coder': "microsoft/Phi-3-mini-4k-instruct",
+        'report': None,
+    },
+    # Most context tokens to put into each model's prompt.
+    'budgets': {
+        'coder': 2048,
+        'report': 3000,
+    },
+    # Context window of each model (None = no limit beyond the budget).
+    # Phi-3-mini has 4k tokens for the prompt and the generated code.
+    'windows': {
+        'coder': 4096,
+        'report': None,
+    },
+    # A chunk whose word shingles are mostly contained in chunks already
+    # packed is treated as a near-duplicate and skipped.
+    'duplicate_threshold': 0.8,
+}
+
+CHARS_PER_TOKEN = 4
+SHINGLE_SIZE = 5
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+_tokenizers = {}
+_lock = threading.Lock()
+
+def _get_tokenizer(model: str):
+    name = _settings['tokenizers'].get(model)
+    if not name:
+        return None
+    if name not in _tokenizers:
+        with _lock:
+            if name not in _tokenizers:
+                try:
+                    from transformers import AutoTokenizer
+                    _tokenizers[name] = AutoTokenizer.from_pretrained(name)
+                except Exception as e:
+                    print(f"WARNING: Could not load tokenizer '{name}' ({e}); estimating token counts.")
+                    _tokenizers[name] = None
+    return _tokenizers[name]
+
+def load_tokenizers():
+    # Loads the tokenizer of every target model. Called at startup or by
+    # pre-warming, so that no request has to download one.
+    for model in _settings['tokenizers']:
+        _get_tokenizer(model)
+
+@lru_cache(maxsize=4096)
+def _count(text: str, model: str) -> int:
+    tokenizer = _get_tokenizer(model)
+    if tokenizer is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def count_tokens(text: str, model: str) -> int:
+    """Counts tokens in text with the tokenizer of the target model ('coder' or 'report')."""
+    return _count(text, model)
+
+def _truncate(text: str, model: str, max_tokens: int) -> str:
+    tokenizer = _get_tokenizer(model)
+    if tokenizer is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    ids = tokenizer(text, add_special_tokens=False)["input_ids"][:max_tokens]
+    return tokenizer.decode(ids, skip_special_tokens=True)
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def budget_for(model: str, reserved_tokens: int = 0) -> int:
+    # The configured budget, shrunk if the rest of the prompt and the
+    # generated tokens would otherwise overflow the model's context window.
+    budget = _settings['budgets'][model]
+    window = _settings['windows'].get(model)
+    if window:
+        budget = min(budget, window - reserved_tokens)
+    return max(0, budget)
+
+def pack(chunks: list, model: str, budget: int = None) -> dict:
+    """
+    Packs retrieved chunks, given in relevance order, into a context for
+    the target model.
+
+    Chunks that mostly repeat text already packed (such as the overlap
+    between neighbouring chunks) are skipped, and chunks are added until
+    the model's token budget is used up. If even the most relevant chunk
+    does not fit, it is truncated to the budget.
+
+    Returns a dict with the packed 'text', its 'tokens', and how many
+    chunks were 'used', skipped as 'duplicates', or left 'over_budget'.
+    """
+    budget = budget if budget is not None else budget_for(model)
+    separator_tokens = count_tokens(CHUNK_SEPARATOR, model)
+
+    selected, seen = [], set()
+    used_tokens, duplicates, over_budget = 0, 0, 0
+    for chunk in chunks:
+        shingles = _shingles(chunk)
+        if shingles and len(shingles & seen) / len(shingles) >= _settings['duplicate_threshold']:
+            duplicates += 1
+            continue
+
+        cost = count_tokens(chunk, model) + (separator_tokens if selected else 0)
+        if used_tokens + cost > budget:
+            if selected:
+                over_budget += 1
+                continue
+            chunk = _truncate(chunk, model, budget)
+            cost = count_tokens(chunk, model)
+
+        selected.append(chunk)
+        seen |= shingles
+        used_tokens += cost
+
+    return {
+        'text': CHUNK_SEPARATOR.join(selected),
+        'tokens': used_tokens,
+        'used': len(selected),
+        'duplicates': duplicates,
+        'over_budget': over_budget,
+    }
+
+def init_app(app):
+    for model, config_key in (('coder', 'CONTEXT_TOKENIZER_CODER'), ('report', 'CONTEXT_TOKENIZER_REPORT')):
+        if config_key in app.config:
+            _settings['tokenizers'][model] = app.config[config_key]
+    for model, config_key in (('coder', 'CONTEXT_BUDGET_CODER'), ('report', 'CONTEXT_BUDGET_REPORT')):
+        if app.config.get(config_key) is not None:
+            _settings['budgets'][model] = app.config[config_key]
+    if app.config.get('CONTEXT_WINDOW_CODER') is not None:
+        _settings['windows']['coder'] = app.config['CONTEXT_WINDOW_CODER']
+    if app.config.get('CONTEXT_DUPLICATE_THRESHOLD') is not None:
+        _settings['duplicate_threshold'] = app.config['CONTEXT_DUPLICATE_THRESHOLD']
+    _count.cache_clear()
+    # With pre-warming, the tokenizers are loaded in the background instead.
+    if not app.config.get('PREWARM_ENABLED'):
+        load_tokenizers()
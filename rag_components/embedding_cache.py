@@ -0,0 +1,173 @@
+import os
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+
+import telemetry
+
+def chunk_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{text}".encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """
+    On-disk store of chunk embeddings for a single embedding model.
+
+    Vectors are appended to a raw float32 matrix file that is memory-mapped
+    for reads, and a small SQLite table maps each chunk key to its row.
+    Appends happen inside a SQLite write transaction, which also serializes
+    writers from other worker processes sharing the same directory, and
+    which records the number of rows written.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str):
+        self.model_name = model_name
+        store_name = hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:16]
+        self.store_dir = os.path.join(cache_dir, store_name)
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        self.matrix_path = os.path.join(self.store_dir, 'vectors.f32')
+        self.db_path = os.path.join(self.store_dir, 'chunks.sqlite')
+        self.dim = None
+        self._matrix = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS chunks (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            row = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            if row:
+                self.dim = int(row[0])
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so each
+        # thread keeps its own.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _rows_available(self) -> int:
+        if not self.dim or not os.path.exists(self.matrix_path):
+            return 0
+        return os.path.getsize(self.matrix_path) // (self.dim * 4)
+
+    def _get_matrix(self, needed_rows: int) -> np.memmap:
+        # Re-map the matrix only when rows beyond the current mapping are needed.
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[0] < needed_rows:
+                rows = self._rows_available()
+                self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+            return self._matrix
+
+    def lookup(self, keys: list) -> dict:
+        if not keys or not self.dim:
+            return {}
+
+        conn = self._connect()
+        found = {}
+        # Stay well below SQLite's bound-parameter limit.
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, row in conn.execute(f"SELECT key, row FROM chunks WHERE key IN ({placeholders})", batch):
+                found[key] = row
+        if not found:
+            return {}
+
+        matrix = self._get_matrix(max(found.values()) + 1)
+        return {key: np.array(matrix[row]) for key, row in found.items()}
+
+    def store(self, keys: list, vectors: np.ndarray):
+        if not keys:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.dim is None:
+                row = conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+                self.dim = int(row[0]) if row else vectors.shape[1]
+                conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match cached dimension {self.dim}")
+
+            # The committed row count, not the file size, says where the next
+            # row goes: a write torn by a crash or a full disk leaves a
+            # partial row behind, which would shift every later vector.
+            row = conn.execute("SELECT value FROM meta WHERE name = 'rows'").fetchone()
+            if row:
+                first_row = int(row[0])
+            else:
+                # Caches written before the count was kept.
+                first_row = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM chunks").fetchone()[0]
+            row_bytes = self.dim * 4
+            size = os.path.getsize(self.matrix_path) if os.path.exists(self.matrix_path) else 0
+            if size < first_row * row_bytes:
+                # Rows were lost from the file; forget the chunks stored there.
+                first_row = size // row_bytes
+                conn.execute("DELETE FROM chunks WHERE row >= ?", (first_row,))
+
+            with open(self.matrix_path, 'ab') as f:
+                # Drop whatever an interrupted append left past the last row.
+                f.truncate(first_row * row_bytes)
+                f.write(vectors.tobytes())
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunks (key, row) VALUES (?, ?)",
+                [(key, first_row + i) for i, key in enumerate(keys)],
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('rows', ?)", (str(first_row + len(keys)),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def embed_documents(self, texts: list, embeddings) -> np.ndarray:
+        keys = [chunk_key(self.model_name, text) for text in texts]
+        cached = self.lookup(list(set(keys)))
+
+        # Only chunks that were never embedded before go through the model.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        print(f"Embedding cache: {len(texts) - len(missing)} chunks cached, {len(missing)} to embed.")
+        telemetry.inc('lab_report_cache_requests_total', len(texts) - len(missing), cache='embedding', result='hit')
+        telemetry.inc('lab_report_cache_requests_total', len(missing), cache='embedding', result='miss')
+        if missing:
+            new_vectors = np.asarray(embeddings.embed_documents(list(missing.values())), dtype=np.float32)
+            self.store(list(missing.keys()), new_vectors)
+            cached.update(zip(missing.keys(), new_vectors))
+
+        return np.stack([cached[key] for key in keys])
+
+# --- Process-wide caches, one per embedding model ---
+
+_caches = {}
+_enabled = True
+_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'embeddings')
+_lock = threading.Lock()
+
+def get_cache(model_name: str) -> EmbeddingCache:
+    if not _enabled:
+        return None
+    with _lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            cache = EmbeddingCache(_cache_dir, model_name)
+            _caches[model_name] = cache
+        return cache
+
+def init_app(app):
+    global _enabled, _cache_dir
+    with _lock:
+        _enabled = app.config.get('EMBEDDING_CACHE_ENABLED', True)
+        if app.config.get('EMBEDDING_CACHE_DIR'):
+            _cache_dir = app.config['EMBEDDING_CACHE_DIR']
+        _caches.clear()
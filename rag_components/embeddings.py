@@ -0,0 +1,119 @@
+import os
+import threading
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Process-wide embedding settings. These defaults are overridden from the
+# Flask config by init_app(), or directly through configure().
+_settings = {
+    'model_name': EMBEDDING_MODEL_NAME,
+    'device': 'cpu',
+    'batch_size': 32,
+    # "torch" (sentence-transformers via HuggingFaceEmbeddings) or "onnx"
+    # (the same model exported to ONNX Runtime, see onnx_embeddings.py).
+    'backend': 'torch',
+    'onnx_quantize': False,    # Use the int8-quantized export
+    'onnx_threads': 0,         # Intra-op threads (0 = one per physical core)
+    'onnx_batch_tokens': 8192, # Most padded tokens per dynamic batch
+    'onnx_dir': os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'onnx'),
+}
+
+# The shared embedding model, loaded lazily on first use.
+_embeddings = None
+_lock = threading.Lock()
+
+def configure(model_name: str = None, device: str = None, batch_size: int = None, backend: str = None,
+              onnx_quantize: bool = None, onnx_threads: int = None, onnx_batch_tokens: int = None,
+              onnx_dir: str = None):
+    global _embeddings
+    if backend is not None and backend not in ('torch', 'onnx'):
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: '{backend}' (expected 'torch' or 'onnx')")
+    updates = {
+        'model_name': model_name,
+        'device': device,
+        'batch_size': batch_size,
+        'backend': backend,
+        'onnx_quantize': onnx_quantize,
+        'onnx_threads': onnx_threads,
+        'onnx_batch_tokens': onnx_batch_tokens,
+        'onnx_dir': onnx_dir,
+    }
+    with _lock:
+        for key, value in updates.items():
+            if value is not None and value != _settings[key]:
+                _settings[key] = value
+                # A settings change invalidates the already loaded model.
+                _embeddings = None
+
+def get_settings() -> dict:
+    return dict(_settings)
+
+def embedding_id() -> str:
+    # Identifies the vectors the current settings produce, for cache keys.
+    # The quantized ONNX model gives slightly different vectors, so it must
+    # not share cached vectors with the others.
+    if _settings['backend'] == 'onnx':
+        return f"{_settings['model_name']}@onnx{'-int8' if _settings['onnx_quantize'] else ''}"
+    return _settings['model_name']
+
+def _load_onnx():
+    from . import onnx_embeddings
+
+    model_path = onnx_embeddings.ensure_exported(_settings['model_name'], _settings['onnx_dir'], _settings['onnx_quantize'])
+    print(f"Loading ONNX embedding model '{model_path}' "
+          f"({_settings['onnx_threads'] or 'default'} threads, batch size {_settings['batch_size']})...")
+    return onnx_embeddings.OnnxEmbeddings(
+        model_path,
+        threads=_settings['onnx_threads'],
+        batch_size=_settings['batch_size'],
+        batch_tokens=_settings['onnx_batch_tokens'],
+    )
+
+def get_embeddings():
+    global _embeddings
+    # Fast path: the model is already loaded, no locking needed.
+    if _embeddings is not None:
+        return _embeddings
+
+    with _lock:
+        # Another thread may have finished loading while we waited.
+        if _embeddings is None and _settings['backend'] == 'onnx':
+            _embeddings = _load_onnx()
+        elif _embeddings is None:
+            # Imported here: it pulls in sentence-transformers and torch.
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            print(f"Loading embedding model '{_settings['model_name']}' "
+                  f"on {_settings['device']} (batch size {_settings['batch_size']})...")
+            _embeddings = HuggingFaceEmbeddings(
+                model_name=_settings['model_name'],
+                model_kwargs={'device': _settings['device']},
+                encode_kwargs={'batch_size': _settings['batch_size']},
+            )
+        return _embeddings
+
+def warm_up():
+    # Load the weights and run one tiny forward pass so the first real
+    # request does not pay for model initialization.
+    get_embeddings().embed_query("warm-up")
+    print("✅ Embedding model warmed up.")
+
+def init_app(app):
+    configure(
+        model_name=app.config.get('EMBEDDING_MODEL_NAME'),
+        device=app.config.get('EMBEDDING_DEVICE'),
+        batch_size=app.config.get('EMBEDDING_BATCH_SIZE'),
+        backend=app.config.get('EMBEDDING_BACKEND'),
+        onnx_quantize=app.config.get('EMBEDDING_ONNX_QUANTIZE'),
+        onnx_threads=app.config.get('EMBEDDING_ONNX_THREADS'),
+        onnx_batch_tokens=app.config.get('EMBEDDING_ONNX_BATCH_TOKENS'),
+        onnx_dir=app.config.get('EMBEDDING_ONNX_DIR'),
+    )
+    # With PREWARM_ENABLED the warm-up runs in the background instead
+    # (see app/prewarm.py).
+    if app.config.get('EMBEDDING_WARMUP') and not app.config.get('PREWARM_ENABLED'):
+        try:
+            warm_up()
+        except Exception as e:
+            # A failed warm-up should not prevent the app from starting;
+            # the model will be loaded again on the first request.
+            print(f"WARNING: Could not warm up the embedding model: {e}")
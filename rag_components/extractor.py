@@ -1,50 +1,276 @@
+import io
 import os
-import PyPDF2
-import docx
+import math
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 
-def _extract_text_from_pdf(file_path: str) -> str:
-    print(f"Reading PDF file: {file_path}")
+import telemetry
+import worker_processes
+
+# PyPDF2 and python-docx are imported where they are used, so that loading
+# this module (and starting the app) does not pay for them.
+
+# Separates the pages of extracted PDF text (a form feed, as pdftotext
+# uses), so chunks can be traced back to the pages they came from.
+PAGE_BREAK = "\f"
+
+# Modules the extraction workers' fork server imports once, so workers
+# start without importing them.
+PRELOAD_MODULES = ('rag_components.extractor', 'PyPDF2')
+
+# PDF extraction settings. These defaults are overridden from the Flask
+# config by init_app().
+_pdf_settings = {
+    # Worker processes used to extract pages (0 = in the calling thread,
+    # where the timeout is only checked between pages).
+    'workers': min(4, os.cpu_count() or 1),
+    # Documents with fewer pages are extracted by a single worker in one
+    # batch, where splitting them would cost more than it gains.
+    'parallel_min_pages': 16,
+    # Pages handed to a worker at a time.
+    'batch_pages': 8,
+    # Pages beyond this limit are ignored.
+    'max_pages': 300,
+    # Seconds after which extraction stops and returns the pages read so far.
+    'timeout': 60,
+}
+
+_pool = None
+_pool_users = {} # Pool -> number of extractions using it
+_retired_pools = set() # Pools to terminate once their last user is done
+_pool_lock = threading.Lock()
+
+def _acquire_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = worker_processes.get_context(PRELOAD_MODULES)
+            _pool = ProcessPoolExecutor(max_workers=max(1, _pdf_settings['workers']), mp_context=context)
+        _pool_users[_pool] = _pool_users.get(_pool, 0) + 1
+        return _pool
+
+def _release_pool(pool: ProcessPoolExecutor, stuck: bool = False):
+    # stuck: the extraction timed out and may have left a worker on a
+    # pathological page. The pool is then retired: later extractions get a
+    # new one, and its workers are terminated once the extractions still
+    # running on it are done, so they are never cancelled by someone else's
+    # timeout.
+    global _pool
+    with _pool_lock:
+        if stuck and pool is _pool:
+            _pool = None
+            _retired_pools.add(pool)
+        _pool_users[pool] -= 1
+        if _pool_users[pool] > 0:
+            return
+        del _pool_users[pool]
+        if pool not in _retired_pools:
+            return
+        _retired_pools.discard(pool)
+    _terminate_pool(pool)
+
+def _discard_pool():
+    # Retires the current pool, e.g. after the settings change.
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+        if pool is None:
+            return
+        if _pool_users.get(pool):
+            _retired_pools.add(pool)
+            return
+    _terminate_pool(pool)
+
+def _terminate_pool(pool: ProcessPoolExecutor):
+    pool.shutdown(wait=False, cancel_futures=True)
+    terminate = getattr(pool, 'terminate_workers', None)
+    if terminate is not None:
+        terminate()
+    else:
+        for process in list((getattr(pool, '_processes', None) or {}).values()):
+            process.terminate()
+
+def _open_pdf(source):
+    # Accepts a path, raw bytes, or a seekable file-like object.
+    if isinstance(source, str):
+        return open(source, 'rb')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+def _extract_page_range(source, start: int, stop: int) -> list:
+    # Runs in a worker process; each batch re-opens the document on its own.
+    pages = []
+    import PyPDF2
+    pdf_file = _open_pdf(source)
+    try:
+        reader = PyPDF2.PdfReader(pdf_file)
+        for page_number in range(start, stop):
+            pages.append((page_number, reader.pages[page_number].extract_text() or ""))
+    finally:
+        pdf_file.close()
+    return pages
+
+def _iter_pages_serial(reader, page_count: int, deadline: float):
+    for page_number in range(page_count):
+        if time.monotonic() > deadline:
+            print(f"WARNING: PDF extraction timed out after {page_number} pages.")
+            return
+        yield page_number, reader.pages[page_number].extract_text() or ""
+
+def _iter_pages_pooled(source, page_count: int, deadline: float):
+    if page_count < _pdf_settings['parallel_min_pages']:
+        batch = max(1, page_count)
+    else:
+        batch = _pdf_settings['batch_pages']
+        if not isinstance(source, str):
+            # In-memory documents are shipped to the workers with every batch,
+            # so use one batch per worker to bound the number of copies.
+            batch = max(batch, math.ceil(page_count / max(1, _pdf_settings['workers'])))
+
+    pool = _acquire_pool()
+    futures = []
+    timed_out = False
+    try:
+        futures = [pool.submit(_extract_page_range, source, start, min(start + batch, page_count))
+                   for start in range(0, page_count, batch)]
+
+        # Results are consumed in page order, so early pages are handed on while
+        # later batches are still being extracted.
+        for future in futures:
+            try:
+                pages = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                print("WARNING: PDF extraction timed out; returning the pages read so far.")
+                timed_out = True
+                return
+            yield from pages
+    finally:
+        # Only this extraction's batches are cancelled; one already handed to
+        # a worker cannot be, and keeps the pool from being reused.
+        for future in futures:
+            future.cancel()
+        _release_pool(pool, stuck=timed_out and not all(future.done() for future in futures))
+
+def iter_pdf_pages(source, max_pages: int = None, timeout: float = None):
+    """
+    Yields (page_number, text) for each page of a PDF, in page order.
+
+    source may be a file path, the raw bytes of the PDF, or a seekable
+    file-like object. Large documents are fanned out across a process pool.
+    At most max_pages pages are read, and extraction stops early (keeping
+    the pages read so far) once timeout seconds have passed. Pages are
+    extracted in worker processes, so that a page that takes too long can
+    be abandoned and its worker stopped.
+    """
+    max_pages = max_pages if max_pages is not None else _pdf_settings['max_pages']
+    timeout = timeout if timeout is not None else _pdf_settings['timeout']
+    deadline = time.monotonic() + timeout
+
+    # Files we open ourselves are closed here; caller-supplied streams are not.
+    owns_file = not hasattr(source, 'read')
+    import PyPDF2
+    pdf_file = _open_pdf(source)
+    try:
+        reader = PyPDF2.PdfReader(pdf_file)
+        page_count = len(reader.pages)
+        if max_pages and page_count > max_pages:
+            print(f"WARNING: PDF has {page_count} pages; only the first {max_pages} are used.")
+            page_count = max_pages
+
+        if _pdf_settings['workers'] <= 0:
+            yield from _iter_pages_serial(reader, page_count, deadline)
+            return
+
+        if not isinstance(source, str):
+            # File objects cannot be sent to worker processes; their bytes can.
+            pdf_file.seek(0)
+            source = pdf_file.read()
+    finally:
+        if owns_file:
+            pdf_file.close()
+
+    yield from _iter_pages_pooled(source, page_count, deadline)
+
+def _extract_text_from_pdf(source, name: str) -> str:
+    print(f"Reading PDF file: {name}")
     text = []
     try:
-        with open(file_path, 'rb') as pdf_file:
-            reader = PyPDF2.PdfReader(pdf_file)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text.append(page_text)
+        for _, page_text in iter_pdf_pages(source):
+            telemetry.inc('lab_report_pdf_pages_total')
+            # Empty pages are kept so that later pages keep their numbers.
+            text.append(page_text)
     except Exception as e:
-        print(f"Error reading PDF {file_path}: {e}")
+        print(f"Error reading PDF {name}: {e}")
+        telemetry.mark_error()
+        return ""
+    if not any(text):
         return ""
-    return "\n".join(text)
+    return ("\n" + PAGE_BREAK).join(text)
 
-def _extract_text_from_docx(file_path: str) -> str:
-    print(f"Reading DOCX file: {file_path}")
+def _extract_text_from_docx(source, name: str) -> str:
+    print(f"Reading DOCX file: {name}")
     try:
-        doc = docx.Document(file_path)
+        import docx
+        doc = docx.Document(source)
         return "\n".join([paragraph.text for paragraph in doc.paragraphs])
     except Exception as e:
-        print(f"Error reading DOCX {file_path}: {e}")
+        print(f"Error reading DOCX {name}: {e}")
+        telemetry.mark_error()
         return ""
 
-def _extract_text_from_txt(file_path: str) -> str:
-    print(f"Reading TXT file: {file_path}")
+def _extract_text_from_txt(source, name: str) -> str:
+    print(f"Reading TXT file: {name}")
     try:
-        with open(file_path, 'r', encoding='utf-8') as txt_file:
-            return txt_file.read()
+        if isinstance(source, str):
+            with open(source, 'r', encoding='utf-8') as txt_file:
+                return txt_file.read()
+        return source.read().decode('utf-8')
     except Exception as e:
-        print(f"Error reading TXT {file_path}: {e}")
+        print(f"Error reading TXT {name}: {e}")
+        telemetry.mark_error()
         return ""
 
-def extract_text_from_file(file_path: str) -> str:
-    _, file_extension = os.path.splitext(file_path)
+def extract_text_from_file(source, filename: str = None) -> str:
+    """
+    Extracts the text of a PDF, DOCX or TXT document.
+
+    source may be a file path, the raw bytes of the document, or a file-like
+    object such as an upload stream; for the latter two, filename supplies
+    the extension that decides how the document is parsed.
+    """
+    with telemetry.span('extract'):
+        return _extract_text(source, filename)
+
+def _extract_text(source, filename: str = None) -> str:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif not isinstance(source, str):
+        source.seek(0)
+
+    name = filename or (source if isinstance(source, str) else getattr(source, 'name', ''))
+    _, file_extension = os.path.splitext(str(name))
     file_extension = file_extension.lower()
 
     if file_extension == '.pdf':
-        return _extract_text_from_pdf(file_path)
+        return _extract_text_from_pdf(source, name)
     elif file_extension == '.docx':
-        return _extract_text_from_docx(file_path)
+        return _extract_text_from_docx(source, name)
     elif file_extension == '.txt':
-        return _extract_text_from_txt(file_path)
+        return _extract_text_from_txt(source, name)
     else:
         # If the format is unsupported, raise an error
-        raise ValueError(f"Unsupported file format: '{file_extension}'")
\ No newline at end of file
+        raise ValueError(f"Unsupported file format: '{file_extension}'")
+
+def init_app(app):
+    for key, config_key in (('workers', 'PDF_EXTRACT_WORKERS'),
+                            ('parallel_min_pages', 'PDF_PARALLEL_MIN_PAGES'),
+                            ('max_pages', 'PDF_MAX_PAGES'),
+                            ('timeout', 'PDF_EXTRACT_TIMEOUT')):
+        if app.config.get(config_key) is not None:
+            _pdf_settings[key] = app.config[config_key]
+    _discard_pool()
+    # Registered now, before the fork server is started.
+    worker_processes.get_context(PRELOAD_MODULES)
\ No newline at end of file
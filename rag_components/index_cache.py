@@ -0,0 +1,190 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+# faiss and LangChain's FAISS wrapper are imported where they are used, so
+# that loading this module stays cheap.
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+# File names used by FAISS.save_local() inside each cache entry.
+INDEX_NAME = "index"
+
+def _mmap_flags() -> int:
+    # Memory-map the flat vector codes instead of copying them onto the heap.
+    # Older FAISS builds only know the generic mmap flag.
+    import faiss
+    return getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+def make_key(document_text: str, splitter_settings: dict, embedding_settings: dict) -> str:
+    # The key covers everything that changes the resulting index: the text
+    # itself plus how it is chunked and which model embeds it.
+    digest = hashlib.sha256()
+    digest.update(json.dumps(splitter_settings, sort_keys=True).encode('utf-8'))
+    digest.update(json.dumps(embedding_settings, sort_keys=True).encode('utf-8'))
+    digest.update(document_text.encode('utf-8'))
+    return digest.hexdigest()
+
+def load_index(directory: str, embeddings) -> "FAISS":
+    # Loads an index written by FAISS.save_local(directory, INDEX_NAME),
+    # memory-mapping the vectors. Raises if the files are missing or broken.
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    index = faiss.read_index(os.path.join(directory, f"{INDEX_NAME}.faiss"), _mmap_flags())
+    with open(os.path.join(directory, f"{INDEX_NAME}.pkl"), 'rb') as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+class IndexCache:
+    """
+    Two-tier cache of FAISS indexes keyed by content hash.
+
+    Recently used indexes are kept in memory; every index is also saved to
+    disk under cache_dir and memory-mapped when loaded back. The disk tier
+    is bounded by max_bytes and evicts the least recently used entries.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, memory_entries: int = 16):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _remember(self, key: str, store: "FAISS"):
+        self._memory[key] = store
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str, embeddings) -> "FAISS":
+        with self._lock:
+            store = self._memory.get(key)
+            if store is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return store
+
+        entry_dir = self._entry_dir(key)
+        index_path = os.path.join(entry_dir, f"{INDEX_NAME}.faiss")
+        if not os.path.exists(index_path):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            store = load_index(entry_dir, embeddings)
+            # Touch the entry so LRU eviction sees it as recently used.
+            os.utime(entry_dir)
+        except Exception as e:
+            print(f"WARNING: Discarding unreadable index cache entry {key}: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self._remember(key, store)
+            self.disk_hits += 1
+        return store
+
+    def put(self, key: str, store: "FAISS"):
+        with self._lock:
+            self._remember(key, store)
+
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        # Write into a temporary directory first and rename it into place, so
+        # a concurrent reader never sees a half-written entry.
+        tmp_dir = tempfile.mkdtemp(prefix=f".{key}.", dir=self.cache_dir)
+        try:
+            store.save_local(tmp_dir, index_name=INDEX_NAME)
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # Another request stored the same entry first.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_dir() and not entry.name.startswith('.'):
+                entries.append((entry.stat().st_mtime, _dir_size(entry.path), entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        # Oldest access time first.
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            print(f"Evicted index cache entry: {os.path.basename(path)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'memory_hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+            }
+
+# --- Process-wide cache instance ---
+
+_cache = None
+_enabled = True
+_settings = {
+    'cache_dir': os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'indexes'),
+    'max_bytes': 512 * 1024 * 1024,
+    'memory_entries': 16,
+}
+_init_lock = threading.Lock()
+
+def get_cache() -> IndexCache:
+    global _cache
+    if not _enabled:
+        return None
+    if _cache is None:
+        with _init_lock:
+            if _cache is None:
+                _cache = IndexCache(**_settings)
+    return _cache
+
+def init_app(app):
+    global _cache, _enabled
+    with _init_lock:
+        _enabled = app.config.get('INDEX_CACHE_ENABLED', True)
+        for key, config_key in (('cache_dir', 'INDEX_CACHE_DIR'),
+                                ('max_bytes', 'INDEX_CACHE_MAX_BYTES'),
+                                ('memory_entries', 'INDEX_CACHE_MEMORY_ENTRIES')):
+            if app.config.get(config_key) is not None:
+                _settings[key] = app.config[config_key]
+        _cache = None
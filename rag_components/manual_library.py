@@ -0,0 +1,261 @@
+import os
+import re
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import contextlib
+from collections import OrderedDict
+
+from . import extractor, index_cache, vector_store
+from .embeddings import get_embeddings
+
+MANUAL_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+TEXT_FILE = "text.txt"
+INDEX_DIR = "index"
+
+def manual_id_for(data: bytes) -> str:
+    # Derived from the file contents, so uploading the same manual twice
+    # returns the same id instead of storing it again.
+    return hashlib.sha256(data).hexdigest()[:32]
+
+def is_valid_id(manual_id: str) -> bool:
+    return isinstance(manual_id, str) and bool(MANUAL_ID_PATTERN.match(manual_id))
+
+class ManualLibrary:
+    """
+    Durable registry of uploaded lab manuals.
+
+    Each manual is extracted and indexed once, when it is added. Its text
+    and FAISS index (which holds the chunks) are kept under
+    library_dir/<manual_id>/, and its metadata in a SQLite database. Unlike
+    the index cache, entries are never evicted; they stay until deleted.
+    Recently used manuals are also kept loaded in memory.
+    """
+
+    def __init__(self, library_dir: str, memory_entries: int = 16):
+        self.library_dir = library_dir
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._locks = {} # manual_id -> [lock, number of callers holding or waiting for it]
+        self._local = threading.local()
+        os.makedirs(self.library_dir, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS manuals ("
+            "manual_id TEXT PRIMARY KEY, filename TEXT NOT NULL, characters INTEGER NOT NULL, "
+            "chunks INTEGER NOT NULL, embedding TEXT NOT NULL, created_at REAL NOT NULL, "
+            "last_used_at REAL NOT NULL, uses INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so each
+        # thread keeps its own.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.library_dir, 'manuals.sqlite'), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _entry_dir(self, manual_id: str) -> str:
+        return os.path.join(self.library_dir, manual_id)
+
+    def _save_index(self, manual_id: str, store):
+        # Written next to the entry and renamed into place, so a reader never
+        # sees a half-written index.
+        index_dir = os.path.join(self._entry_dir(manual_id), INDEX_DIR)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{INDEX_DIR}.", dir=self._entry_dir(manual_id))
+        store.save_local(tmp_dir, index_name=index_cache.INDEX_NAME)
+        shutil.rmtree(index_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, index_dir)
+        except OSError:
+            # Another process stored the same manual's index in between;
+            # both were built from the same text, so keep theirs.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(index_dir):
+                raise
+
+    @contextlib.contextmanager
+    def _entry_lock(self, manual_id: str):
+        # Serializes add(), loading from disk and delete() for one manual, so
+        # that concurrent uploads of the same file index it once and no one
+        # reads or rebuilds an entry while it is deleted. The lock is dropped
+        # once nobody holds it.
+        with self._lock:
+            entry = self._locks.setdefault(manual_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[manual_id]
+
+    def add(self, data: bytes, filename: str) -> tuple:
+        """
+        Extracts and indexes a manual and stores it. Returns (metadata,
+        created); created is False if the same file was already stored.
+        """
+        manual_id = manual_id_for(data)
+        with self._entry_lock(manual_id):
+            existing = self.get(manual_id)
+            if existing is not None:
+                return existing, False
+            return self._add(manual_id, data, filename), True
+
+    def _add(self, manual_id: str, data: bytes, filename: str) -> dict:
+        document_text = extractor.extract_text_from_file(data, filename=filename)
+        if not document_text.strip():
+            raise ValueError("No text could be extracted from the manual.")
+        store = vector_store.build_vector_store(document_text)
+        if store is None:
+            raise ValueError("The manual produced no text chunks to index.")
+
+        entry_dir = self._entry_dir(manual_id)
+        os.makedirs(entry_dir, exist_ok=True)
+        with open(os.path.join(entry_dir, TEXT_FILE), 'w', encoding='utf-8') as f:
+            f.write(document_text)
+        self._save_index(manual_id, store)
+
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO manuals (manual_id, filename, characters, chunks, embedding, created_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (manual_id, filename, len(document_text), store.index.ntotal, vector_store.index_id(), now, now),
+        )
+        with self._lock:
+            self._remember(manual_id, (document_text, store))
+        print(f"Stored manual {manual_id} ({filename}): {len(document_text)} characters, {store.index.ntotal} chunks.")
+        return self.get(manual_id)
+
+    def get(self, manual_id: str) -> dict:
+        # Metadata of a stored manual, or None.
+        if not is_valid_id(manual_id):
+            return None
+        row = self._connect().execute(
+            "SELECT manual_id, filename, characters, chunks, created_at, last_used_at, uses FROM manuals WHERE manual_id = ?",
+            (manual_id,),
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self) -> list:
+        rows = self._connect().execute(
+            "SELECT manual_id, filename, characters, chunks, created_at, last_used_at, uses FROM manuals "
+            "ORDER BY last_used_at DESC"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _remember(self, manual_id: str, entry: tuple):
+        self._memory[manual_id] = entry
+        self._memory.move_to_end(manual_id)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def load(self, manual_id: str) -> tuple:
+        """
+        Returns (document_text, FAISS store) of a stored manual, or None if
+        there is no such manual.
+        """
+        if not is_valid_id(manual_id):
+            return None
+        row = self._connect().execute(
+            "SELECT embedding FROM manuals WHERE manual_id = ?", (manual_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._connect().execute(
+            "UPDATE manuals SET uses = uses + 1, last_used_at = ? WHERE manual_id = ?", (time.time(), manual_id)
+        )
+
+        with self._lock:
+            entry = self._memory.get(manual_id)
+            if entry is not None and row['embedding'] == vector_store.index_id():
+                self._memory.move_to_end(manual_id)
+                return entry
+
+        # Loading from disk (and re-indexing) is serialized with add() and
+        # delete() of the same manual.
+        with self._entry_lock(manual_id):
+            row = self._connect().execute(
+                "SELECT embedding FROM manuals WHERE manual_id = ?", (manual_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            with self._lock:
+                # Another request may have loaded it while we waited.
+                entry = self._memory.get(manual_id)
+                if entry is not None and row['embedding'] == vector_store.index_id():
+                    return entry
+
+            entry_dir = self._entry_dir(manual_id)
+            try:
+                with open(os.path.join(entry_dir, TEXT_FILE), 'r', encoding='utf-8') as f:
+                    document_text = f.read()
+            except FileNotFoundError:
+                return None
+
+            if row['embedding'] == vector_store.index_id():
+                store = index_cache.load_index(os.path.join(entry_dir, INDEX_DIR), get_embeddings())
+            else:
+                # Indexed with another embedding model or splitter: re-index the
+                # stored text (no re-extraction needed) and keep the new index.
+                print(f"Re-indexing manual {manual_id} for {vector_store.index_id()}...")
+                store = vector_store.build_vector_store(document_text)
+                self._save_index(manual_id, store)
+                self._connect().execute(
+                    "UPDATE manuals SET embedding = ?, chunks = ? WHERE manual_id = ?",
+                    (vector_store.index_id(), store.index.ntotal, manual_id),
+                )
+
+            with self._lock:
+                self._remember(manual_id, (document_text, store))
+        return document_text, store
+
+    def delete(self, manual_id: str) -> bool:
+        if not is_valid_id(manual_id):
+            return False
+        with self._entry_lock(manual_id):
+            if self.get(manual_id) is None:
+                return False
+            self._connect().execute("DELETE FROM manuals WHERE manual_id = ?", (manual_id,))
+            with self._lock:
+                self._memory.pop(manual_id, None)
+            shutil.rmtree(self._entry_dir(manual_id), ignore_errors=True)
+        return True
+
+# --- Process-wide library instance ---
+
+_library = None
+_enabled = True
+_settings = {
+    'library_dir': os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'manuals'),
+    'memory_entries': 16,
+}
+_init_lock = threading.Lock()
+
+def get_library() -> ManualLibrary:
+    global _library
+    if not _enabled:
+        return None
+    if _library is None:
+        with _init_lock:
+            if _library is None:
+                _library = ManualLibrary(**_settings)
+    return _library
+
+def init_app(app):
+    global _library, _enabled
+    with _init_lock:
+        _enabled = app.config.get('MANUAL_LIBRARY_ENABLED', True)
+        for key, config_key in (('library_dir', 'MANUAL_LIBRARY_DIR'),
+                                ('memory_entries', 'MANUAL_LIBRARY_MEMORY_ENTRIES')):
+            if app.config.get(config_key) is not None:
+                _settings[key] = app.config[config_key]
+        _library = None
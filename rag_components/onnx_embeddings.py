@@ -0,0 +1,213 @@
+"""
+ONNX Runtime embedding backend (EMBEDDING_BACKEND=onnx).
+
+The sentence-transformers model is exported to ONNX once, and optionally
+int8-quantized, into a directory under EMBEDDING_ONNX_DIR. After that, each
+process only loads ONNX Runtime and the fast tokenizer. PyTorch is needed
+for the export, not for embedding.
+
+Chunks are embedded in dynamic batches: texts are sorted by length and
+grouped so that each batch holds at most `batch_tokens` padded tokens.
+Short chunks therefore share large batches, and long chunks do not pad
+short ones out to their length.
+"""
+import os
+import re
+import json
+import shutil
+import inspect
+import tempfile
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+POOLING_FILE = "pooling.json"
+
+def export_dir(root: str, model_name: str) -> str:
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+def export_model(model_name: str, output_dir: str):
+    """
+    Exports the transformer of a sentence-transformers model to
+    output_dir/model.onnx, with its tokenizer and pooling settings.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    print(f"Exporting embedding model '{model_name}' to ONNX in {output_dir}...")
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0]
+    pooling = next((module for module in model if hasattr(module, 'pooling_mode_mean_tokens')), None)
+    normalize = any(type(module).__name__ == 'Normalize' for module in model)
+
+    # Example batch with padding, so the traced graph handles attention masks.
+    tokenizer = transformer.tokenizer
+    example = tokenizer(["an example sentence to trace", "short"], padding=True, return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in example]
+
+    # Export the plain attention ops rather than the SDPA kernel: ONNX
+    # Runtime runs (and quantizes) the traced SDPA graph noticeably slower.
+    auto_model = transformer.auto_model.eval()
+    if hasattr(auto_model, 'set_attn_implementation'):
+        auto_model.set_attn_implementation('eager')
+    else:
+        auto_model.config._attn_implementation = 'eager'
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    os.makedirs(output_dir, exist_ok=True)
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False # The TorchScript exporter needs no extra packages
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(auto_model),
+            tuple(example[name] for name in input_names),
+            os.path.join(output_dir, MODEL_FILE),
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']},
+            opset_version=17,
+            **kwargs,
+        )
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, POOLING_FILE), 'w') as f:
+        json.dump({
+            'mode': 'cls' if pooling is not None and pooling.pooling_mode_cls_token else 'mean',
+            'normalize': normalize,
+            'max_seq_length': transformer.max_seq_length,
+        }, f)
+
+def quantize_model(output_dir: str):
+    # Dynamic int8 quantization of the weights of the exported model.
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    print(f"Quantizing ONNX embedding model in {output_dir} to int8...")
+    quantize_dynamic(
+        os.path.join(output_dir, MODEL_FILE),
+        os.path.join(output_dir, QUANTIZED_MODEL_FILE),
+        weight_type=QuantType.QInt8,
+    )
+
+def ensure_exported(model_name: str, root: str, quantize: bool) -> str:
+    # Returns the path of the model file, exporting it on first use. Exports
+    # are built in a temporary directory and renamed into place, so workers
+    # starting at the same time never load a half-written model.
+    output_dir = export_dir(root, model_name)
+    if not os.path.exists(output_dir):
+        os.makedirs(root, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix='.export-', dir=root)
+        try:
+            export_model(model_name, staging_dir)
+            if quantize:
+                quantize_model(staging_dir)
+            os.rename(staging_dir, output_dir)
+        except OSError:
+            if not os.path.exists(output_dir):
+                raise
+            # Another process finished the export first.
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    if not quantize:
+        return os.path.join(output_dir, MODEL_FILE)
+    quantized_path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+    if not os.path.exists(quantized_path):
+        staging_dir = tempfile.mkdtemp(prefix='.quantize-', dir=root)
+        try:
+            shutil.copy(os.path.join(output_dir, MODEL_FILE), staging_dir)
+            quantize_model(staging_dir)
+            os.replace(os.path.join(staging_dir, QUANTIZED_MODEL_FILE), quantized_path)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    return quantized_path
+
+class OnnxEmbeddings(Embeddings):
+    """
+    LangChain Embeddings that run a sentence-transformers model exported to
+    ONNX. Produces the same vectors as HuggingFaceEmbeddings (to float
+    precision for the fp32 model).
+    """
+
+    def __init__(self, model_path: str, threads: int = 0, batch_size: int = 32, batch_tokens: int = 8192):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = os.path.dirname(model_path)
+        with open(os.path.join(model_dir, POOLING_FILE), 'r') as f:
+            self.pooling = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads # 0 = one per physical core
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.pooling['max_seq_length'])
+        self.tokenizer.no_padding() # Batches are padded by _run_batch
+
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+
+    def _batches(self, encodings: list) -> list:
+        # Groups indices of similar length, so each batch pads little and
+        # stays within batch_tokens padded tokens.
+        order = sorted(range(len(encodings)), key=lambda i: len(encodings[i].ids))
+        batches, batch = [], []
+        for i in order:
+            longest = len(encodings[i].ids) # Sorted, so the newest is the longest
+            if batch and (len(batch) >= self.batch_size or (len(batch) + 1) * longest > self.batch_tokens):
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _run_batch(self, encodings: list) -> np.ndarray:
+        length = max(len(encoding.ids) for encoding in encodings)
+        arrays = {name: np.zeros((len(encodings), length), dtype=np.int64) for name in self.input_names}
+        for row, encoding in enumerate(encodings):
+            n = len(encoding.ids)
+            arrays['input_ids'][row, :n] = encoding.ids
+            arrays['attention_mask'][row, :n] = encoding.attention_mask
+            if 'token_type_ids' in arrays:
+                arrays['token_type_ids'][row, :n] = encoding.type_ids
+
+        hidden = self.session.run(None, arrays)[0]
+        if self.pooling['mode'] == 'cls':
+            vectors = hidden[:, 0]
+        else:
+            mask = arrays['attention_mask'][:, :, None].astype(np.float32)
+            vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.pooling['normalize']:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
+
+    def embed_array(self, texts: list) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(list(texts))
+        vectors = None
+        for batch in self._batches(encodings):
+            batch_vectors = self._run_batch([encodings[i] for i in batch])
+            if vectors is None:
+                vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+            vectors[batch] = batch_vectors
+        return vectors
+
+    def embed_documents(self, texts: list) -> list:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_array([text])[0].tolist()
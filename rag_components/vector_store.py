@@ -1,35 +1,179 @@
-# LangChain components for text splitting, embeddings, and vector storage
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
 
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+import numpy as np
 
-def get_relevant_context(document_text: str, query: str, k: int = 5) -> str:
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, # Max size of each chunk
-        chunk_overlap=150, # Overlap helps maintain context between chunks
-        length_function=len
-    )
-    chunks = text_splitter.split_text(document_text)
+import telemetry
+
+from . import chunker, embedding_cache, index_cache
+from .embeddings import embedding_id, get_embeddings
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+CHUNK_SIZE = 1000 # Max size of each chunk
+CHUNK_OVERLAP = 150 # Overlap helps maintain context between chunks
+
+# Changes whenever chunks or their metadata are built differently, so that
+# indexes built the old way are not reused.
+SPLITTER_ID = "offsets-v1"
+
+def index_id() -> str:
+    # Identifies how an index is built: the embedding model and the splitter.
+    return f"{embedding_id()}|{SPLITTER_ID}"
+
+def build_vector_store(document_text: str) -> "FAISS":
+    # The embedding model is shared by the whole process and only loaded once.
+    embeddings = get_embeddings()
+
+    cache = index_cache.get_cache()
+    key = None
+    if cache is not None:
+        key = index_cache.make_key(
+            document_text,
+            splitter_settings={'chunk_size': CHUNK_SIZE, 'chunk_overlap': CHUNK_OVERLAP, 'splitter': SPLITTER_ID},
+            embedding_settings={'model_name': embedding_id()},
+        )
+        vector_store = cache.get(key, embeddings)
+        if vector_store is not None:
+            print("Reusing cached FAISS vector store for this manual.")
+            return vector_store
+
+    # LangChain's FAISS wrapper is imported on first use; cached indexes
+    # never need it.
+    from langchain_community.vectorstores import FAISS
+
+    # Each chunk records its offsets, pages and section heading.
+    chunks, metadatas = chunker.split_documents(document_text, CHUNK_SIZE, CHUNK_OVERLAP)
 
     if not chunks:
         print("Warning: Text splitting resulted in no chunks.")
-        return ""
-
-    print(f"Loading embedding model '{EMBEDDING_MODEL_NAME}'...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL_NAME,
-        model_kwargs={'device': 'cpu'} 
-    )
+        return None
 
     print("Creating FAISS vector store from text chunks...")
-    vector_store = FAISS.from_texts(texts=chunks, embedding=embeddings)
-
-    print(f"Searching for context relevant to: '{query}'...")
-    retriever = vector_store.as_retriever(search_kwargs={'k': k})
-    retrieved_docs = retriever.invoke(query)
-    
-    context = "\n\n---\n\n".join([doc.page_content for doc in retrieved_docs])
-    
-    return context
\ No newline at end of file
+    with telemetry.span('embed'):
+        chunk_cache = embedding_cache.get_cache(embedding_id())
+        if chunk_cache is not None:
+            # Reuse vectors of chunks seen in earlier revisions of the manual and
+            # only run the new ones through the embedding model.
+            vectors = chunk_cache.embed_documents(chunks, embeddings)
+            vector_store = FAISS.from_embeddings(text_embeddings=list(zip(chunks, vectors)), embedding=embeddings,
+                                                 metadatas=metadatas)
+        else:
+            vector_store = FAISS.from_texts(texts=chunks, embedding=embeddings, metadatas=metadatas)
+
+    if cache is not None:
+        cache.put(key, vector_store)
+
+    return vector_store
+
+# Query vectors by (embedding model, query), least recently used first. The
+# section queries are fixed, so after the first request retrieval needs no
+# embedding calls at all; other callers' queries are evicted past the bound.
+QUERY_CACHE_ENTRIES = 256
+_query_vectors = OrderedDict()
+_query_lock = threading.Lock()
+
+def _embed_queries(queries: list) -> np.ndarray:
+    model_name = embedding_id()
+    found = {}
+    with _query_lock:
+        for query in dict.fromkeys(queries):
+            vector = _query_vectors.get((model_name, query))
+            if vector is not None:
+                _query_vectors.move_to_end((model_name, query))
+                found[query] = vector
+    missing = [query for query in dict.fromkeys(queries) if query not in found]
+    if missing:
+        # All new queries go through the model in one batched forward pass.
+        vectors = get_embeddings().embed_documents(missing)
+        with _query_lock:
+            for query, vector in zip(missing, vectors):
+                found[query] = _query_vectors[(model_name, query)] = np.asarray(vector, dtype=np.float32)
+            while len(_query_vectors) > QUERY_CACHE_ENTRIES:
+                _query_vectors.popitem(last=False)
+    return np.stack([found[query] for query in queries])
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _select_mmr(relevance: np.ndarray, similarity: np.ndarray, k: int, quota: int, lambda_mult: float) -> list:
+    """
+    Picks k candidates by maximal marginal relevance.
+
+    relevance is a (queries, candidates) matrix of query-chunk similarities
+    and similarity a (candidates, candidates) matrix. Sections take turns
+    picking their best remaining candidate until each has `quota` picks;
+    the remaining slots go to the best candidates for any section.
+    """
+    n_queries, n_candidates = relevance.shape
+    k = min(k, n_candidates)
+    selected = []
+    available = np.ones(n_candidates, dtype=bool)
+    redundancy = np.zeros(n_candidates, dtype=np.float32) # Max similarity to a selected chunk
+
+    def pick(scores: np.ndarray):
+        scores = np.where(available, lambda_mult * scores - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+
+    for _ in range(quota):
+        for query in range(n_queries):
+            if len(selected) < k:
+                pick(relevance[query])
+    best_relevance = relevance.max(axis=0)
+    while len(selected) < k:
+        pick(best_relevance)
+    return selected
+
+def get_relevant_chunks(document_text: str, queries, k: int = 5, fetch_k: int = 20, lambda_mult: float = 0.5,
+                        store=None, with_metadata: bool = False) -> list:
+    """
+    Returns up to k chunks relevant to one query or a list of section
+    queries, most relevant first.
+
+    The queries are embedded in one batch and searched in one FAISS call
+    for fetch_k candidates each. The candidates are then merged with MMR.
+    Each section is guaranteed k // len(queries) chunks (at least one), so
+    that no section of the manual is crowded out by another.
+
+    Pass store to search an index that is already built (such as that of
+    a stored manual) instead of the one for document_text. With
+    with_metadata=True each chunk is returned as a dict of its 'text' and
+    the metadata from chunker.split_documents (offsets, pages, heading),
+    for citing the source pages.
+    """
+    if isinstance(queries, str):
+        queries = [queries]
+
+    with telemetry.span('retrieve'):
+        vector_store = store if store is not None else build_vector_store(document_text)
+        if vector_store is None:
+            return []
+
+        print(f"Searching for context relevant to {len(queries)} queries: {'; '.join(queries)}...")
+        query_vectors = _embed_queries(queries)
+        fetch_k = min(max(fetch_k, k), vector_store.index.ntotal)
+        _, ids = vector_store.index.search(query_vectors, fetch_k)
+
+        candidates = list(dict.fromkeys(int(i) for i in ids.ravel() if i != -1))
+        if not candidates:
+            return []
+        chunk_vectors = _normalize(np.stack([vector_store.index.reconstruct(i) for i in candidates]))
+        relevance = _normalize(query_vectors) @ chunk_vectors.T
+        similarity = chunk_vectors @ chunk_vectors.T
+
+        quota = max(1, k // len(queries))
+        picks = _select_mmr(relevance, similarity, k, quota, lambda_mult)
+
+    documents = [vector_store.docstore.search(vector_store.index_to_docstore_id[candidates[i]]) for i in picks]
+    if with_metadata:
+        return [dict(document.metadata, text=document.page_content) for document in documents]
+    return [document.page_content for document in documents]
+
+def get_relevant_context(document_text: str, queries, k: int = 5) -> str:
+    return "\n\n---\n\n".join(get_relevant_chunks(document_text, queries, k))
\ No newline at end of file
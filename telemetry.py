@@ -0,0 +1,243 @@
+"""
+Latency and usage metrics for the report pipeline.
+
+Stages are timed with span():
+
+    with telemetry.span('coder'):
+        code = generate_code(...)
+
+which records the duration in a histogram and counts the stage as an error
+if it raises (or if mark_error() is called inside it). Every thread records
+into its own shard, so recording never takes a lock; shards are only merged
+when /metrics is scraped. When a thread exits, its shard is folded into
+a retired aggregate, so the number of shards stays at the number of live
+threads.
+"""
+import time
+import bisect
+import weakref
+import threading
+import contextlib
+
+# Upper bounds (seconds) of the latency histogram buckets. LLM calls take
+# seconds to minutes, cache hits and exec take milliseconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# name: (type, help text, histogram buckets)
+METRICS = {
+    'lab_report_stage_duration_seconds': ('histogram', "Time spent in each pipeline stage.", LATENCY_BUCKETS),
+    'lab_report_stage_errors_total': ('counter', "Pipeline stages that failed.", None),
+    'lab_report_http_request_duration_seconds': ('histogram', "Time to produce an HTTP response (headers only for streamed responses).", LATENCY_BUCKETS),
+    'lab_report_http_requests_total': ('counter', "HTTP requests by endpoint and status code.", None),
+    'lab_report_llm_tokens': ('histogram', "Tokens per LLM call.", TOKEN_BUCKETS),
+    'lab_report_pdf_pages_total': ('counter', "PDF pages extracted.", None),
+    'lab_report_cache_requests_total': ('counter', "Cache lookups by cache and result.", None),
+}
+
+_enabled = True
+
+class _Shard:
+    # One thread's measurements. Only its own thread ever writes to it.
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+class _ThreadToken:
+    # Held only by a thread's local storage, so it is collected when the
+    # thread exits.
+    __slots__ = ('__weakref__',)
+
+_local = threading.local()
+_shards = []
+_retired = _Shard() # Measurements of threads that have exited
+_shards_lock = threading.Lock() # Taken when a thread's shard is created and retired
+
+def _shard() -> _Shard:
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        _local.token = _ThreadToken()
+        with _shards_lock:
+            _shards.append(shard)
+        weakref.finalize(_local.token, _retire, shard)
+    return shard
+
+def _retire(shard: _Shard):
+    # The owning thread has exited, so nothing writes to the shard any more.
+    with _shards_lock:
+        _shards.remove(shard)
+        _fold(_retired.counters, _retired.histograms, shard)
+
+def _fold(counters: dict, histograms: dict, shard: _Shard):
+    # Adds a shard's measurements to counters and histograms. Keys are
+    # copied first: the owning thread may add keys while we read.
+    for key, value in list(shard.counters.items()):
+        counters[key] = counters.get(key, 0) + value
+    for key, (buckets, total, count) in list(shard.histograms.items()):
+        merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+        merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+        merged[1] += total
+        merged[2] += count
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def inc(name: str, value: float = 1, **labels):
+    if not _enabled:
+        return
+    counters = _shard().counters
+    key = (name, _labels(labels))
+    counters[key] = counters.get(key, 0) + value
+
+def observe(name: str, value: float, **labels):
+    if not _enabled:
+        return
+    histograms = _shard().histograms
+    key = (name, _labels(labels))
+    histogram = histograms.get(key)
+    if histogram is None:
+        # Bucket counts (the last one is +Inf), sum of values, count.
+        histogram = histograms[key] = [[0] * (len(METRICS[name][2]) + 1), 0.0, 0]
+    histogram[0][bisect.bisect_left(METRICS[name][2], value)] += 1
+    histogram[1] += value
+    histogram[2] += 1
+
+# --- Spans ---
+
+class _Span:
+    __slots__ = ('stage', 'failed')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.failed = False
+
+_active = threading.local()
+
+@contextlib.contextmanager
+def span(stage: str):
+    """Times the enclosed block as one occurrence of `stage`."""
+    if not _enabled:
+        yield
+        return
+    current = _Span(stage)
+    parent = getattr(_active, 'span', None)
+    _active.span = current
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        current.failed = True
+        raise
+    finally:
+        _active.span = parent
+        observe('lab_report_stage_duration_seconds', time.perf_counter() - start, stage=stage)
+        if current.failed:
+            inc('lab_report_stage_errors_total', stage=stage)
+
+def mark_error():
+    # For stages that report failures as return values instead of raising.
+    current = getattr(_active, 'span', None)
+    if current is not None:
+        current.failed = True
+
+# --- Exposition ---
+
+def _merge() -> tuple:
+    counters, histograms = {}, {}
+    with _shards_lock:
+        shards = list(_shards)
+        _fold(counters, histograms, _retired)
+    for shard in shards:
+        _fold(counters, histograms, shard)
+    return counters, histograms
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _cache_stats() -> list:
+    # (cache name, stats dict) for the caches that keep their own counters.
+    # Imported here so that this module stays free of application imports.
+    from models import code_cache, program_library, single_flight
+    from rag_components import index_cache
+
+    stats = []
+    for name, module, getter in (('code', code_cache, 'get_cache'),
+                                 ('program', program_library, 'get_library'),
+                                 ('index', index_cache, 'get_cache')):
+        instance = getattr(module, getter)()
+        if instance is not None:
+            stats.append((name, instance.stats()))
+    for group, group_stats in single_flight.stats().items():
+        stats.append((f"single_flight_{group}", group_stats))
+    return stats
+
+def render() -> str:
+    """Returns all metrics in the Prometheus text exposition format."""
+    counters, histograms = _merge()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_number(value)}")
+        else:
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    try:
+        cache_stats = _cache_stats()
+    except Exception as e:
+        print(f"WARNING: Could not collect cache statistics: {e}")
+        cache_stats = []
+    lines.append("# HELP lab_report_cache_stat Counters kept by the caches and request coalescing groups.")
+    lines.append("# TYPE lab_report_cache_stat gauge")
+    for cache, stats in cache_stats:
+        for stat, value in sorted(stats.items()):
+            lines.append(f"lab_report_cache_stat{_format_labels([('cache', cache), ('stat', stat)])} {_number(value)}")
+
+    return "\n".join(lines) + "\n"
+
+def is_enabled() -> bool:
+    return _enabled
+
+def init_app(app):
+    global _enabled
+    _enabled = app.config.get('METRICS_ENABLED', True)
+    if not _enabled:
+        return
+
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.telemetry_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('telemetry_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unknown'
+            observe('lab_report_http_request_duration_seconds', time.perf_counter() - start, endpoint=endpoint)
+            inc('lab_report_http_requests_total', endpoint=endpoint, status=response.status_code)
+        return response
@@ -0,0 +1,35 @@
+"""
+Start context for the app's worker processes.
+
+The sandbox, PDF extraction and ROUGE scoring pools never fork the web
+process itself, which is multi-threaded and may have torch, faiss or the
+local coder loaded. Their workers are forked from a fork server instead:
+a fresh interpreter that imports only the modules the pools ask to have
+preloaded. There is one fork server per process, shared by every pool,
+so each pool adds its modules here and they are preloaded together.
+Modules should be registered before the first worker starts (e.g. from
+init_app); ones added later are imported by each worker instead.
+
+Where fork servers are not available (Windows), workers are spawned.
+"""
+import threading
+import multiprocessing
+
+_preload = []
+_lock = threading.Lock()
+
+def get_context(preload: tuple = ()):
+    """
+    Returns the multiprocessing context to start workers with, after
+    adding preload (module names, imported in order) to the fork server's
+    preload list.
+    """
+    with _lock:
+        for name in preload:
+            if name not in _preload:
+                _preload.append(name)
+        if 'forkserver' not in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context('spawn')
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(list(_preload))
+        return context